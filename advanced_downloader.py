@@ -10,15 +10,136 @@ import time
 import random
 import requests
 import subprocess
+from contextlib import nullcontext
 from urllib.parse import urlparse, parse_qs
 import yt_dlp
+from yt_dlp.postprocessor import FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP
+from yt_dlp.postprocessor.common import PostProcessor
 from werkzeug.utils import secure_filename
 
+from ffmpeg_pipeline import mp4_compatible
+from transcode_executor import transcode_cost
+
+# Fields kept by slim_info; a full info dict (fragments, headers, captions) runs to megabytes
+INFO_FIELDS = ('id', 'title', 'duration', 'uploader', 'thumbnail', 'view_count', 'upload_date',
+               'track', 'artist', 'album')
+FORMAT_FIELDS = ('format_id', 'url', 'ext', 'protocol', 'vcodec', 'acodec', 'height', 'width',
+                 'fps', 'tbr', 'vbr', 'abr', 'asr', 'filesize', 'filesize_approx', 'format_note')
+
+# Unprocessed streams kept as reusable source components (see download_source)
+SOURCE_FORMATS = {
+    'audio_source': 'bestaudio[ext=m4a]/bestaudio[acodec!*=opus]/bestaudio/best',
+    'opus_source': 'bestaudio[acodec=opus]/bestaudio',
+}
+
+# Audio outputs -> stream selector. MP3 is always transcoded (each strategy
+# has its own selector); m4a and opus copy a native AAC/Opus stream as-is.
+AUDIO_FORMATS = {
+    'mp3': None,
+    'm4a': 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best',
+    'opus': 'bestaudio[acodec=opus]/bestaudio/best',
+}
+MP3_BITRATES = ('64', '96', '128', '160', '192', '224', '256', '320')
+
+# yt-dlp postprocessors (pp_key names) whose ffmpeg runs get the thread
+# budget. yt-dlp only reads postprocessor_args under '<pp>+ffmpeg_o',
+# 'ffmpeg' or 'default', so each one gets its own output-options key
+THREADED_POSTPROCESSORS = ('ExtractAudio', 'Merger', 'VideoConvertor', 'VideoRemuxer')
+
+# TranscodeExecutor lane of the yt-dlp postprocessors (pp_key names) that run
+# ffmpeg; Fixup* postprocessors are stream copies too. ExtractAudio is heavy
+# only for MP3, the other audio formats copy a matching stream
+POSTPROCESSOR_LANES = {
+    'ExtractAudio': 'heavy',
+    'VideoConvertor': 'heavy',
+    'Merger': 'light',
+    'VideoRemuxer': 'light',
+}
+
+
+def postprocessor_lane(pp):
+    """Executor lane for a yt-dlp postprocessor's ffmpeg run, None when it runs no ffmpeg"""
+    key = pp.pp_key()
+    if key == 'ExtractAudio' and pp.mapping != 'mp3':
+        return 'light'
+    if key.startswith('Fixup'):
+        return 'light'
+    return POSTPROCESSOR_LANES.get(key)
+
+
+class SlottedYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL whose local ffmpeg runs hold a TranscodeExecutor slot
+
+    Covers yt-dlp's own postprocessors (merge, audio extraction, fixups)
+    and clip downloads, which go through ffmpeg and re-encode the cut when
+    ``force_keyframes_at_cuts`` is set. MP4FastPathPP takes its own slot,
+    as its lane depends on whether it remuxes or re-encodes. Without an
+    executor this is a plain YoutubeDL.
+    """
+
+    def __init__(self, params=None, executor=None):
+        super().__init__(params)
+        self.executor = executor
+
+    def run_pp(self, pp, infodict):
+        lane = postprocessor_lane(pp) if self.executor else None
+        if not lane:
+            return super().run_pp(pp, infodict)
+        with self.executor.slot(lane, infodict.get('duration')):
+            return super().run_pp(pp, infodict)
+
+    def dl(self, name, info, subtitle=False, test=False):
+        clipped = info.get('section_start') is not None or info.get('section_end')
+        if not self.executor or not clipped or subtitle or test:
+            return super().dl(name, info, subtitle, test)
+        lane = 'heavy' if self.params.get('force_keyframes_at_cuts') else 'light'
+        with self.executor.slot(lane, info.get('duration')):
+            return super().dl(name, info, subtitle, test)
+
+
+class MP4FastPathPP(PostProcessor):
+    """Bring a download into MP4 with the least work
+
+    Nothing when yt-dlp already wrote an MP4, a stream-copy remux when the
+    codecs fit the container, and a full re-encode (what FFmpegVideoConvertor
+    always did for non-MP4 files) only when they don't or the copy fails.
+    Under SlottedYoutubeDL the remux holds a light executor slot and the
+    re-encode a heavy one.
+    """
+
+    def _slot(self, lane, info):
+        executor = getattr(self._downloader, 'executor', None)
+        if not executor:
+            return nullcontext()
+        duration = info.get('duration')
+        cost = transcode_cost(duration, height=info.get('height')) if lane == 'heavy' else None
+        return executor.slot(lane, duration, cost)
+
+    def run(self, info):
+        if info.get('ext', '').lower() == 'mp4':
+            return [], info
+        if mp4_compatible(info.get('vcodec'), info.get('acodec')):
+            try:
+                with self._slot('light', info):
+                    return FFmpegVideoRemuxerPP(self._downloader, 'mp4').run(info)
+            except yt_dlp.utils.PostProcessingError as e:
+                self.report_warning(f"Remux to mp4 failed ({e}), re-encoding instead")
+        with self._slot('heavy', info):
+            return FFmpegVideoConvertorPP(self._downloader, 'mp4').run(info)
+
+
 class AdvancedYouTubeDownloader:
     """Advanced YouTube downloader with multiple bypass strategies"""
     
-    def __init__(self):
-        self.supported_formats = ['mp3', 'mp4']
+    def __init__(self, thread_budget=None, ffmpeg_capabilities=None, executor=None):
+        # Callable giving the ffmpeg thread count for yt-dlp's postprocessors
+        # (TranscodeExecutor.thread_budget); None leaves ffmpeg's default
+        self.thread_budget = thread_budget
+        # TranscodeExecutor whose slots yt-dlp's ffmpeg runs hold (see SlottedYoutubeDL)
+        self.executor = executor
+        # ffmpeg_pipeline.probe_capabilities() result, to skip options the build lacks
+        self.ffmpeg_capabilities = ffmpeg_capabilities or {}
+        self.supported_formats = ['mp3', 'mp4', 'm4a', 'opus']
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -34,6 +155,66 @@ class AdvancedYouTubeDownloader:
         )
         return bool(youtube_regex.match(url))
     
+    def parse_clip_range(self, start, end, duration=None):
+        """Parse start/end ("90", "1:30", "01:02:03") into a (start, end) clip in seconds
+        
+        Returns (clip, error). clip is None when neither bound is given.
+        """
+        if not start and not end:
+            return None, None
+        
+        start_seconds = yt_dlp.utils.parse_duration(start) if start else 0
+        end_seconds = yt_dlp.utils.parse_duration(end) if end else duration
+        if start_seconds is None or (end and end_seconds is None):
+            return None, "start and end must be seconds or [hh:]mm:ss"
+        if end_seconds is None:
+            return None, "end is required when the video duration is unknown"
+        if duration:
+            end_seconds = min(end_seconds, duration)
+        if start_seconds < 0 or end_seconds <= start_seconds:
+            return None, "end must be after start and inside the video"
+        
+        return (start_seconds, end_seconds), None
+    
+    def parse_audio_quality(self, value):
+        """Parse audio_quality: an MP3 bitrate ("128".."320") or VBR level ("V0".."V9")
+        
+        Returns (quality, error). VBR levels come back as "0".."9", which is
+        what FFmpegExtractAudio and FFmpegPipeline take as ``-q:a``.
+        """
+        value = (value or '').strip().upper()
+        if not value:
+            return '', None
+        if re.fullmatch(r'V[0-9]', value):
+            return value[1], None
+        if value.rstrip('K') in MP3_BITRATES:
+            return value.rstrip('K'), None
+        return None, f"audio_quality must be one of {', '.join(MP3_BITRATES)} (kbps) or V0-V9 (VBR)"
+    
+    def cap_audio_quality(self, quality, source_abr):
+        """MP3 bitrate to encode at: ``quality`` capped at the source's bitrate
+        
+        The cap is the smallest standard bitrate at or above 95% of
+        ``source_abr`` (kbps), so a ~128 kbps AAC stream becomes a 128 kbps
+        MP3 rather than 320. VBR levels and unknown sources are left alone.
+        """
+        if not source_abr or not quality.isdigit() or int(quality) < 10:
+            return quality
+        cap = next((rate for rate in MP3_BITRATES if int(rate) >= 0.95 * source_abr), MP3_BITRATES[-1])
+        return str(min(int(quality), int(cap)))
+    
+    def source_audio_bitrate(self, info):
+        """Estimated kbps of the stream SOURCE_FORMATS['audio_source'] picks from (slim) info"""
+        audio = [fmt for fmt in (info or {}).get('formats', [])
+                 if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+        # bestaudio[ext=m4a] / bestaudio[acodec!*=opus] / bestaudio
+        for wanted in (lambda fmt: fmt.get('ext') == 'm4a', lambda fmt: 'opus' not in fmt['acodec'], lambda fmt: True):
+            matches = [fmt for fmt in audio if wanted(fmt)]
+            if matches:
+                best = max(matches, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+                return best.get('abr') or best.get('tbr')
+        return None
+    
     def extract_video_id(self, url):
         """Extract video ID from YouTube URL"""
         if 'youtu.be/' in url:
@@ -44,9 +225,9 @@ class AdvancedYouTubeDownloader:
                 return parse_qs(parsed_url.query)['v'][0]
         return None
     
-    def get_base_options(self):
+    def get_base_options(self, progress=None, clip=None, format_type=None):
         """Get base yt-dlp options with anti-detection and quality optimization"""
-        return {
+        options = {
             'quiet': False,
             'no_warnings': False,
             'extract_flat': False,
@@ -93,8 +274,59 @@ class AdvancedYouTubeDownloader:
                 'DNT': '1'
             }
         }
+        
+        # Live progress reporting (see progress_events.ProgressReporter)
+        if progress:
+            options['progress_hooks'] = [progress.progress_hook]
+            options['postprocessor_hooks'] = [progress.postprocessor_hook]
+        
+        # Thread budget for the ffmpeg runs of yt-dlp's postprocessors (output options of every run)
+        if self.thread_budget:
+            threads = str(self.thread_budget())
+            args = ['-threads', threads]
+            if self.ffmpeg_capabilities.get('flags', {}).get('filter_threads', True):
+                args += ['-filter_threads', threads]
+            options['postprocessor_args'] = {f'{pp.lower()}+ffmpeg_o': args for pp in THREADED_POSTPROCESSORS}
+        
+        # Time-range clip: ffmpeg seeks into the media URL, so only the clip is fetched
+        if clip:
+            options['download_ranges'] = yt_dlp.utils.download_range_func(None, [clip])
+            # Precise video cuts re-encode just the clip; audio is re-encoded to MP3 anyway
+            options['force_keyframes_at_cuts'] = format_type == 'mp4'
+        
+        return options
+    
+    def get_source_options(self, format_type, output_path, format_id=None):
+        """Options for downloading a single source stream with no postprocessing"""
+        if format_type == 'video_source':
+            selector = format_id
+        else:
+            selector = SOURCE_FORMATS[format_type]
+        return {
+            'format': selector,
+            'outtmpl': os.path.join(output_path, f'%(title)s.{format_type}.%(ext)s'),
+            'postprocessors': [],
+        }
     
-    def try_with_different_strategies(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None):
+    def get_audio_options(self, format_type, output_path, audio_quality=None, mp3_selector='bestaudio/best'):
+        """Options for an audio-only download; FFmpegExtractAudio copies the stream when the codec already matches"""
+        postprocessor = {'key': 'FFmpegExtractAudio', 'preferredcodec': format_type}
+        if format_type == 'mp3':
+            postprocessor['preferredquality'] = audio_quality or '320'
+        return {
+            'format': AUDIO_FORMATS[format_type] or mp3_selector,
+            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
+            'postprocessors': [postprocessor],
+        }
+    
+    def create_ydl(self, options, format_type=None, download=False):
+        """SlottedYoutubeDL for ``options``; MP4 downloads end with MP4FastPathPP"""
+        ydl = SlottedYoutubeDL(options, self.executor)
+        if download and format_type == 'mp4':
+            ydl.add_post_processor(MP4FastPathPP(), when='post_process')
+        return ydl
+    
+    def try_with_different_strategies(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None, progress=None, clip=None):
         """Try different strategies to bypass YouTube restrictions"""
         
         strategies = [
@@ -108,7 +340,7 @@ class AdvancedYouTubeDownloader:
         for i, strategy in enumerate(strategies, 1):
             print(f"Trying strategy {i}/{len(strategies)}...")
             try:
-                result = strategy(url, download, output_path, format_type, resolution, format_id, audio_quality)
+                result = strategy(url, download, output_path, format_type, resolution, format_id, audio_quality, progress, clip)
                 if result:
                     print(f"✅ Strategy {i} successful!")
                     return result
@@ -118,23 +350,15 @@ class AdvancedYouTubeDownloader:
         
         return None
     
-    def _strategy_basic(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None):
+    def _strategy_basic(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None, progress=None, clip=None):
         """Basic strategy with standard options - Enhanced for maximum quality"""
-        options = self.get_base_options()
+        options = self.get_base_options(progress, clip, format_type)
         
         if download and output_path:
-            if format_type == 'mp3':
-                # Use high quality audio settings
-                audio_quality = audio_quality or '320'
-                options.update({
-                    'format': 'bestaudio[acodec!*=opus]/bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                    'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': audio_quality,
-                    }],
-                })
+            if format_type in SOURCE_FORMATS:
+                options.update(self.get_source_options(format_type, output_path, format_id))
+            elif format_type in AUDIO_FORMATS:
+                options.update(self.get_audio_options(format_type, output_path, audio_quality, 'bestaudio[acodec!*=opus]/bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'))
             else:  # mp4 - Enhanced for crystal clear quality
                 if format_id:
                     # Use specific format ID with best audio merge
@@ -142,10 +366,6 @@ class AdvancedYouTubeDownloader:
                         'format': f"{format_id}+bestaudio[acodec!*=opus]/best[format_id={format_id}]+bestaudio/best[format_id={format_id}]",
                         'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
                         'merge_output_format': 'mp4',
-                        'postprocessors': [{
-                            'key': 'FFmpegVideoConvertor',
-                            'preferedformat': 'mp4',
-                        }]
                     })
                 else:
                     # Enhanced resolution-based selection for maximum clarity
@@ -163,18 +383,14 @@ class AdvancedYouTubeDownloader:
                         'merge_output_format': 'mp4',
                         'writesubtitles': False,
                         'writeautomaticsub': False,
-                        'postprocessors': [{
-                            'key': 'FFmpegVideoConvertor',
-                            'preferedformat': 'mp4',
-                        }]
                     })
         
-        with yt_dlp.YoutubeDL(options) as ydl:
+        with self.create_ydl(options, format_type, download) as ydl:
             return ydl.extract_info(url, download=download)
     
-    def _strategy_with_cookies(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None):
+    def _strategy_with_cookies(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None, progress=None, clip=None):
         """Strategy using cookie simulation - Enhanced for maximum quality"""
-        options = self.get_base_options()
+        options = self.get_base_options(progress, clip, format_type)
         options.update({
             'cookiefile': None,
             'headers': {
@@ -184,27 +400,16 @@ class AdvancedYouTubeDownloader:
         })
         
         if download and output_path:
-            if format_type == 'mp3':
-                audio_quality = audio_quality or '320'
-                options.update({
-                    'format': 'bestaudio[acodec!*=opus]/bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                    'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': audio_quality,
-                    }],
-                })
+            if format_type in SOURCE_FORMATS:
+                options.update(self.get_source_options(format_type, output_path, format_id))
+            elif format_type in AUDIO_FORMATS:
+                options.update(self.get_audio_options(format_type, output_path, audio_quality, 'bestaudio[acodec!*=opus]/bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'))
             else:
                 if format_id:
                     options.update({
                         'format': f"{format_id}+bestaudio[acodec!*=opus]/best[format_id={format_id}]+bestaudio/best[format_id={format_id}]",
                         'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
                         'merge_output_format': 'mp4',
-                        'postprocessors': [{
-                            'key': 'FFmpegVideoConvertor',
-                            'preferedformat': 'mp4',
-                        }]
                     })
                 else:
                     if resolution:
@@ -217,18 +422,14 @@ class AdvancedYouTubeDownloader:
                         'format': format_selector,
                         'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
                         'merge_output_format': 'mp4',
-                        'postprocessors': [{
-                            'key': 'FFmpegVideoConvertor',
-                            'preferedformat': 'mp4',
-                        }]
                     })
         
-        with yt_dlp.YoutubeDL(options) as ydl:
+        with self.create_ydl(options, format_type, download) as ydl:
             return ydl.extract_info(url, download=download)
     
-    def _strategy_with_proxy_headers(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None):
+    def _strategy_with_proxy_headers(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None, progress=None, clip=None):
         """Strategy with additional proxy-like headers"""
-        options = self.get_base_options()
+        options = self.get_base_options(progress, clip, format_type)
         options.update({
             'headers': {
                 **options.get('headers', {}),
@@ -239,17 +440,10 @@ class AdvancedYouTubeDownloader:
         })
         
         if download and output_path:
-            if format_type == 'mp3':
-                audio_quality = audio_quality or '320'
-                options.update({
-                    'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                    'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': audio_quality,
-                    }],
-                })
+            if format_type in SOURCE_FORMATS:
+                options.update(self.get_source_options(format_type, output_path, format_id))
+            elif format_type in AUDIO_FORMATS:
+                options.update(self.get_audio_options(format_type, output_path, audio_quality, 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'))
             else:
                 if format_id:
                     options.update({
@@ -270,12 +464,12 @@ class AdvancedYouTubeDownloader:
                         'merge_output_format': 'mp4'
                     })
         
-        with yt_dlp.YoutubeDL(options) as ydl:
+        with self.create_ydl(options, format_type, download) as ydl:
             return ydl.extract_info(url, download=download)
     
-    def _strategy_alternative_extractor(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None):
+    def _strategy_alternative_extractor(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None, progress=None, clip=None):
         """Strategy using alternative extractors"""
-        options = self.get_base_options()
+        options = self.get_base_options(progress, clip, format_type)
         options.update({
             'force_generic_extractor': False,
             'youtube_include_dash_manifest': False,
@@ -283,17 +477,10 @@ class AdvancedYouTubeDownloader:
         })
         
         if download and output_path:
-            if format_type == 'mp3':
-                audio_quality = audio_quality or '320'
-                options.update({
-                    'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                    'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': audio_quality,
-                    }],
-                })
+            if format_type in SOURCE_FORMATS:
+                options.update(self.get_source_options(format_type, output_path, format_id))
+            elif format_type in AUDIO_FORMATS:
+                options.update(self.get_audio_options(format_type, output_path, audio_quality, 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'))
             else:
                 if format_id:
                     options.update({
@@ -314,12 +501,12 @@ class AdvancedYouTubeDownloader:
                         'merge_output_format': 'mp4'
                     })
         
-        with yt_dlp.YoutubeDL(options) as ydl:
+        with self.create_ydl(options, format_type, download) as ydl:
             return ydl.extract_info(url, download=download)
     
-    def _strategy_mobile_user_agent(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None):
+    def _strategy_mobile_user_agent(self, url, download=False, output_path=None, format_type='mp3', resolution=None, format_id=None, audio_quality=None, progress=None, clip=None):
         """Strategy using mobile user agent"""
-        options = self.get_base_options()
+        options = self.get_base_options(progress, clip, format_type)
         options.update({
             'user_agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/604.1',
             'headers': {
@@ -332,17 +519,10 @@ class AdvancedYouTubeDownloader:
         })
         
         if download and output_path:
-            if format_type == 'mp3':
-                audio_quality = audio_quality or '320'
-                options.update({
-                    'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                    'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': audio_quality,
-                    }],
-                })
+            if format_type in SOURCE_FORMATS:
+                options.update(self.get_source_options(format_type, output_path, format_id))
+            elif format_type in AUDIO_FORMATS:
+                options.update(self.get_audio_options(format_type, output_path, audio_quality, 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'))
             else:
                 if format_id:
                     options.update({
@@ -363,7 +543,7 @@ class AdvancedYouTubeDownloader:
                         'merge_output_format': 'mp4'
                     })
         
-        with yt_dlp.YoutubeDL(options) as ydl:
+        with self.create_ydl(options, format_type, download) as ydl:
             return ydl.extract_info(url, download=download)
     
     def get_video_info(self, url):
@@ -373,6 +553,21 @@ class AdvancedYouTubeDownloader:
         
         return self.try_with_different_strategies(url, download=False)
     
+    def slim_info(self, info):
+        """Reduce an info dict to the fields the download endpoints use
+        
+        Keeps per-request memory small while the download runs.
+        """
+        if not info:
+            return info
+        
+        slim = {key: info.get(key) for key in INFO_FIELDS}
+        slim['formats'] = [
+            {key: fmt.get(key) for key in FORMAT_FIELDS if key in fmt}
+            for fmt in info.get('formats', [])
+        ]
+        return slim
+    
     def get_available_formats(self, url):
         """Get detailed information about available formats"""
         if not self.validate_youtube_url(url):
@@ -462,33 +657,90 @@ class AdvancedYouTubeDownloader:
             print(f"Error getting available formats: {e}")
             return None
     
-    def download_audio(self, url, output_path, quality=None):
-        """Download audio using multiple strategies with specified quality"""
+    def download_audio(self, url, output_path, quality=None, progress=None, clip=None, format_type='mp3'):
+        """Download audio (mp3, m4a or opus) using multiple strategies with specified quality"""
         if not self.validate_youtube_url(url):
             return None, None
         
         try:
-            info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type='mp3', audio_quality=quality)
+            info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type=format_type, audio_quality=quality, progress=progress, clip=clip)
             if info:
                 title = info.get('title', 'audio')
                 safe_title = secure_filename(title)
                 
-                # Find downloaded MP3 file
-                for file in os.listdir(output_path):
-                    if file.endswith('.mp3'):
-                        actual_file = os.path.join(output_path, file)
-                        expected_file = os.path.join(output_path, f"{safe_title}.mp3")
-                        if actual_file != expected_file:
-                            os.rename(actual_file, expected_file)
-                        return expected_file, safe_title
-                        
-                return None, None
+                file_path = self.downloaded_file(info, output_path, safe_title, format_type)
+                return (file_path, safe_title) if file_path else (None, None)
             return None, None
         except Exception as e:
             print(f"Error downloading audio: {e}")
             return None, None
     
-    def download_video(self, url, output_path, resolution=None, format_id=None):
+    def downloaded_file(self, info, output_path, safe_title, ext):
+        """Final path of a finished download, renamed to ``<safe_title>.<ext>``
+        
+        yt-dlp reports the post-processed path in ``requested_downloads``,
+        so the output directory never has to be scanned.
+        """
+        downloads = info.get('requested_downloads') or [{}]
+        actual_file = downloads[-1].get('filepath')
+        if not actual_file or not actual_file.endswith(f'.{ext}') or not os.path.exists(actual_file):
+            return None
+        
+        expected_file = os.path.join(output_path, f"{safe_title}.{ext}")
+        if actual_file != expected_file:
+            os.rename(actual_file, expected_file)
+        return expected_file
+    
+    def download_thumbnail(self, info, output_path):
+        """Fetch the video's thumbnail into output_path for cover art; returns the file path or None"""
+        thumbnail = info.get('thumbnail') or (f"https://i.ytimg.com/vi/{info['id']}/hqdefault.jpg" if info.get('id') else None)
+        if not thumbnail:
+            return None
+        try:
+            response = requests.get(thumbnail, headers={'User-Agent': random.choice(self.user_agents)}, timeout=15)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Error downloading thumbnail: {e}")
+            return None
+        
+        ext = 'webp' if 'webp' in response.headers.get('Content-Type', '') else 'jpg'
+        file_path = os.path.join(output_path, f"thumbnail.{ext}")
+        with open(file_path, 'wb') as f:
+            f.write(response.content)
+        return file_path
+    
+    def download_source(self, url, output_path, format_type='audio_source', format_id=None, progress=None):
+        """Download one unprocessed stream (a SOURCE_FORMATS entry, or 'video_source' by format_id)
+        
+        Returns (file_path, details) where details has the title and the
+        codec/bitrate of the stream, or (None, None) on failure.
+        """
+        if not self.validate_youtube_url(url):
+            return None, None
+        
+        try:
+            info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type=format_type, format_id=format_id, progress=progress)
+            if not info:
+                return None, None
+            
+            downloads = info.get('requested_downloads') or [{}]
+            file_path = downloads[0].get('filepath')
+            if not file_path or not os.path.exists(file_path):
+                return None, None
+            
+            return file_path, {
+                'title': secure_filename(info.get('title', 'audio')),
+                'format_id': info.get('format_id'),
+                'acodec': info.get('acodec'),
+                'vcodec': info.get('vcodec'),
+                'abr': info.get('abr'),
+                'ext': info.get('ext'),
+            }
+        except Exception as e:
+            print(f"Error downloading source stream: {e}")
+            return None, None
+    
+    def download_video(self, url, output_path, resolution=None, format_id=None, progress=None, clip=None):
         """Download video using multiple strategies with high quality"""
         if not self.validate_youtube_url(url):
             return None, None
@@ -496,29 +748,81 @@ class AdvancedYouTubeDownloader:
         try:
             # If format_id is specified, use it directly for best quality
             if format_id:
-                info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type='mp4', resolution=resolution, format_id=format_id)
+                info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type='mp4', resolution=resolution, format_id=format_id, progress=progress, clip=clip)
             else:
-                info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type='mp4', resolution=resolution)
+                info = self.try_with_different_strategies(url, download=True, output_path=output_path, format_type='mp4', resolution=resolution, progress=progress, clip=clip)
             
             if info:
                 title = info.get('title', 'video')
                 safe_title = secure_filename(title)
                 
-                # Find downloaded MP4 file
-                for file in os.listdir(output_path):
-                    if file.endswith('.mp4'):
-                        actual_file = os.path.join(output_path, file)
-                        expected_file = os.path.join(output_path, f"{safe_title}.mp4")
-                        if actual_file != expected_file:
-                            os.rename(actual_file, expected_file)
-                        return expected_file, safe_title
-                        
-                return None, None
+                file_path = self.downloaded_file(info, output_path, safe_title, 'mp4')
+                return (file_path, safe_title) if file_path else (None, None)
             return None, None
         except Exception as e:
             print(f"Error downloading video: {e}")
             return None, None
     
+    def is_redirectable(self, media_url, margin=60):
+        """Whether a client other than this server can fetch a media URL
+        
+        Signed googlevideo URLs list the signed parameters in ``sparams``;
+        with ``ip`` among them the URL only works from the address that
+        extracted it. Their expiry is a unix timestamp in ``expire``, and a
+        URL from cached info may be past it (or within ``margin`` seconds).
+        """
+        query = parse_qs(urlparse(media_url).query)
+        if 'ip' in query.get('sparams', [''])[0].split(','):
+            return False
+        expire = query.get('expire', [''])[0]
+        return not (expire.isdigit() and int(expire) <= time.time() + margin)
+    
+    def get_direct_stream(self, info, resolution=None, format_id=None):
+        """Pick a progressive MP4 (audio and video in one file) that can be served as-is
+        
+        Returns None when the request needs merging or conversion, or when
+        the only matching URLs can't be handed to a client (bound to this
+        server's IP, or already expired), so the caller falls back to
+        downloading and proxying the file. So does a resolution that isn't
+        a height ("720" or "720p"), such as "best" or "4k".
+        """
+        target_height = None
+        if resolution and not format_id:
+            match = re.fullmatch(r'(\d+)p?', resolution.strip().lower())
+            if not match:
+                return None
+            target_height = int(match.group(1))
+        
+        progressive = [
+            fmt for fmt in info.get('formats', [])
+            if fmt.get('url')
+            and self.is_redirectable(fmt['url'])
+            and fmt.get('ext') == 'mp4'
+            and fmt.get('vcodec') not in (None, 'none')
+            and fmt.get('acodec') not in (None, 'none')
+            and fmt.get('protocol', 'https') in ('http', 'https')
+        ]
+        
+        if format_id:
+            progressive = [fmt for fmt in progressive if fmt.get('format_id') == format_id]
+        elif target_height is not None:
+            progressive = [fmt for fmt in progressive if (fmt.get('height') or 0) <= target_height]
+        
+        if not progressive:
+            return None
+        
+        best = max(progressive, key=lambda x: (x.get('height') or 0, x.get('tbr') or 0))
+        expire = parse_qs(urlparse(best['url']).query).get('expire')
+        
+        return {
+            'url': best['url'],
+            'format_id': best.get('format_id'),
+            'resolution': f"{best.get('height')}p" if best.get('height') else None,
+            'ext': best.get('ext'),
+            'filesize': best.get('filesize') or best.get('filesize_approx'),
+            'expires_at': int(expire[0]) if expire and expire[0].isdigit() else None,
+        }
+    
     def get_best_format_for_resolution(self, url, target_resolution):
         """Get the best format ID for a specific resolution"""
         try:
@@ -556,7 +860,7 @@ class AdvancedYouTubeDownloader:
             print(f"Error getting best format: {e}")
             return None
 
-    def download_with_best_quality(self, url, output_path, target_resolution=None):
+    def download_with_best_quality(self, url, output_path, target_resolution=None, progress=None):
         """Download video with automatically selected best quality"""
         try:
             # Get the best format for target resolution
@@ -564,10 +868,10 @@ class AdvancedYouTubeDownloader:
                 best_format = self.get_best_format_for_resolution(url, target_resolution)
                 if best_format:
                     print(f"🎯 Selected best format: {best_format['resolution']} at {best_format['bitrate']} kbps")
-                    return self.download_video(url, output_path, target_resolution, best_format['format_id'])
+                    return self.download_video(url, output_path, target_resolution, best_format['format_id'], progress)
             
             # Fallback to regular download with best available
-            return self.download_video(url, output_path, target_resolution)
+            return self.download_video(url, output_path, target_resolution, progress=progress)
             
         except Exception as e:
             print(f"Error in best quality download: {e}")
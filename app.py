@@ -1,11 +1,11 @@
 import os
 import re
-import tempfile
+import hmac
 import logging
 import threading
 import time
 from urllib.parse import urlparse, parse_qs
-from flask import Flask, request, jsonify, send_file, make_response
+from flask import Flask, request, jsonify, make_response, redirect, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import yt_dlp
@@ -14,6 +14,18 @@ import shutil
 from advanced_downloader import AdvancedYouTubeDownloader
 from advanced_downloader import AdvancedYouTubeDownloader
 from youtube_bypass import YouTubeBypasser
+from progress_events import ProgressStore, JobIdInUse
+from egress import BufferPool, TokenBucket, ThrottledFileSender
+from artifact_cache import ArtifactCache
+from artifact_storage import create_storage
+from request_coalescing import DownloadCoalescer
+from ffmpeg_pipeline import FFmpegPipeline, FFmpegError, Loudnorm, MediaTags
+from transcode_executor import TranscodeExecutor, TranscodeQueueFull
+from parallel_mp3 import SegmentedMP3Encoder
+from metadata_cache import MetadataCache
+from cache_stats import CacheStats
+from prewarm import Prewarmer, items_from_log, items_from_urls
+from cache_simulator import download_request_line
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +42,61 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # Disable caching for downloads
 TEMP_FOLDER = os.getenv('TEMP_FOLDER', './temp')
 PORT = int(os.getenv('PORT', 5000))
 DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', 0.25))  # seconds between progress events
+
+# Egress shaping in bytes per second (0 = unlimited)
+EGRESS_GLOBAL_RATE = int(os.getenv('EGRESS_GLOBAL_RATE', 0))  # shared by all connections and workers
+EGRESS_CLIENT_RATE = int(os.getenv('EGRESS_CLIENT_RATE', 0))  # per connection, default for every endpoint
+EGRESS_ENDPOINT_RATES = {
+    'download': int(os.getenv('EGRESS_CLIENT_RATE_DOWNLOAD', EGRESS_CLIENT_RATE)),
+    'download-best': int(os.getenv('EGRESS_CLIENT_RATE_DOWNLOAD_BEST', EGRESS_CLIENT_RATE)),
+}
+EGRESS_CHUNK_SIZE = int(os.getenv('EGRESS_CHUNK_SIZE', 65536))
+# Artifact cache for finished downloads
+ARTIFACT_CACHE_FOLDER = os.getenv('ARTIFACT_CACHE_FOLDER', './cache')
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv('ARTIFACT_CACHE_MAX_BYTES', 10 * 1024 ** 3))  # 10GB
+ARTIFACT_CACHE_POLICY = os.getenv('ARTIFACT_CACHE_POLICY', 'tinylfu')  # 'tinylfu' or 'lru'
+# Optional RAM-backed hot tier (e.g. tmpfs) for in-progress and popular artifacts
+HOT_TIER_FOLDER = os.getenv('HOT_TIER_FOLDER', '')  # empty = disk only
+HOT_TIER_MAX_BYTES = int(os.getenv('HOT_TIER_MAX_BYTES', 0))
+HOT_TIER_PROMOTE_HITS = int(os.getenv('HOT_TIER_PROMOTE_HITS', 2))  # reads before a disk artifact moves up
+# Shared artifact store so every node can serve what another produced: '', 'local' or 's3'
+ARTIFACT_STORE = os.getenv('ARTIFACT_STORE', '')
+ARTIFACT_STORE_PATH = os.getenv('ARTIFACT_STORE_PATH', '')  # 'local': shared mount
+S3_BUCKET = os.getenv('S3_BUCKET', '')
+S3_PREFIX = os.getenv('S3_PREFIX', 'artifacts')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', '')  # e.g. http://minio:9000
+S3_REGION = os.getenv('S3_REGION', '')
+METADATA_CACHE_TTL = int(os.getenv('METADATA_CACHE_TTL', 1800))  # seconds, keep below the stream URL lifetime
+NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 120))  # seconds to remember videos that failed extraction
+# normalize=true downloads: integrated loudness target (LUFS) and how long measured stats are reused
+LOUDNORM_TARGET = float(os.getenv('LOUDNORM_TARGET', -14))
+LOUDNESS_CACHE_TTL = int(os.getenv('LOUDNESS_CACHE_TTL', 30 * 86400))  # seconds
+
+# Local ffmpeg slots shared by all workers (0 = size by CPU count)
+TRANSCODE_HEAVY_SLOTS = int(os.getenv('TRANSCODE_HEAVY_SLOTS', 0))  # MP3 encodes
+TRANSCODE_LIGHT_SLOTS = int(os.getenv('TRANSCODE_LIGHT_SLOTS', 0))  # stream copies and merges
+TRANSCODE_QUEUE_LIMIT = int(os.getenv('TRANSCODE_QUEUE_LIMIT', 64))  # waiting jobs per lane
+TRANSCODE_QUEUE_TIMEOUT = int(os.getenv('TRANSCODE_QUEUE_TIMEOUT', 600))  # seconds before a queued job gives up
+TRANSCODE_SJF_WEIGHT = float(os.getenv('TRANSCODE_SJF_WEIGHT', 0.05))  # queue seconds yielded per media second; 0 = FIFO
+# MP3s of long audio are encoded as parallel segments (0 segments = CPU count, 1 = off)
+PARALLEL_MP3_MIN_DURATION = int(os.getenv('PARALLEL_MP3_MIN_DURATION', 1200))  # seconds
+PARALLEL_MP3_SEGMENTS = int(os.getenv('PARALLEL_MP3_SEGMENTS', 0))
+
+# Admin endpoints (/admin/*) are disabled unless a token is set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+PREWARM_MAX_CONCURRENCY = int(os.getenv('PREWARM_MAX_CONCURRENCY', 4))
+
+MIMETYPES = {'mp3': 'audio/mpeg', 'mp4': 'video/mp4', 'm4a': 'audio/mp4', 'opus': 'audio/ogg'}
+
+# Audio source components (cache variant per SOURCE_FORMATS entry)
+AUDIO_COMPONENTS = {'audio_source': 'bestaudio', 'opus_source': 'bestaudio:opus'}
+# Stream-copied audio formats -> (codec they carry, component that usually has it)
+COPY_AUDIO_FORMATS = {'m4a': ('mp4a', 'audio_source'), 'opus': ('opus', 'opus_source')}
+
+# Streaming memory budget: one pooled chunk buffer per response, at most
+# EGRESS_BUFFER_COUNT buffers per worker; further responses wait for one
+EGRESS_BUFFER_COUNT = int(os.getenv('EGRESS_BUFFER_COUNT', 64))
 
 # Global cleanup tracker
 cleanup_tasks = []
@@ -48,8 +115,62 @@ logger = logging.getLogger(__name__)
 # Ensure temp directory exists
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 
+# Local transcode and merge steps run in slots shared by all workers
+# instead of one ffmpeg per request thread
+transcode_executor = TranscodeExecutor(TRANSCODE_HEAVY_SLOTS, TRANSCODE_LIGHT_SLOTS,
+                                       TRANSCODE_QUEUE_LIMIT, TRANSCODE_QUEUE_TIMEOUT, TRANSCODE_SJF_WEIGHT)
+
+# Local transcode and merge steps on cached source components. The ffmpeg
+# build is probed once here, before workers fork, so a missing encoder or
+# muxer shows up in the log and on / instead of in a failed request
+media_pipeline = FFmpegPipeline(executor=transcode_executor)
+mp3_encoder = SegmentedMP3Encoder(media_pipeline, PARALLEL_MP3_SEGMENTS, PARALLEL_MP3_MIN_DURATION)
+ffmpeg_gaps = {fmt: missing for fmt in MIMETYPES if (missing := media_pipeline.missing(fmt))}
+if ffmpeg_gaps:
+    logger.warning(f"ffmpeg can't produce every format: {ffmpeg_gaps}")
+
 # Initialize advanced downloader
-downloader = AdvancedYouTubeDownloader()
+downloader = AdvancedYouTubeDownloader(transcode_executor.thread_budget, media_pipeline.capabilities, transcode_executor)
+
+# Live progress shared by all workers through small files in TEMP_FOLDER
+progress_store = ProgressStore(os.path.join(TEMP_FOLDER, 'progress'), PROGRESS_MIN_INTERVAL)
+
+# Finished downloads, shared by all workers through the cache folder (and the hot tier)
+artifact_cache = ArtifactCache(
+    ARTIFACT_CACHE_FOLDER, ARTIFACT_CACHE_MAX_BYTES, ARTIFACT_CACHE_POLICY,
+    HOT_TIER_FOLDER, HOT_TIER_MAX_BYTES, HOT_TIER_PROMOTE_HITS,
+    create_storage(ARTIFACT_STORE, ARTIFACT_STORE_PATH, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION),
+    media_pipeline.probe
+)
+
+# Extracted video info, shared by all workers, and videos that could not be extracted
+metadata_cache = MetadataCache(os.path.join(ARTIFACT_CACHE_FOLDER, 'metadata'), METADATA_CACHE_TTL)
+negative_cache = MetadataCache(os.path.join(ARTIFACT_CACHE_FOLDER, 'negative'), NEGATIVE_CACHE_TTL)
+# Measured loudness per video, so later normalized variants skip the analysis
+loudness_cache = MetadataCache(os.path.join(ARTIFACT_CACHE_FOLDER, 'loudness'), LOUDNESS_CACHE_TTL)
+
+# Redirect delivery: signed stream URLs taken from cached video info
+stream_stats = CacheStats(('hits', 'misses', 'redirects', 'fallbacks', 'bytes_offloaded'))
+
+class DownloadFailed(Exception):
+    """A download step failed with an error that is reported to the client"""
+    
+    def __init__(self, error, details, status=500):
+        super().__init__(error)
+        self.error = error
+        self.details = details
+        self.status = status
+
+# One upstream fetch and transcode per artifact key at a time; a leader's
+# DownloadFailed reaches waiters in other workers with its details and status
+coalescer = DownloadCoalescer(os.path.join(ARTIFACT_CACHE_FOLDER, 'locks'), errors=(DownloadFailed,))
+
+# Created before gunicorn forks (preload_app) so the global bucket is shared by all workers
+file_sender = ThrottledFileSender(
+    TokenBucket(EGRESS_GLOBAL_RATE, shared=True),
+    EGRESS_CHUNK_SIZE,
+    BufferPool(EGRESS_CHUNK_SIZE, EGRESS_BUFFER_COUNT)
+)
 
 def delayed_cleanup(temp_dir, delay=60):
     """Cleanup temp directory after a delay"""
@@ -67,6 +188,442 @@ def delayed_cleanup(temp_dir, delay=60):
     thread.start()
     cleanup_tasks.append(thread)
 
+def audio_kbps(probe):
+    """Bitrate (kbps) of the first audio stream of a probe, else of the whole file; None if unknown"""
+    if not probe:
+        return None
+    stream = next((s for s in probe.get('streams', []) if s.get('codec_type') == 'audio'), {})
+    try:
+        return round(int(stream.get('bit_rate') or probe.get('bit_rate')) / 1000)
+    except (TypeError, ValueError):
+        return None
+
+def send_download(file_path, filename, mimetype, endpoint, job_id, cache_status, audio_bitrate=None):
+    """Build a chunked, rate-limited attachment response for a finished download
+    
+    The file is opened right away, so later cleanup or eviction can't cut a
+    slow transfer short. ``audio_bitrate`` (kbps) goes out as X-Audio-Bitrate.
+    """
+    body = file_sender.stream(file_path, rate=EGRESS_ENDPOINT_RATES.get(endpoint, EGRESS_CLIENT_RATE))
+    response = Response(body, mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Length'] = str(os.path.getsize(file_path))
+    
+    # Add headers for better compatibility
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition, X-Job-ID, X-Delivery, X-Cache'
+    response.headers['X-Job-ID'] = job_id
+    response.headers['X-Delivery'] = 'proxy'
+    response.headers['X-Cache'] = cache_status
+    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Expires'] = '0'
+    if audio_bitrate:
+        response.headers['X-Audio-Bitrate'] = str(audio_bitrate)
+        response.headers['Access-Control-Expose-Headers'] += ', X-Audio-Bitrate'
+    return response
+
+def require_ffmpeg(format_type, normalize=False):
+    """Refuse up front (503) what the probed ffmpeg build can't produce"""
+    missing = media_pipeline.missing(format_type)
+    if normalize and not missing and format_type in COPY_AUDIO_FORMATS and not media_pipeline.audio_codec_args(format_type):
+        missing.append(f"no {format_type} encoder")  # normalized audio can't be a stream copy
+    if missing:
+        raise DownloadFailed(f"{format_type} downloads are unavailable on this server",
+                             f"ffmpeg: {'; '.join(missing)}", 503)
+
+def extract_info(url, reporter):
+    """Get (slim) video info first, so unavailable videos fail with a clear 400"""
+    video_id = downloader.extract_video_id(url)
+    if negative_cache.get(video_id):
+        logger.info(f"Video recently failed extraction, not retrying yet: {video_id}")
+        raise DownloadFailed("Unable to extract video information", "The video may be private, deleted, or geo-blocked", 400)
+    
+    video_info = metadata_cache.get(video_id)
+    if video_info:
+        logger.info(f"Video info from metadata cache: {video_info.get('title', 'Unknown')}")
+        video_info['from_cache'] = True
+        return video_info
+    
+    logger.info(f"Getting video info for: {url}")
+    reporter.set_stage('extracting')
+    started = time.monotonic()
+    video_info = downloader.slim_info(downloader.get_video_info(url))
+    if not video_info:
+        logger.error("Unable to extract video information")
+        negative_cache.put(video_id, {'failed_at': time.time()})
+        raise DownloadFailed("Unable to extract video information", "The video may be private, deleted, or geo-blocked", 400)
+    
+    metadata_cache.record_extraction(time.monotonic() - started)
+    metadata_cache.put(video_id, video_info)
+    logger.info(f"Video info extracted successfully: {video_info.get('title', 'Unknown')}")
+    return video_info
+
+def audio_component(url, reporter, source='audio_source'):
+    """Cache entry for the video's bestaudio stream, downloading it at most once
+    
+    MP3 variants, m4a copies and MP4 merges of the same video are built from
+    this component locally instead of fetching the audio from YouTube again
+    (``opus_source`` is the Opus stream, for opus copies).
+    Returns None when the component can't be cached or downloaded.
+    """
+    key = artifact_key(url, 'component', AUDIO_COMPONENTS[source])
+    if not key:
+        return None
+    
+    entry = artifact_cache.get(key)
+    if entry:
+        logger.info("Using cached audio component")
+        artifact_cache.record_serve('HIT', entry)
+        return entry
+    
+    def produce():
+        temp_dir = artifact_cache.work_dir(TEMP_FOLDER)
+        try:
+            started = time.monotonic()
+            file_path, details = downloader.download_source(url, temp_dir, source, progress=reporter)
+            if not file_path:
+                return None
+            logger.info(f"Caching audio component: {details['acodec']} {details['abr'] or '?'}kbps")
+            details['build_seconds'] = round(time.monotonic() - started, 1)
+            return artifact_cache.publish(key, file_path, {**details, 'format': 'component'})
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    entry, coalesced = coalescer.run(key, produce, lambda: artifact_cache.lookup(key))
+    if entry:
+        artifact_cache.record_serve('REMOTE' if entry.get('fetched') else 'COALESCED' if coalesced else 'MISS', entry)
+    return entry
+
+def cover_art(url, video_info):
+    """Cache entry for the video's thumbnail, fetched at most once per video; None when unavailable"""
+    key = artifact_key(url, 'component', 'thumbnail')
+    if not key:
+        return None
+    
+    entry = artifact_cache.get(key)
+    if entry:
+        artifact_cache.record_serve('HIT', entry)
+        return entry
+    
+    def produce():
+        temp_dir = artifact_cache.work_dir(TEMP_FOLDER)
+        try:
+            file_path = downloader.download_thumbnail(video_info, temp_dir)
+            if not file_path:
+                return None
+            return artifact_cache.publish(key, file_path, {'title': 'thumbnail', 'format': 'component'})
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    entry, coalesced = coalescer.run(key, produce, lambda: artifact_cache.lookup(key))
+    if entry:
+        artifact_cache.record_serve('REMOTE' if entry.get('fetched') else 'COALESCED' if coalesced else 'MISS', entry)
+    return entry
+
+def media_tags(url, video_info, format_type):
+    """MediaTags from the video's metadata, with the cached thumbnail as cover where the format holds one"""
+    cover = None
+    if format_type in MediaTags.COVER_FORMATS and 'mjpeg' in media_pipeline.capabilities['encoders']:
+        entry = cover_art(url, video_info)
+        cover = entry['path'] if entry else None
+    uploader = re.sub(r' - Topic$', '', video_info.get('uploader') or '') or None
+    return MediaTags(
+        title=video_info.get('track') or video_info.get('title'),
+        artist=video_info.get('artist') or uploader,
+        album=video_info.get('album'),
+        date=(video_info.get('upload_date') or '')[:4] or None,
+        cover=cover,
+    )
+
+def tag_download(file_path, format_type, tags):
+    """Tag a file yt-dlp produced with one stream-copy run; the file stays untagged if that fails"""
+    tagged = os.path.join(os.path.dirname(file_path), f"tagged.{format_type}")
+    try:
+        if format_type == 'mp4':
+            media_pipeline.remux(file_path, tagged, tags)
+        else:
+            media_pipeline.copy_audio(file_path, tagged, tags)
+    except (FFmpegError, TranscodeQueueFull) as e:
+        logger.warning(f"Tagging {format_type} failed: {e}")
+        return file_path
+    os.replace(tagged, file_path)
+    return file_path
+
+def derive_mp3(url, temp_dir, reporter, quality, tags=None, cap_bitrate=True):
+    """Transcode the cached audio component to MP3; (None, None) on failure"""
+    component = audio_component(url, reporter)
+    if not component:
+        return None, None
+    if cap_bitrate:
+        quality = downloader.cap_audio_quality(quality, component.get('abr'))
+    
+    reporter.set_stage('converting')
+    output = os.path.join(temp_dir, f"{component['title']}.mp3")
+    probe = component.get('probe') or {}
+    sample_rate = next((int(s['sample_rate']) for s in probe.get('streams', []) if s.get('sample_rate')), None)
+    try:
+        mp3_encoder.encode(component['path'], output, quality, probe.get('duration'), sample_rate, tags=tags)
+    except TranscodeQueueFull as e:
+        raise DownloadFailed("Server busy, try again later", str(e), 503)
+    except FFmpegError as e:
+        logger.warning(f"Local MP3 transcode failed: {e}")
+        return None, None
+    return output, component['title']
+
+def derive_audio_copy(url, temp_dir, reporter, format_type, tags=None):
+    """Copy the cached audio component into an m4a/opus file with no transcoding
+    
+    Returns (None, None) when the component carries a different codec, so
+    the caller falls back to yt-dlp's FFmpegExtractAudio.
+    """
+    codec, source = COPY_AUDIO_FORMATS[format_type]
+    component = audio_component(url, reporter, source)
+    if not component:
+        return None, None
+    if not (component.get('acodec') or '').startswith(codec):
+        logger.info(f"Audio component is {component.get('acodec')}, not {codec}; {format_type} needs a transcode")
+        return None, None
+    
+    reporter.set_stage('converting')
+    output = os.path.join(temp_dir, f"{component['title']}.{format_type}")
+    try:
+        media_pipeline.copy_audio(component['path'], output, tags)
+    except TranscodeQueueFull as e:
+        raise DownloadFailed("Server busy, try again later", str(e), 503)
+    except FFmpegError as e:
+        logger.warning(f"Local {format_type} stream copy failed: {e}")
+        return None, None
+    return output, component['title']
+
+def derive_normalized(url, temp_dir, reporter, format_type, quality='320', tags=None, cap_bitrate=True):
+    """Loudness-normalized mp3/m4a/opus from the bestaudio stream in one ffmpeg run
+    
+    The first normalized download of a video uses loudnorm's single-pass
+    mode and caches the loudness it measured; later variants apply a
+    linear gain from those stats. Returns (None, None) on failure.
+    """
+    component = audio_component(url, reporter)
+    if component:
+        source, title, probe, abr = component['path'], component['title'], component.get('probe') or {}, component.get('abr')
+    else:
+        source, details = downloader.download_source(url, temp_dir, 'audio_source', progress=reporter)
+        if not source:
+            return None, None
+        title, probe, abr = details['title'], media_pipeline.probe(source) or {}, details.get('abr')
+    if cap_bitrate:
+        quality = downloader.cap_audio_quality(quality, abr)
+    
+    video_id = downloader.extract_video_id(url)
+    measured = loudness_cache.get(video_id)
+    sample_rate = next((int(s['sample_rate']) for s in probe.get('streams', []) if s.get('sample_rate')), None)
+    loudnorm = Loudnorm(LOUDNORM_TARGET, measured, sample_rate)
+    logger.info(f"Normalizing to {LOUDNORM_TARGET} LUFS ({'cached stats' if measured else 'single pass'})")
+    
+    reporter.set_stage('converting')
+    output = os.path.join(temp_dir, f"{title}.{format_type}")
+    try:
+        if format_type == 'mp3':
+            mp3_encoder.encode(source, output, quality, probe.get('duration'), sample_rate, loudnorm, tags)
+        else:
+            media_pipeline.encode_audio(source, output, format_type, probe.get('duration'), loudnorm, tags)
+    except TranscodeQueueFull as e:
+        raise DownloadFailed("Server busy, try again later", str(e), 503)
+    except FFmpegError as e:
+        logger.warning(f"Normalized {format_type} encode failed: {e}")
+        return None, None
+    if loudnorm.measured and not measured:
+        loudness_cache.put(video_id, loudnorm.measured)
+    return output, title
+
+def derive_mp4(url, temp_dir, reporter, format_id, tags=None):
+    """Download only the video stream and merge it with the cached audio component"""
+    component = audio_component(url, reporter)
+    if not component:
+        return None, None
+    
+    video_path, details = downloader.download_source(url, temp_dir, 'video_source', format_id, reporter)
+    if not video_path:
+        return None, None
+    
+    reporter.set_stage('merging')
+    output = os.path.join(temp_dir, f"{details['title']}.mp4")
+    try:
+        media_pipeline.merge(video_path, component['path'], output, tags)
+    except TranscodeQueueFull as e:
+        raise DownloadFailed("Server busy, try again later", str(e), 503)
+    except FFmpegError as e:
+        logger.warning(f"Local merge failed: {e}")
+        return None, None
+    os.remove(video_path)
+    return output, details['title']
+
+def download_media(url, format_type, temp_dir, reporter, resolution='', format_id='', audio_quality='', clip=None, best=False, normalize=False, tags=False, cap_bitrate=True, video_info=None):
+    """Download one output into temp_dir and return (file_path, title)
+    
+    Full-length audio and MP4s with a known video format are derived from
+    the cached audio component; everything else (clips, resolution-based
+    picks) goes through yt-dlp directly, as does any failed derivation.
+    Loudness-normalized audio is only made locally (never for clips).
+    Tags are written by the ffmpeg run that makes the file; only files
+    from yt-dlp get a separate stream-copy run for them. MP3s are never
+    encoded above the source's bitrate unless ``cap_bitrate`` is off; the
+    caller passes the ``video_info`` it already extracted for that.
+    """
+    require_ffmpeg(format_type, normalize)
+    tags = media_tags(url, video_info, format_type) if tags else None
+    if format_type == 'mp3':
+        audio_quality = '320' if best else audio_quality or '320'  # Always 320kbps (or the source's) for best
+        if cap_bitrate:
+            audio_quality = downloader.cap_audio_quality(audio_quality, downloader.source_audio_bitrate(video_info))
+    file_path = title = None
+    fallback = False
+    if normalize and format_type != 'mp4':
+        logger.info(f"Starting loudness-normalized {format_type} download")
+        file_path, title = derive_normalized(url, temp_dir, reporter, format_type, audio_quality or '320', tags, cap_bitrate)
+        error, details = "Failed to normalize audio", "Loudness-normalized encode failed"
+    elif best and format_type == 'mp3':
+        logger.info("Starting best quality MP3 download...")
+        file_path, title = derive_mp3(url, temp_dir, reporter, audio_quality, tags, cap_bitrate)
+        if not file_path:
+            fallback = True
+            file_path, title = downloader.download_audio(url, temp_dir, audio_quality, reporter)
+        error, details = "Failed to download with best quality", "Download failed despite quality optimization"
+    elif best and format_type == 'mp4':
+        logger.info(f"Starting best quality MP4 download with target: {resolution or 'highest available'}")
+        best_format = downloader.get_best_format_for_resolution(url, resolution) if resolution else None
+        if best_format:
+            logger.info(f"Selected best format: {best_format['resolution']} ({best_format['format_id']})")
+            file_path, title = derive_mp4(url, temp_dir, reporter, best_format['format_id'], tags)
+        if not file_path:
+            fallback = True
+            file_path, title = downloader.download_with_best_quality(url, temp_dir, resolution, reporter)
+        error, details = "Failed to download with best quality", "Download failed despite quality optimization"
+    elif format_type == 'mp3':
+        logger.info(f"Starting MP3 download with quality: {audio_quality}")
+        if not clip:
+            file_path, title = derive_mp3(url, temp_dir, reporter, audio_quality, tags, cap_bitrate)
+        if not file_path:
+            fallback = True
+            file_path, title = downloader.download_audio(url, temp_dir, audio_quality, reporter, clip)
+        error, details = "Failed to download audio", "Audio extraction failed"
+    elif format_type in COPY_AUDIO_FORMATS:
+        logger.info(f"Starting {format_type} download (stream copy)")
+        if not clip:
+            file_path, title = derive_audio_copy(url, temp_dir, reporter, format_type, tags)
+        if not file_path:
+            fallback = True
+            file_path, title = downloader.download_audio(url, temp_dir, None, reporter, clip, format_type)
+        error, details = "Failed to download audio", "Audio extraction failed"
+    else:
+        logger.info(f"Starting MP4 download with resolution: {resolution or 'best'}, format_id: {format_id or 'auto'}")
+        if format_id and not clip:
+            file_path, title = derive_mp4(url, temp_dir, reporter, format_id, tags)
+        if not file_path:
+            fallback = True
+            file_path, title = downloader.download_video(url, temp_dir, resolution, format_id, reporter, clip)
+        error, details = "Failed to download video", "Video download failed"
+    
+    if tags and fallback and file_path and os.path.exists(file_path):
+        file_path = tag_download(file_path, format_type, tags)
+    if not file_path or not os.path.exists(file_path):
+        logger.error(error)
+        raise DownloadFailed(error, details)
+    return file_path, title
+
+def build_artifact(cache_key, url, format_type, reporter, download):
+    """Extract, then ``download(temp_dir, video_info)`` and publish one artifact into the cache"""
+    temp_dir = artifact_cache.work_dir(TEMP_FOLDER)
+    try:
+        started = time.monotonic()
+        require_ffmpeg(format_type)
+        video_info = extract_info(url, reporter)
+        file_path, title = download(temp_dir, video_info)
+        return artifact_cache.publish(cache_key, file_path, {
+            'title': title,
+            'format': format_type,
+            'build_seconds': round(time.monotonic() - started, 1),
+        })
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def serve_artifact(cache_key, url, format_type, reporter, download, endpoint, job_id):
+    """Serve from the artifact cache, producing the artifact at most once per key
+    
+    Identical requests arriving while the artifact is being produced attach
+    to that download and are sent the same file once it is published.
+    """
+    entry = artifact_cache.get(cache_key)
+    cache_status = 'HIT'
+    if not entry:
+        try:
+            entry, coalesced = coalescer.run(
+                cache_key,
+                lambda: build_artifact(cache_key, url, format_type, reporter, download),
+                lambda: artifact_cache.lookup(cache_key)
+            )
+        except TimeoutError as e:
+            raise DownloadFailed("Server busy, try again later", str(e), 503)
+        if entry.get('fetched'):
+            cache_status = 'REMOTE'  # produced by another node
+        else:
+            cache_status = 'COALESCED' if coalesced else 'MISS'
+    artifact_cache.record_serve(cache_status, entry)
+    
+    reporter.finish()
+    filename = f"{entry['title']}.{entry['ext']}"
+    logger.info(f"Serving artifact ({cache_status}): {filename}")
+    audio_bitrate = audio_kbps(entry.get('probe')) if format_type != 'mp4' else None
+    return send_download(entry['path'], filename, MIMETYPES[format_type], endpoint, job_id, cache_status, audio_bitrate)
+
+def artifact_key(url, format_type, variant, audio_quality=''):
+    """Artifact cache key for a request, or None when it can't be cached"""
+    video_id = downloader.extract_video_id(url)
+    if not video_id:
+        return None
+    return ArtifactCache.make_key(video_id, format_type, variant, audio_quality)
+
+def request_key(url, format_type, resolution='', format_id='', audio_quality='', best=False, normalize=False, tags=False, cap_bitrate=True):
+    """Artifact key for a /download or /download-best request (also used by prewarming)"""
+    if best:
+        # Same artifacts as /download for audio (MP3 at 320); automatic MP4 picks get their own variant
+        if format_type == 'mp4':
+            return artifact_key(url, 'mp4', f"best:{resolution}")
+        return request_key(url, format_type, audio_quality='320', normalize=normalize, tags=tags, cap_bitrate=cap_bitrate)
+    # Normalized (per loudness target) and tagged outputs are variants of their own
+    extras = []
+    if normalize and format_type != 'mp4':
+        extras.append(f"loudnorm:{LOUDNORM_TARGET}")
+    if tags:
+        extras.append('tags')
+    if not cap_bitrate and format_type == 'mp3':
+        extras.append('uncapped')  # capped MP3s keep the plain key
+    if format_type == 'mp3':
+        return artifact_key(url, 'mp3', '+'.join(extras), audio_quality or '320')
+    if format_type in COPY_AUDIO_FORMATS:
+        return artifact_key(url, format_type, '+'.join(extras))  # stream copies have no quality setting
+    return artifact_key(url, 'mp4', '+'.join([format_id or resolution, *extras]))
+
+def clip_suffix(clip):
+    """Filename suffix for clip downloads, e.g. '_90-120'"""
+    if not clip:
+        return ''
+    return f"_{int(clip[0])}-{int(clip[1])}"
+
+def direct_stream_response(stream, job_id):
+    """302 to the media URL, or a JSON payload when the client asks for JSON"""
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        response = jsonify({"delivery": "redirect", **stream})
+    else:
+        response = redirect(stream['url'], 302)
+    
+    response.headers['X-Delivery'] = 'redirect'
+    response.headers['X-Job-ID'] = job_id
+    if stream.get('expires_at'):
+        response.headers['X-Stream-Expires'] = str(stream['expires_at'])
+    response.headers['Access-Control-Expose-Headers'] = 'Location, X-Delivery, X-Job-ID, X-Stream-Expires'
+    response.headers['Cache-Control'] = 'no-store'  # Signed URL, don't let proxies keep it
+    return response
+
 @app.route('/', methods=['GET'])
 def index():
     """Health check endpoint"""
@@ -78,20 +635,28 @@ def index():
             "High-quality video downloads",
             "Multiple resolution options",
             "Detailed format information",
-            "Audio quality selection",
+            "Audio quality selection (MP3 CBR or VBR)",
+            "Native AAC (m4a) and Opus audio without re-encoding",
+            "Loudness normalization (normalize=true) in the same encode",
+            "Title, artist and cover art tags (tags=true) in the same ffmpeg run",
             "Original quality preservation"
         ],
+        "ffmpeg": media_pipeline.capability_report(),
         "endpoints": {
             "download": "POST /download - Download video/audio with quality options",
             "info": "POST /info - Get basic video information",
-            "formats": "POST /formats - Get detailed available formats"
+            "formats": "POST /formats - Get detailed available formats",
+            "progress": "GET /progress/<job_id> - Live download progress (text/event-stream)",
+            "prewarm": "POST /admin/prewarm - Warm the caches from URLs or app.log (X-Admin-Token)",
+            "stats": "GET /admin/stats - Per-layer cache metrics (X-Admin-Token)"
         },
         "parameters": {
             "download": {
                 "required": ["url", "format"],
-                "optional": ["resolution", "format_id", "audio_quality"],
-                "format_options": ["mp3", "mp4"],
-                "audio_quality_options": ["128", "192", "256", "320"],
+                "optional": ["resolution", "format_id", "audio_quality", "cap_bitrate", "normalize", "tags", "job_id", "delivery", "start", "end"],
+                "format_options": ["mp3", "mp4", "m4a", "opus"],
+                "delivery_options": ["proxy", "redirect"],
+                "audio_quality_options": ["128", "192", "256", "320", "V0", "V2", "V5"],
                 "example_resolutions": ["144p", "360p", "720p", "1080p", "1440p", "2160p"]
             }
         }
@@ -100,88 +665,110 @@ def index():
 @app.route('/download', methods=['POST'])
 def download_video():
     """Main download endpoint with enhanced quality options"""
+    reporter = None
     try:
         # Validate request
         if 'url' not in request.form:
             return jsonify({"error": "URL is required"}), 400
         
         if 'format' not in request.form:
-            return jsonify({"error": "Format is required (mp3 or mp4)"}), 400
+            return jsonify({"error": "Format is required (mp3, mp4, m4a or opus)"}), 400
         
         url = request.form['url'].strip()
         format_type = request.form['format'].lower().strip()
         resolution = request.form.get('resolution', '').strip()
         format_id = request.form.get('format_id', '').strip()
         audio_quality = request.form.get('audio_quality', '').strip()
+        job_id = request.form.get('job_id', '').strip()
+        delivery = request.form.get('delivery', 'proxy').lower().strip()
+        clip_start = request.form.get('start', '').strip()
+        clip_end = request.form.get('end', '').strip()
+        normalize = request.form.get('normalize', '').lower().strip() in ('true', '1', 'yes')
+        tags = request.form.get('tags', '').lower().strip() in ('true', '1', 'yes')
+        cap_bitrate = request.form.get('cap_bitrate', 'true').lower().strip() not in ('false', '0', 'no')
         
         # Validate inputs
         if not downloader.validate_youtube_url(url):
             return jsonify({"error": "Invalid YouTube URL"}), 400
         
         if format_type not in downloader.supported_formats:
-            return jsonify({"error": "Format must be 'mp3' or 'mp4'"}), 400
+            return jsonify({"error": "Format must be 'mp3', 'mp4', 'm4a' or 'opus'"}), 400
+        
+        audio_quality, quality_error = downloader.parse_audio_quality(audio_quality)
+        if quality_error:
+            return jsonify({"error": "Invalid audio_quality", "details": quality_error}), 400
+        
+        if delivery not in ('proxy', 'redirect'):
+            return jsonify({"error": "Delivery must be 'proxy' or 'redirect'"}), 400
+        
+        if normalize and (format_type == 'mp4' or clip_start or clip_end):
+            return jsonify({"error": "normalize is only available for full-length mp3, m4a and opus downloads"}), 400
+        
+        if job_id and not progress_store.valid_job_id(job_id):
+            return jsonify({"error": "Invalid job_id", "details": "Use 8-64 letters, digits, '-' or '_'"}), 400
+        
+        job_id = job_id or progress_store.new_job_id()
+        try:
+            reporter = progress_store.reporter(job_id)
+        except JobIdInUse:
+            return jsonify({"error": "job_id already in use", "details": "Pick a new job_id or omit it"}), 409
         
         # Log request
-        logger.info(f"Download request: URL={url}, Format={format_type}, Resolution={resolution}, Format_ID={format_id}, Audio_Quality={audio_quality}")
+        logger.info(download_request_line(url, format_type, resolution, format_id, audio_quality, normalize, tags, cap_bitrate))
+        
+        # Serve finished artifacts without touching YouTube. Clips are one-off
+        # and redirects want the upstream URL, so neither uses the cache.
+        cache_key = None
+        if not (clip_start or clip_end or delivery == 'redirect'):
+            cache_key = request_key(url, format_type, resolution, format_id, audio_quality,
+                                    normalize=normalize, tags=tags, cap_bitrate=cap_bitrate)
+        
+        if cache_key:
+            def download(temp_dir, video_info):
+                return download_media(url, format_type, temp_dir, reporter, resolution, format_id, audio_quality,
+                                      normalize=normalize, tags=tags, cap_bitrate=cap_bitrate, video_info=video_info)
+            
+            return serve_artifact(cache_key, url, format_type, reporter, download, 'download', job_id)
         
         # Create temporary directory for this download
-        temp_dir = tempfile.mkdtemp(dir=TEMP_FOLDER)
+        temp_dir = artifact_cache.work_dir(TEMP_FOLDER)
         
         try:
-            # Get video info first
-            logger.info(f"Getting video info for: {url}")
-            video_info = downloader.get_video_info(url)
-            if not video_info:
-                logger.error("Unable to extract video information")
-                return jsonify({"error": "Unable to extract video information", "details": "The video may be private, deleted, or geo-blocked"}), 400
-            
-            logger.info(f"Video info extracted successfully: {video_info.get('title', 'Unknown')}")
+            if not (delivery == 'redirect' and format_type == 'mp4' and not tags):
+                require_ffmpeg(format_type, normalize)  # a redirect may not need ffmpeg at all
+            video_info = extract_info(url, reporter)
             
-            # Download based on format
-            if format_type == 'mp3':
-                logger.info(f"Starting MP3 download with quality: {audio_quality or 'best'}")
-                file_path, title = downloader.download_audio(url, temp_dir, audio_quality)
-                if not file_path or not os.path.exists(file_path):
-                    logger.error("Failed to download audio")
-                    return jsonify({"error": "Failed to download audio", "details": "Audio extraction failed"}), 500
-                
-                filename = f"{title}.mp3"
-                mimetype = 'audio/mpeg'
-                
-            elif format_type == 'mp4':
-                logger.info(f"Starting MP4 download with resolution: {resolution or 'best'}, format_id: {format_id or 'auto'}")
-                file_path, title = downloader.download_video(url, temp_dir, resolution, format_id)
-                if not file_path or not os.path.exists(file_path):
-                    logger.error("Failed to download video")
-                    return jsonify({"error": "Failed to download video", "details": "Video download failed"}), 500
-                
-                filename = f"{title}.mp4"
-                mimetype = 'video/mp4'
+            clip, clip_error = downloader.parse_clip_range(clip_start, clip_end, video_info.get('duration'))
+            if clip_error:
+                raise DownloadFailed("Invalid clip range", clip_error, 400)
+            if clip:
+                logger.info(f"Clip requested: {clip[0]}s - {clip[1]}s")
             
-            # Send file
-            def cleanup():
-                """Cleanup temp directory after sending file"""
-                try:
-                    shutil.rmtree(temp_dir)
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp directory: {e}")
+            # Redirect straight to the media URL when nothing needs merging, converting or tagging
+            if delivery == 'redirect' and format_type == 'mp4' and not clip and not tags:
+                stream_stats.incr('hits' if video_info.get('from_cache') else 'misses')
+                stream = downloader.get_direct_stream(video_info, resolution, format_id)
+                if stream:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+                    reporter.finish()
+                    stream_stats.incr('redirects')
+                    stream_stats.incr('bytes_offloaded', stream.get('filesize') or 0)
+                    logger.info(f"Redirecting to progressive format {stream['format_id']} ({stream['resolution']})")
+                    return direct_stream_response(stream, job_id)
+                stream_stats.incr('fallbacks')
+                logger.info("No redirectable progressive format matches, falling back to proxy delivery")
             
-            response = make_response(send_file(
-                file_path,
-                as_attachment=True,
-                download_name=filename,
-                mimetype=mimetype
-            ))
+            file_path, title = download_media(url, format_type, temp_dir, reporter, resolution, format_id, audio_quality, clip,
+                                              normalize=normalize, tags=tags, cap_bitrate=cap_bitrate, video_info=video_info)
+            filename = f"{title}{clip_suffix(clip)}.{format_type}"
             
-            # Add headers for better compatibility
-            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-            response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+            # Send file
+            audio_bitrate = audio_kbps(media_pipeline.probe(file_path)) if format_type != 'mp4' else None
+            response = send_download(file_path, filename, MIMETYPES[format_type], 'download', job_id, 'BYPASS', audio_bitrate)
             
             # Schedule delayed cleanup (60 seconds should be enough for download to complete)
             delayed_cleanup(temp_dir, 60)
+            reporter.finish()
             
             logger.info(f"Successfully downloaded: {filename}")
             return response
@@ -194,8 +781,13 @@ def download_video():
                 pass
             raise e
             
+    except DownloadFailed as e:
+        reporter.finish(error=e.error)
+        return jsonify({"error": e.error, "details": e.details}), e.status
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
+        if reporter:
+            reporter.finish(error=str(e))
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 @app.route('/info', methods=['POST'])
@@ -276,73 +868,65 @@ def get_available_formats():
 @app.route('/download-best', methods=['POST'])
 def download_best_quality():
     """Download with automatically selected best quality"""
+    reporter = None
     try:
         # Validate request
         if 'url' not in request.form:
             return jsonify({"error": "URL is required"}), 400
         
         if 'format' not in request.form:
-            return jsonify({"error": "Format is required (mp3 or mp4)"}), 400
+            return jsonify({"error": "Format is required (mp3, mp4, m4a or opus)"}), 400
         
         url = request.form['url'].strip()
         format_type = request.form['format'].lower().strip()
         target_resolution = request.form.get('target_resolution', '').strip()
+        cap_bitrate = request.form.get('cap_bitrate', 'true').lower().strip() not in ('false', '0', 'no')
+        job_id = request.form.get('job_id', '').strip()
         
         # Validate inputs
         if not downloader.validate_youtube_url(url):
             return jsonify({"error": "Invalid YouTube URL"}), 400
         
         if format_type not in downloader.supported_formats:
-            return jsonify({"error": "Format must be 'mp3' or 'mp4'"}), 400
+            return jsonify({"error": "Format must be 'mp3', 'mp4', 'm4a' or 'opus'"}), 400
+        
+        if job_id and not progress_store.valid_job_id(job_id):
+            return jsonify({"error": "Invalid job_id", "details": "Use 8-64 letters, digits, '-' or '_'"}), 400
+        
+        job_id = job_id or progress_store.new_job_id()
+        try:
+            reporter = progress_store.reporter(job_id)
+        except JobIdInUse:
+            return jsonify({"error": "job_id already in use", "details": "Pick a new job_id or omit it"}), 409
         
         # Log request
         logger.info(f"Best quality download request: URL={url}, Format={format_type}, Target={target_resolution or 'auto'}")
         
+        cache_key = request_key(url, format_type, target_resolution, best=True, cap_bitrate=cap_bitrate)
+        
+        def download(temp_dir, video_info):
+            return download_media(url, format_type, temp_dir, reporter, target_resolution, best=True,
+                                  cap_bitrate=cap_bitrate, video_info=video_info)
+        
+        if cache_key:
+            return serve_artifact(cache_key, url, format_type, reporter, download, 'download-best', job_id)
+        
         # Create temporary directory for this download
-        temp_dir = tempfile.mkdtemp(dir=TEMP_FOLDER)
+        temp_dir = artifact_cache.work_dir(TEMP_FOLDER)
         
         try:
-            # Get video info first
-            logger.info(f"Getting video info for: {url}")
-            video_info = downloader.get_video_info(url)
-            if not video_info:
-                logger.error("Unable to extract video information")
-                return jsonify({"error": "Unable to extract video information", "details": "The video may be private, deleted, or geo-blocked"}), 400
-            
-            logger.info(f"Video info extracted successfully: {video_info.get('title', 'Unknown')}")
-            
-            # Download with best quality selection
-            if format_type == 'mp3':
-                logger.info("Starting best quality MP3 download...")
-                file_path, title = downloader.download_audio(url, temp_dir, '320')  # Always use 320kbps for best
-            elif format_type == 'mp4':
-                logger.info(f"Starting best quality MP4 download with target: {target_resolution or 'highest available'}")
-                file_path, title = downloader.download_with_best_quality(url, temp_dir, target_resolution)
-            
-            if not file_path or not os.path.exists(file_path):
-                logger.error("Failed to download with best quality")
-                return jsonify({"error": "Failed to download with best quality", "details": "Download failed despite quality optimization"}), 500
-            
+            require_ffmpeg(format_type)
+            video_info = extract_info(url, reporter)
+            file_path, title = download(temp_dir, video_info)
             filename = f"{title}.{format_type}"
-            mimetype = 'audio/mpeg' if format_type == 'mp3' else 'video/mp4'
             
             # Send file
-            response = make_response(send_file(
-                file_path,
-                as_attachment=True,
-                download_name=filename,
-                mimetype=mimetype
-            ))
-            
-            # Add headers for better compatibility
-            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-            response.headers['Access-Control-Expose-Headers'] = 'Content-Disposition'
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+            audio_bitrate = audio_kbps(media_pipeline.probe(file_path)) if format_type != 'mp4' else None
+            response = send_download(file_path, filename, MIMETYPES[format_type], 'download-best', job_id, 'BYPASS', audio_bitrate)
             
             # Schedule delayed cleanup
             delayed_cleanup(temp_dir, 60)
+            reporter.finish()
             
             logger.info(f"Successfully downloaded with best quality: {filename}")
             return response
@@ -355,10 +939,173 @@ def download_best_quality():
                 pass
             raise e
             
+    except DownloadFailed as e:
+        reporter.finish(error=e.error)
+        return jsonify({"error": e.error, "details": e.details}), e.status
     except Exception as e:
         logger.error(f"Best quality download error: {str(e)}")
+        if reporter:
+            reporter.finish(error=str(e))
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
+@app.route('/progress/<job_id>', methods=['GET'])
+def download_progress(job_id):
+    """Stream live download progress as Server-Sent Events"""
+    if not progress_store.valid_job_id(job_id):
+        return jsonify({"error": "Invalid job_id"}), 400
+    
+    response = Response(stream_with_context(progress_store.stream(job_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+def admin_authorized():
+    """True when the request carries the configured ADMIN_TOKEN"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+def prewarm_item(item, metadata_only=False):
+    """Warm one item; returns (status, bytes) for the Prewarmer"""
+    url = item['url']
+    format_type = item.get('format', 'mp3')
+    best = bool(item.get('best'))
+    resolution = item.get('target_resolution' if best else 'resolution', '')
+    format_id = item.get('format_id', '')
+    audio_quality = item.get('audio_quality', '')
+    normalize = bool(item.get('normalize')) and format_type != 'mp4'
+    tags = bool(item.get('tags'))
+    cap_bitrate = item.get('cap_bitrate', True) is not False
+    reporter = progress_store.reporter(progress_store.new_job_id())
+    
+    try:
+        if metadata_only:
+            extract_info(url, reporter)
+            return 'warmed', 0
+        
+        cache_key = request_key(url, format_type, resolution, format_id, audio_quality, best, normalize, tags, cap_bitrate)
+        if not cache_key:
+            raise ValueError("No video ID in URL")
+        
+        def download(temp_dir, video_info):
+            return download_media(url, format_type, temp_dir, reporter, resolution, format_id, audio_quality,
+                                  best=best, normalize=normalize, tags=tags, cap_bitrate=cap_bitrate, video_info=video_info)
+        
+        entry, coalesced = coalescer.run(
+            cache_key,
+            lambda: build_artifact(cache_key, url, format_type, reporter, download),
+            lambda: artifact_cache.lookup(cache_key)
+        )
+        return ('cached' if coalesced else 'warmed'), entry['size']
+    except DownloadFailed as e:
+        raise ValueError(f"{e.error}: {e.details}")
+    finally:
+        reporter.finish()
+
+def prewarm_is_cached(item, metadata_only=False):
+    if metadata_only:
+        return metadata_cache.get(downloader.extract_video_id(item['url'])) is not None
+    cache_key = request_key(item['url'], item.get('format', 'mp3'),
+                            item.get('target_resolution' if item.get('best') else 'resolution', ''),
+                            item.get('format_id', ''), item.get('audio_quality', ''), bool(item.get('best')),
+                            bool(item.get('normalize')) and item.get('format', 'mp3') != 'mp4', bool(item.get('tags')),
+                            item.get('cap_bitrate', True) is not False)
+    return bool(cache_key) and artifact_cache.get(cache_key) is not None
+
+@app.route('/admin/prewarm', methods=['POST'])
+def start_prewarm():
+    """Warm the metadata and artifact caches in the background
+    
+    JSON body: ``items`` ([{url, format, resolution, format_id, audio_quality, normalize, tags, cap_bitrate}]),
+    ``urls`` with ``format``, or ``replay_log: true`` to replay this server's
+    app.log (``top`` most requested); plus ``concurrency``, ``rate``
+    (upstream requests per second) and ``metadata_only``.
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    body = request.get_json(silent=True) or {}
+    if body.get('replay_log'):
+        try:
+            with open('app.log', errors='replace') as f:
+                items = items_from_log(f, int(body['top']) if body.get('top') else None)
+        except (OSError, ValueError) as e:
+            return jsonify({"error": "Unable to replay app.log", "details": str(e)}), 400
+    elif body.get('urls'):
+        items = items_from_urls(body['urls'], body.get('format', 'mp3'))
+    else:
+        items = body.get('items') or []
+    
+    items = [{**item, 'audio_quality': downloader.parse_audio_quality(item.get('audio_quality'))[0]}
+             for item in items
+             if isinstance(item, dict)
+             and downloader.validate_youtube_url(item.get('url', ''))
+             and item.get('format', 'mp3') in downloader.supported_formats]
+    items = [item for item in items if item['audio_quality'] is not None]
+    if not items:
+        return jsonify({"error": "No valid items to prewarm"}), 400
+    
+    metadata_only = bool(body.get('metadata_only'))
+    try:
+        concurrency = min(int(body.get('concurrency', 2)), PREWARM_MAX_CONCURRENCY)
+        rate = float(body.get('rate', 0.5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency and rate must be numbers"}), 400
+    
+    job_id = f"prewarm-{progress_store.new_job_id()[:16]}"
+    prewarmer = Prewarmer(
+        lambda item: prewarm_item(item, metadata_only),
+        lambda item: prewarm_is_cached(item, metadata_only),
+        concurrency, rate
+    )
+    
+    def run():
+        stats = prewarmer.run(items, lambda state: progress_store.write(job_id, state))
+        logger.info(f"Prewarm {job_id} finished: {stats['warmed']} warmed, {stats['cached']} cached, "
+                    f"{stats['failed']} failed, {stats['bytes_warmed']} bytes")
+    
+    threading.Thread(target=run, daemon=True).start()
+    logger.info(f"Prewarm {job_id} started: {len(items)} items, concurrency={concurrency}, rate={rate}/s")
+    return jsonify({"job_id": job_id, "items": len(items)}), 202
+
+@app.route('/admin/prewarm/<job_id>', methods=['GET'])
+def prewarm_status(job_id):
+    """Progress and totals of a prewarm job"""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    state = progress_store.read(job_id) if progress_store.valid_job_id(job_id) else None
+    if state is None:
+        return jsonify({"error": "Unknown prewarm job"}), 404
+    return jsonify({"job_id": job_id, **state})
+
+@app.route('/admin/stats', methods=['GET'])
+def cache_stats():
+    """Hit ratios, evictions, resident bytes, entry ages and savings per cache layer
+    
+    Counters are shared by all workers of this node since it started.
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    
+    metadata = metadata_cache.report()
+    stream = stream_stats.snapshot()
+    stream['seconds_saved'] = round(stream['hits'] * metadata['extract_seconds'] / metadata['extractions'], 1) if metadata['extractions'] else 0
+    negative = negative_cache.report()
+    negative['seconds_saved'] = round(negative['hits'] * metadata['extract_seconds'] / metadata['extractions'], 1) if metadata['extractions'] else 0
+    
+    return jsonify({
+        "layers": {
+            "metadata": metadata,
+            "negative": negative,
+            "loudness": loudness_cache.report(),
+            "stream_url": stream,
+            "artifact": artifact_cache.report(),
+        },
+        "in_flight": coalescer.in_flight,
+        "coalescing": coalescer.stats.snapshot(),
+        "transcode": transcode_executor.report(),
+    })
+
 @app.before_request
 def handle_preflight():
     """Handle CORS preflight requests"""
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+Artifact cache for finished downloads
+Finished files are published atomically under a key derived from the
+request (video ID, format, variant, pipeline version) and evicted by total
+size according to a pluggable policy (see cache_policy). An optional
+RAM-backed hot tier holds in-progress work and frequently read artifacts
+in front of the disk tier, and an optional shared store (see
+artifact_storage) lets other nodes reuse what this node produced.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: one worker process only
+    fcntl = None
+
+from artifact_index import ArtifactIndex, file_checksum
+from artifact_storage import DEFAULT_PART_SIZE
+from cache_policy import CountMinSketch, create_policy
+from cache_stats import CacheStats, age_histogram
+
+logger = logging.getLogger(__name__)
+
+# Bump when the download/transcode pipeline changes its output, so old
+# artifacts are no longer served
+PIPELINE_VERSION = '2'
+
+
+class StorageTier:
+    """One place artifact data can live (``objects/``, ``tmp/``, ``work/``)"""
+
+    def __init__(self, name, root):
+        self.name = name
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.work_dir = os.path.join(root, 'work')
+        for path in (self.objects_dir, self.tmp_dir, self.work_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def data_path(self, key, ext):
+        return os.path.join(self.objects_dir, key[:2], f"{key}.{ext}")
+
+    def holds(self, path):
+        return os.path.abspath(path).startswith(os.path.abspath(self.objects_dir) + os.sep)
+
+    def place(self, src_path, key, ext, move=True):
+        """Stage ``src_path`` in this tier's tmp directory and rename it into place
+
+        With ``move`` the source is renamed when it is on the same
+        filesystem; otherwise (or across filesystems) it is copied and the
+        caller removes the source.
+        """
+        data_path = self.data_path(key, ext)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+        staged = os.path.join(self.tmp_dir, f"{key}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            if not move:
+                raise OSError
+            os.replace(src_path, staged)
+        except OSError:
+            shutil.copyfile(src_path, staged)
+        os.replace(staged, data_path)
+        return data_path
+
+
+class ArtifactCache:
+    """Size-bounded cache of finished files on local disk
+
+    Layout: ``<cache_dir>/objects/<key[:2]>/<key>.<ext>``, indexed in
+    ``<cache_dir>/index.sqlite3`` (see artifact_index). The index row is
+    written last, so an artifact only becomes visible once its data is
+    complete. Startup reads the index instead of walking the cache
+    directory. Every worker process runs its own policy over the artifacts
+    it published or read, and publishing happens under a file lock
+    (``<cache_dir>/index.lock``). The index keeps the node's total size, so
+    after its policy has had its say a publishing worker evicts the least
+    recently accessed rows, whoever published them, until the node is back
+    under ``max_bytes``.
+
+    With a hot tier (``hot_dir``, e.g. on tmpfs) new artifacts are published
+    there and its own policy bounds it to ``hot_max_bytes``; artifacts it
+    lets go are demoted to the disk tier, and disk artifacts read at least
+    ``promote_hits`` times are promoted back. Metadata always stays on disk,
+    so ``max_bytes`` bounds both tiers together. Moves happen in the
+    background; a reader holding the old file keeps reading it.
+
+    With a ``shared`` store (an ArtifactStorage) every published artifact
+    is also uploaded there in the background, metadata last, and
+    ``lookup`` falls back to fetching artifacts other nodes uploaded. The
+    shared store is never evicted from here; expire it with a bucket
+    lifecycle rule.
+    """
+
+    # Entry fields that only make sense on the node holding the file
+    LOCAL_FIELDS = ('key', 'path', 'ext', 'size', 'checksum', 'probe', 'created', 'last_access')
+
+    def __init__(self, cache_dir, max_bytes, policy='tinylfu', hot_dir=None, hot_max_bytes=0, promote_hits=2,
+                 shared=None, probe=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.cold = StorageTier('cold', cache_dir)
+        self.objects_dir = self.cold.objects_dir
+        self.tmp_dir = self.cold.tmp_dir
+        self.policy = create_policy(policy, max_bytes)
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> entry
+
+        self.hot = None
+        self.hot_max_bytes = hot_max_bytes
+        self.promote_hits = promote_hits
+        if hot_dir and hot_max_bytes > 0:
+            self.hot = StorageTier('hot', hot_dir)
+            self.hot_policy = create_policy(policy, hot_max_bytes)
+            self.reads = CountMinSketch()
+        self._pending_moves = []  # (key, tier) decided under the lock, applied outside it
+        self.shared = shared
+        self.probe = probe  # path -> media summary (ffprobe), stored with each artifact
+        self.index = ArtifactIndex(os.path.join(cache_dir, 'index.sqlite3'))
+        self._lock_path = os.path.join(cache_dir, 'index.lock')
+        self.stats = CacheStats((
+            'hits', 'misses', 'coalesced', 'remote_fetches',
+            'evictions_capacity', 'evictions_integrity', 'evictions_missing',
+            'promotions', 'demotions', 'bytes_saved', 'seconds_saved', 'bytes_produced',
+        ))
+
+        self._load()
+        self._apply_moves(self._take_pending_moves())
+
+    @staticmethod
+    def make_key(video_id, format_type, variant='', audio_quality='', clip=None):
+        """Cache key for one output of the pipeline"""
+        parts = [video_id, format_type, variant or '', audio_quality or '', list(clip) if clip else None, PIPELINE_VERSION]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    @property
+    def total_bytes(self):
+        return self.index.total_bytes()
+
+    @property
+    def hot_bytes(self):
+        return self.hot_policy.total_bytes if self.hot else 0
+
+    def work_dir(self, fallback_dir):
+        """New scratch directory for an in-progress download
+
+        Uses the hot tier while its filesystem has at least a quarter of
+        ``hot_max_bytes`` free, so finished files are published with a
+        rename; otherwise ``fallback_dir`` (TEMP_FOLDER).
+        """
+        if self.hot:
+            try:
+                if shutil.disk_usage(self.hot.root).free >= self.hot_max_bytes // 4:
+                    return tempfile.mkdtemp(dir=self.hot.work_dir)
+            except OSError:
+                pass
+        return tempfile.mkdtemp(dir=fallback_dir)
+
+    def _tier_of(self, entry):
+        return self.hot if self.hot and self.hot.holds(entry['path']) else self.cold
+
+    def _load(self):
+        """Rebuild the in-memory state from the index, oldest access first"""
+        if not len(self.index):
+            self._import_legacy_metadata()
+        self.verify()
+        with self._node_lock(), self._lock:
+            self._sync()
+
+    @contextmanager
+    def _node_lock(self):
+        """Exclusive across the worker processes sharing this cache directory
+
+        Taken before ``self._lock``, never while holding it.
+        """
+        with open(self._lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _sync(self):
+        """Load every indexed artifact into this process's entries and policies
+
+        Run once at startup, oldest access first; whatever that pushes over
+        ``max_bytes`` is evicted. Afterwards each request only looks up the
+        rows it needs. Call with ``_node_lock`` and ``_lock`` held.
+        """
+        victims = []
+        for entry in self.index.all():
+            victims.extend(self._track(entry))
+        for victim in victims:
+            self._drop(victim, 'capacity')
+
+    def _import_legacy_metadata(self):
+        """One-time import of the per-artifact JSON files older versions wrote"""
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    meta_path = os.path.join(root, name)
+                    try:
+                        with open(meta_path) as f:
+                            entry = json.load(f)
+                        entry['size'] = os.path.getsize(entry['path'])
+                        self.index.put(entry)
+                    except (OSError, ValueError, KeyError):
+                        pass
+                    try:
+                        os.remove(meta_path)
+                    except OSError:
+                        pass
+
+    def verify(self, full=False):
+        """Check indexed artifacts against their files and drop broken ones
+
+        The quick check (run at startup) costs one stat per artifact and
+        catches missing or truncated files, e.g. a tmpfs hot tier after a
+        reboot. ``full`` also recomputes every checksum. Returns the number
+        of artifacts dropped.
+        """
+        dropped = 0
+        for entry in self.index.all():
+            try:
+                intact = os.path.getsize(entry['path']) == entry['size']
+                if intact and full and entry.get('checksum'):
+                    intact = file_checksum(entry['path']) == entry['checksum']
+            except OSError:
+                intact = False
+            if not intact:
+                dropped += 1
+                self.stats.incr('evictions_integrity')
+                with self._lock:
+                    self._drop(entry['key'])
+                try:
+                    os.remove(entry['path'])
+                except OSError:
+                    pass
+        return dropped
+
+    def get(self, key):
+        """Return the cached entry (path, title, ext, size, probe) or None"""
+        with self._lock:
+            # Misses count too: frequency decides what is worth keeping
+            self.policy.record(key)
+            entry = self._entries.get(key)
+            known = entry is not None and os.path.exists(entry['path'])
+
+        if not known and not self._adopt(key):
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None  # evicted in the meantime
+            self.policy.touch(key)
+            entry['last_access'] = time.time()
+            if self.hot:
+                self._record_read(key, entry)
+            result = dict(entry)
+
+        self.index.touch(key, result['last_access'])
+        self._run_pending_moves()
+        return result
+
+    def _adopt(self, key):
+        """Pick up ``key``'s row, maybe published, moved or evicted by another worker process
+
+        One index lookup. Returns False when there is no row, or its file
+        is gone (then the row is dropped too).
+        """
+        row = self.index.get(key)
+        if row is not None and not os.path.exists(row['path']):
+            with self._node_lock(), self._lock:
+                # Read again: it may have moved between tiers or been republished meanwhile
+                row = self.index.get(key)
+                if row is not None and not os.path.exists(row['path']):
+                    self._drop(key, 'missing', row)
+                    return False
+
+        with self._lock:
+            if row is None:
+                self._forget(key)
+                return False
+            current = self._entries.get(key)
+            if current is not None and current['size'] == row['size']:
+                current['path'] = row['path']
+                return True
+            # Another worker published it: if this policy would not admit it,
+            # serve it anyway and leave its eviction to the node-wide limit
+            victims = [victim for victim in self._track(row) if victim != key]
+        if victims:
+            with self._node_lock(), self._lock:
+                for victim in victims:
+                    self._drop(victim, 'capacity')
+        return True
+
+    def _record_read(self, key, entry):
+        """Count a read and promote disk artifacts that have become popular"""
+        self.reads.increment(key)
+        self.hot_policy.record(key)
+        if key in self.hot_policy:
+            self.hot_policy.touch(key)
+        elif self.reads.estimate(key) >= self.promote_hits:
+            self._hot_insert(key, entry['size'])
+
+    def _hot_insert(self, key, size):
+        """Offer ``key`` to the hot policy; returns True if it was admitted
+
+        Anything the hot policy evicts to make room is queued for demotion.
+        """
+        if size > self.hot_max_bytes:
+            return False
+        for victim in self.hot_policy.insert(key, size):
+            self._pending_moves.append((victim, self.cold))
+        admitted = key in self.hot_policy
+        if admitted and key in self._entries and not self.hot.holds(self._entries[key]['path']):
+            self._pending_moves.append((key, self.hot))
+        return admitted
+
+    def record_serve(self, status, entry):
+        """Count how a request was answered: 'HIT', 'COALESCED', 'REMOTE' or 'MISS'
+
+        Anything but a miss saved the upstream download and transcode,
+        estimated by the artifact's size and the time it took to build.
+        """
+        if status == 'MISS':
+            self.stats.incr('misses')
+            self.stats.incr('bytes_produced', entry['size'])
+            return
+        self.stats.incr('hits')
+        if status == 'COALESCED':
+            self.stats.incr('coalesced')
+        elif status == 'REMOTE':
+            self.stats.incr('remote_fetches')
+        self.stats.incr('bytes_saved', entry['size'])
+        self.stats.incr('seconds_saved', entry.get('build_seconds') or 0)
+
+    def report(self):
+        """Counters plus entries, resident bytes per tier and entry ages, from the index"""
+        data = self.stats.snapshot()
+        entries = self.index.all()
+        hot = [e for e in entries if self.hot and self.hot.holds(e['path'])]
+        data.update(
+            entries=len(entries),
+            resident_bytes=sum(e['size'] for e in entries),
+            hot_entries=len(hot),
+            hot_resident_bytes=sum(e['size'] for e in hot),
+            max_bytes=self.max_bytes,
+            hot_max_bytes=self.hot_max_bytes if self.hot else 0,
+            age=age_histogram(e.get('created') for e in entries),
+        )
+        return data
+
+    def lookup(self, key):
+        """Like ``get``, but also fetches the artifact from the shared store"""
+        return self.get(key) or self.fetch_shared(key)
+
+    @staticmethod
+    def _shared_name(key, ext):
+        return f"{key[:2]}/{key}.{ext}"
+
+    def fetch_shared(self, key):
+        """Copy an artifact another node uploaded into this cache; None if absent"""
+        if not self.shared:
+            return None
+        try:
+            data = self.shared.get_bytes(self._shared_name(key, 'json'))
+            if data is None:
+                return None
+            remote = json.loads(data)
+        except Exception:
+            return None
+
+        work_dir = self.work_dir(self.cold.work_dir)
+        try:
+            local_path = os.path.join(work_dir, f"{key}.{remote['ext']}")
+            size = self.shared.download(self._shared_name(key, remote['ext']), local_path)
+            if size != remote['size']:
+                return None
+            meta = {k: v for k, v in remote.items() if k not in self.LOCAL_FIELDS}
+            entry = self.publish(key, local_path, meta, share=False)
+            if remote.get('checksum') and entry['checksum'] != remote['checksum']:
+                with self._lock:
+                    self._drop(key, 'integrity')
+                return None
+            entry['fetched'] = True
+            return entry
+        except Exception:
+            return None
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _share(self, entry):
+        """Upload a published artifact to the shared store, metadata last"""
+        try:
+            # Open before anything can move or evict it; the descriptor stays valid
+            f = open(entry['path'], 'rb', buffering=DEFAULT_PART_SIZE)
+        except OSError:
+            return
+
+        def upload():
+            try:
+                with f:
+                    self.shared.put_file(self._shared_name(entry['key'], entry['ext']), f)
+                meta = {k: v for k, v in entry.items() if k != 'path'}
+                self.shared.put_bytes(self._shared_name(entry['key'], 'json'), json.dumps(meta).encode())
+            except Exception as e:
+                logger.warning(f"Failed to upload artifact {entry['key']} to the shared store: {e}")
+
+        threading.Thread(target=upload, daemon=True).start()
+
+    def publish(self, key, src_path, meta, share=True):
+        """Move a finished file into the cache and return its entry
+
+        The data is staged in the target tier's own tmp directory and
+        renamed into place, so readers never see a partial file. Checksum
+        and probe run before taking the node lock. Once the policy has
+        evicted what it chose, rows are evicted oldest access first until
+        the node is under ``max_bytes``.
+        """
+        ext = os.path.splitext(src_path)[1].lstrip('.')
+        size, checksum, probe = os.path.getsize(src_path), file_checksum(src_path), self._probe(src_path)
+        with self._node_lock():
+            tier = self.cold
+            with self._lock:
+                if self.hot:
+                    self.hot_policy.record(key)
+                    if self._hot_insert(key, size):
+                        tier = self.hot
+            data_path = tier.place(src_path, key, ext)
+
+            entry = {
+                **meta,
+                'key': key,
+                'path': data_path,
+                'ext': ext,
+                'size': size,
+                'checksum': checksum,
+                'probe': probe,
+                'created': time.time(),
+                'last_access': time.time(),
+            }
+            self.index.put(entry)
+
+            with self._lock:
+                for victim in self._track(entry):
+                    self._drop(victim, 'capacity')
+                self._enforce_limit(key)
+        self._run_pending_moves()
+        if share and self.shared:
+            self._share(dict(entry))
+        return dict(entry)
+
+    def _probe(self, path):
+        if not self.probe:
+            return None
+        try:
+            return self.probe(path)
+        except Exception:
+            return None
+
+    def _enforce_limit(self, keep, batch=16):
+        """Evict the least recently accessed rows while the node is over ``max_bytes``
+
+        The policies only know this process's artifacts; the index's total
+        covers every worker's. ``keep`` (the artifact just published) is
+        never evicted. Call with ``_node_lock`` and ``_lock`` held.
+        """
+        excess = self.index.total_bytes() - self.max_bytes
+        while excess > 0:
+            rows = self.index.oldest(batch, exclude=keep)
+            if not rows:
+                return
+            for row in rows:
+                self._drop(row['key'], 'capacity', row)
+                excess -= row['size']
+                if excess <= 0:
+                    return
+
+    def _track(self, entry):
+        """Track an entry; returns the keys the policy evicts for it"""
+        key = entry['key']
+        self._entries[key] = entry
+
+        if self.hot and self.hot.holds(entry['path']) and key not in self.hot_policy:
+            self._hot_insert(key, entry['size'])
+
+        return self.policy.insert(key, entry['size'])
+
+    def _forget(self, key):
+        """Stop tracking a key without touching its row or file; returns its entry"""
+        self.policy.remove(key)
+        if self.hot:
+            self.hot_policy.remove(key)
+        return self._entries.pop(key, None)
+
+    def _drop(self, key, reason=None, row=None):
+        """Remove an artifact's row and file; ``row`` is its index row if this process may not track it"""
+        self.index.remove(key)
+        entry = self._forget(key) or row
+        if entry is None:
+            return
+        if reason:
+            self.stats.incr(f"evictions_{reason}")
+        try:
+            os.remove(entry['path'])
+        except OSError:
+            pass
+
+    def _take_pending_moves(self):
+        with self._lock:
+            moves, self._pending_moves = self._pending_moves, []
+        return moves
+
+    def _run_pending_moves(self):
+        moves = self._take_pending_moves()
+        if moves:
+            threading.Thread(target=self._apply_moves, args=(moves,), daemon=True).start()
+
+    def _apply_moves(self, moves):
+        for key, tier in moves:
+            self._move(key, tier)
+
+    def _move(self, key, tier):
+        """Copy an artifact's data into ``tier``, repoint its metadata, then drop the old copy"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._tier_of(entry) is tier:
+                return
+            src_path = entry['path']
+
+        try:
+            new_path = tier.place(src_path, key, entry['ext'], move=False)
+        except OSError:
+            with self._lock:
+                if tier is self.hot:
+                    self.hot_policy.remove(key)
+                else:
+                    # Can't demote: drop it rather than overfill the hot tier
+                    self._drop(key, 'capacity')
+            return
+
+        with self._lock:
+            current = self._entries.get(key)
+            if current is None or current['path'] != src_path or not self.index.move(key, src_path, new_path):
+                # Dropped or moved again while copying
+                try:
+                    os.remove(new_path)
+                except OSError:
+                    pass
+                return
+            current['path'] = new_path
+        self.stats.incr('promotions' if tier is self.hot else 'demotions')
+        try:
+            os.remove(src_path)
+        except OSError:
+            pass
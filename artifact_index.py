@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+SQLite index of cached artifacts
+One row per artifact (key, path, size, checksum, last access, ffprobe
+summary), shared by all worker processes through WAL mode. The cache reads
+its state from here at startup and on lookup instead of walking the cache
+directory, and an artifact becomes visible when its row is written.
+Triggers keep the node's total size and entry count in a one-row table,
+so checking the size limit never scans the artifacts.
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    checksum TEXT,
+    created REAL,
+    last_access REAL,
+    meta TEXT,
+    probe TEXT
+);
+CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL,
+    entries INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0), COUNT(*) FROM artifacts;
+CREATE TRIGGER IF NOT EXISTS artifacts_insert AFTER INSERT ON artifacts BEGIN
+    UPDATE totals SET bytes = bytes + NEW.size, entries = entries + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS artifacts_delete AFTER DELETE ON artifacts BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size, entries = entries - 1;
+END;
+CREATE TRIGGER IF NOT EXISTS artifacts_resize AFTER UPDATE OF size ON artifacts BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size;
+END;
+"""
+
+# Columns of their own; every other entry field goes into the meta JSON
+COLUMNS = ('key', 'path', 'ext', 'size', 'checksum', 'created', 'last_access', 'probe')
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    """blake2b-128 hex digest of a file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactIndex:
+    """Artifact rows keyed by cache key
+
+    Connections are per thread and per process, so an index created
+    before gunicorn forks is safe to use in every worker.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _to_entry(row):
+        key, path, ext, size, checksum, created, last_access, meta, probe = row
+        return {
+            **json.loads(meta or '{}'),
+            'key': key,
+            'path': path,
+            'ext': ext,
+            'size': size,
+            'checksum': checksum,
+            'created': created,
+            'last_access': last_access,
+            'probe': json.loads(probe) if probe else None,
+        }
+
+    def put(self, entry):
+        """Insert or replace the row for ``entry['key']`` in one statement
+
+        An upsert rather than INSERT OR REPLACE, whose implicit delete
+        would bypass the totals trigger.
+        """
+        meta = {k: v for k, v in entry.items() if k not in COLUMNS}
+        self._db().execute(
+            'INSERT INTO artifacts (key, path, ext, size, checksum, created, last_access, meta, probe) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET path = excluded.path, ext = excluded.ext, size = excluded.size, '
+            'checksum = excluded.checksum, created = excluded.created, last_access = excluded.last_access, '
+            'meta = excluded.meta, probe = excluded.probe',
+            (entry['key'], entry['path'], entry['ext'], entry['size'], entry.get('checksum'),
+             entry.get('created'), entry.get('last_access'), json.dumps(meta),
+             json.dumps(entry['probe']) if entry.get('probe') else None)
+        )
+
+    def get(self, key):
+        row = self._db().execute('SELECT * FROM artifacts WHERE key = ?', (key,)).fetchone()
+        return self._to_entry(row) if row else None
+
+    def all(self):
+        """Every entry, least recently accessed first"""
+        rows = self._db().execute('SELECT * FROM artifacts ORDER BY last_access').fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def oldest(self, limit, exclude=None):
+        """The ``limit`` least recently accessed entries, other than ``exclude``"""
+        rows = self._db().execute('SELECT * FROM artifacts WHERE key IS NOT ? ORDER BY last_access LIMIT ?',
+                                  (exclude, limit)).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def total_bytes(self):
+        """Size of every indexed artifact together"""
+        return self._db().execute('SELECT bytes FROM totals').fetchone()[0]
+
+    def touch(self, key, last_access):
+        self._db().execute('UPDATE artifacts SET last_access = ? WHERE key = ?', (last_access, key))
+
+    def move(self, key, old_path, new_path):
+        """Repoint a row; False when it changed under us (dropped or moved elsewhere)"""
+        cursor = self._db().execute('UPDATE artifacts SET path = ? WHERE key = ? AND path = ?', (new_path, key, old_path))
+        return cursor.rowcount == 1
+
+    def remove(self, key):
+        self._db().execute('DELETE FROM artifacts WHERE key = ?', (key,))
+
+    def __len__(self):
+        return self._db().execute('SELECT entries FROM totals').fetchone()[0]
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Shared object storage for artifacts
+Backends behind one small interface, so every node behind the load
+balancer can serve an artifact that another node produced: a directory
+(e.g. a shared volume) or an S3-compatible bucket (AWS S3, MinIO, R2)
+"""
+
+import os
+import shutil
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for the s3 backend
+    boto3 = None
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024  # S3 minimum is 5MB for all but the last part
+
+
+class ArtifactStorage:
+    """Interface for artifact storage backends
+
+    Objects are addressed by relative names such as ``ab/<key>.mp3``.
+    Uploads are streamed from a file object and reads are by byte range, so
+    neither side holds a whole artifact in memory.
+    """
+
+    def put_file(self, name, fileobj):
+        """Store the rest of ``fileobj`` under ``name``"""
+        raise NotImplementedError
+
+    def put_bytes(self, name, data):
+        raise NotImplementedError
+
+    def get_bytes(self, name):
+        """Whole (small) object, or None when it doesn't exist"""
+        raise NotImplementedError
+
+    def size(self, name):
+        """Object size in bytes, or None when it doesn't exist"""
+        raise NotImplementedError
+
+    def read_range(self, name, start, length):
+        """Up to ``length`` bytes starting at offset ``start``"""
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def iter_range(self, name, start=0, end=None, chunk_size=DEFAULT_PART_SIZE):
+        """Yield the bytes from ``start`` up to ``end`` (exclusive) in ranged reads"""
+        if end is None:
+            end = self.size(name)
+            if end is None:
+                raise FileNotFoundError(name)
+        offset = start
+        while offset < end:
+            data = self.read_range(name, offset, min(chunk_size, end - offset))
+            if not data:
+                raise IOError(f"Short read from {name} at {offset}")
+            offset += len(data)
+            yield data
+
+    def download(self, name, dest_path):
+        """Copy an object to a local file and return its size"""
+        written = 0
+        with open(dest_path, 'wb') as f:
+            for data in self.iter_range(name):
+                f.write(data)
+                written += len(data)
+        return written
+
+
+class LocalDiskStorage(ArtifactStorage):
+    """Objects as files under ``root`` (a local disk or a shared mount)"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid object name: {name}")
+        return path
+
+    def _write(self, name, write):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def put_file(self, name, fileobj):
+        self._write(name, lambda f: shutil.copyfileobj(fileobj, f, DEFAULT_PART_SIZE))
+
+    def put_bytes(self, name, data):
+        self._write(name, lambda f: f.write(data))
+
+    def get_bytes(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def size(self, name):
+        try:
+            return os.path.getsize(self._path(name))
+        except OSError:
+            return None
+
+    def read_range(self, name, start, length):
+        with open(self._path(name), 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+
+class S3Storage(ArtifactStorage):
+    """Objects in an S3-compatible bucket
+
+    ``endpoint_url`` points at MinIO or another S3-compatible service;
+    credentials come from the usual AWS environment variables. Files are
+    uploaded as a multipart upload of ``part_size`` parts, read straight
+    from the file, so memory stays at one part per upload.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, part_size=DEFAULT_PART_SIZE):
+        if boto3 is None:
+            raise RuntimeError("The s3 artifact store needs boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.part_size = part_size
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            config=BotoConfig(retries={'max_attempts': 5, 'mode': 'standard'}, s3={'addressing_style': 'path'}),
+        )
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def put_file(self, name, fileobj):
+        key = self._key(name)
+        data = fileobj.read(self.part_size)
+        if len(data) < self.part_size:
+            # Fits in one part, a plain PUT is cheaper
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+            return
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+        parts = []
+        try:
+            while data:
+                number = len(parts) + 1
+                result = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data)
+                parts.append({'PartNumber': number, 'ETag': result['ETag']})
+                data = fileobj.read(self.part_size)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def put_bytes(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data)
+
+    def get_bytes(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name))['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def size(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))['ContentLength']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404', 'NotFound'):
+                return None
+            raise
+
+    def read_range(self, name, start, length):
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(name), Range=f"bytes={start}-{start + length - 1}"
+        )
+        return response['Body'].read()
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+
+def create_storage(backend, path='', bucket='', prefix='', endpoint_url=None, region=None):
+    """Build a storage backend by name ('local' or 's3'); '' means none"""
+    if not backend:
+        return None
+    if backend == 'local':
+        return LocalDiskStorage(path)
+    if backend == 's3':
+        return S3Storage(bucket, prefix, endpoint_url, region)
+    raise ValueError(f"Unknown artifact store '{backend}', expected 'local' or 's3'")
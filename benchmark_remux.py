@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+CPU cost of bringing a download into MP4
+Compares what FFmpegVideoConvertor did for every non-MP4 download (a full
+re-encode) with the stream-copy remux MP4FastPathPP uses when the codecs
+fit, in ffmpeg CPU seconds (user + system) per minute of media
+
+Usage:
+    python benchmark_remux.py                       # synthetic 1080p H.264/AAC in MKV
+    python benchmark_remux.py --duration 300 --height 720
+    python benchmark_remux.py --input "Some Video.webm"
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+
+from ffmpeg_pipeline import FFmpegPipeline, FFmpegError
+
+
+def child_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(step):
+    """Run ``step`` and return (child CPU seconds, wall seconds)"""
+    cpu, wall = child_cpu_seconds(), time.monotonic()
+    step()
+    return child_cpu_seconds() - cpu, time.monotonic() - wall
+
+
+def make_source(pipeline, path, duration, height):
+    """A test clip shaped like a merged YouTube download"""
+    width = height * 16 // 9
+    pipeline.run([
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=30:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k', '-shortest', path,
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU seconds per media minute: re-encode vs remux to MP4')
+    parser.add_argument('--input', help='Downloaded file to convert (default: generate a synthetic clip)')
+    parser.add_argument('--duration', type=int, default=120, help='Synthetic clip length in seconds (default: 120)')
+    parser.add_argument('--height', type=int, default=1080, help='Synthetic clip height (default: 1080)')
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("❌ ffmpeg/ffprobe not found in PATH")
+        return 1
+
+    pipeline = FFmpegPipeline()
+    workdir = tempfile.mkdtemp(prefix='remux_bench_')
+    try:
+        source = args.input
+        if not source:
+            source = os.path.join(workdir, 'source.mkv')
+            print(f"Generating {args.duration}s {args.height}p H.264/AAC source...")
+            make_source(pipeline, source, args.duration, args.height)
+
+        probe = pipeline.probe(source) or {}
+        minutes = (probe.get('duration') or 0) / 60
+        if not minutes:
+            print(f"❌ Could not read the duration of {source}")
+            return 1
+        codecs = ', '.join(s.get('codec_name', '?') for s in probe.get('streams', []))
+        print(f"Source: {os.path.basename(source)} ({probe.get('format')}; {codecs}; {minutes:.2f} min)")
+
+        # Same arguments as yt-dlp's FFmpegVideoConvertorPP / FFmpegVideoRemuxerPP
+        steps = {
+            'before (re-encode)': ['-i', source, '-map', '0', '-dn', '-ignore_unknown', os.path.join(workdir, 'converted.mp4')],
+            'after (remux)': ['-i', source, '-map', '0', '-dn', '-ignore_unknown', '-c', 'copy',
+                              '-movflags', '+faststart', os.path.join(workdir, 'remuxed.mp4')],
+        }
+
+        results = {}
+        print(f"\n{'path':<20} {'cpu s':>8} {'wall s':>8} {'cpu s/min':>10}")
+        for name, ffmpeg_args in steps.items():
+            try:
+                cpu, wall = measure(lambda: pipeline.run(ffmpeg_args))
+            except FFmpegError as e:
+                print(f"{name:<20} failed: {e}")
+                continue
+            results[name] = cpu / minutes
+            print(f"{name:<20} {cpu:>8.2f} {wall:>8.2f} {cpu / minutes:>10.3f}")
+        print(f"{'after (already mp4)':<20} {0:>8.2f} {0:>8.2f} {0:>10.3f}")
+
+        before, after = results.get('before (re-encode)'), results.get('after (remux)')
+        if before and after:
+            print(f"\nRemux uses {before / max(after, 1e-6):.0f}x less CPU per downloaded minute")
+        return 0
+    except FFmpegError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Aggregate transcode throughput with and without ffmpeg thread budgets
+Runs the same batch of concurrent transcodes three times: every job started
+at once with ffmpeg's default threading (one thread per core each, as
+before), through a TranscodeExecutor's bounded slots with default
+threading, and through the executor with a thread budget per job. The
+middle run separates what the slot limit gains from what the budget adds.
+Reports media minutes transcoded per wall-clock second, CPU time and
+context switches of the ffmpeg processes
+
+Usage:
+    python benchmark_threads.py                      # 2x CPU count video jobs
+    python benchmark_threads.py --jobs 16 --kind mp3
+    python benchmark_threads.py --duration 60 --height 720
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_pipeline import FFmpegPipeline, FFmpegError
+from transcode_executor import TranscodeExecutor
+
+
+class SlotsOnlyExecutor(TranscodeExecutor):
+    """Bounded slots, but ffmpeg keeps its default threading"""
+
+    def _threads(self, jobs, duration=None):
+        return None
+
+
+def children_usage():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_nvcsw + usage.ru_nivcsw
+
+
+def make_source(pipeline, path, kind, duration, height):
+    if kind == 'mp3':
+        pipeline.run(['-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+                      '-c:a', 'aac', '-b:a', '192k', path], lane='light')
+        return
+    width = height * 16 // 9
+    pipeline.run([
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=30:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path,
+    ], lane='light')
+
+
+def job_args(kind, source, output):
+    if kind == 'mp3':
+        return ['-i', source, '-vn', '-c:a', 'libmp3lame', '-b:a', '320k', output]
+    return ['-i', source, '-c:v', 'libx264', '-preset', 'veryfast', '-an', output]
+
+
+def run_batch(pipeline, kind, source, workdir, jobs, duration):
+    """All jobs submitted at once; returns (wall seconds, cpu seconds, context switches)"""
+    ext = 'mp3' if kind == 'mp3' else 'mp4'
+    cpu, switches = children_usage()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(pipeline.run, job_args(kind, source, os.path.join(workdir, f'out{i}.{ext}')), 'heavy', duration)
+            for i in range(jobs)
+        ]
+        for future in futures:
+            future.result()
+    wall = time.monotonic() - started
+    end_cpu, end_switches = children_usage()
+    return wall, end_cpu - cpu, end_switches - switches
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Concurrent transcode throughput: no executor, bounded slots, slots + thread budget')
+    parser.add_argument('--jobs', type=int, default=2 * cpus, help=f'Concurrent jobs (default: {2 * cpus})')
+    parser.add_argument('--kind', choices=['video', 'mp3'], default='video', help='H.264 re-encode or MP3 encode')
+    parser.add_argument('--duration', type=int, default=30, help='Source length in seconds (default: 30)')
+    parser.add_argument('--height', type=int, default=1080, help='Video source height (default: 1080)')
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg'):
+        print("❌ ffmpeg not found in PATH")
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix='threads_bench_')
+    try:
+        source = os.path.join(workdir, 'source.m4a' if args.kind == 'mp3' else 'source.mp4')
+        print(f"Generating {args.duration}s {args.kind} source, {args.jobs} jobs on {cpus} CPUs...")
+        make_source(FFmpegPipeline(), source, args.kind, args.duration, args.height)
+
+        runs = {
+            'no executor': FFmpegPipeline(),
+            'executor, default threads': FFmpegPipeline(executor=SlotsOnlyExecutor()),
+            'executor + budget': FFmpegPipeline(executor=TranscodeExecutor()),
+        }
+        minutes = args.jobs * args.duration / 60
+        print(f"\n{'mode':<26} {'wall s':>8} {'media min/s':>12} {'cpu s':>8} {'ctx switches':>13}")
+        results = {}
+        for name, pipeline in runs.items():
+            wall, cpu, switches = run_batch(pipeline, args.kind, source, workdir, args.jobs, args.duration)
+            results[name] = minutes / wall
+            print(f"{name:<26} {wall:>8.2f} {minutes / wall:>12.3f} {cpu:>8.1f} {switches:>13}")
+
+        slots = results['executor, default threads'] / results['no executor'] - 1
+        budget = results['executor + budget'] / results['executor, default threads'] - 1
+        print(f"\nAggregate throughput from bounded slots: {slots:+.1%}")
+        print(f"Aggregate throughput from thread budgets on top: {budget:+.1%}")
+        return 0
+    except FFmpegError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Admission and eviction policies for the artifact cache
+Policies only track keys and sizes; the cache owns the files and removes
+whatever a policy reports as evicted
+"""
+
+import hashlib
+from collections import OrderedDict
+
+
+class CountMinSketch:
+    """Approximate access frequencies with 4-bit counters and periodic aging
+
+    Counters are halved after ``sample_size`` increments, so popularity
+    decays and yesterday's hits don't pin an entry forever.
+    """
+
+    MAX_COUNT = 15
+
+    def __init__(self, width=16384, depth=4, sample_size=None):
+        self.width = width
+        self.depth = depth
+        self.sample_size = sample_size or width * 10
+        self.rows = [bytearray(width) for _ in range(depth)]
+        self.additions = 0
+
+    def _indexes(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[i * 4:(i + 1) * 4], 'little') % self.width for i in range(self.depth)]
+
+    def increment(self, key):
+        indexes = self._indexes(key)
+        current = min(row[i] for row, i in zip(self.rows, indexes))
+        if current < self.MAX_COUNT:
+            # Conservative update: only raise the counters at the minimum
+            for row, i in zip(self.rows, indexes):
+                if row[i] == current:
+                    row[i] += 1
+
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+
+    def estimate(self, key):
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+    def _age(self):
+        for row in self.rows:
+            for i in range(self.width):
+                row[i] >>= 1
+        self.additions //= 2
+
+
+class LRUPolicy:
+    """Plain least-recently-used by total bytes"""
+
+    name = 'lru'
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size, least recently used first
+        self.total_bytes = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def record(self, key):
+        """Called for every lookup, hit or miss"""
+
+    def touch(self, key):
+        self.entries.move_to_end(key)
+
+    def insert(self, key, size):
+        """Add a key and return the keys that must be evicted
+
+        The newest key is never evicted by its own insert, so the file that
+        was just published can still be served.
+        """
+        self.remove(key)
+        self.entries[key] = size
+        self.total_bytes += size
+
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            victim, victim_size = self.entries.popitem(last=False)
+            self.total_bytes -= victim_size
+            evicted.append(victim)
+        return evicted
+
+    def remove(self, key):
+        size = self.entries.pop(key, None)
+        if size is not None:
+            self.total_bytes -= size
+
+
+class TinyLFUPolicy:
+    """W-TinyLFU: a small LRU window in front of a frequency-filtered main LRU
+
+    New artifacts always enter the window. When the window overflows, its
+    oldest entry is only admitted to the main segment if it has been asked
+    for more often than every main entry it would displace, so one-off
+    long-tail downloads can't push out the popular ones.
+    """
+
+    name = 'tinylfu'
+
+    def __init__(self, max_bytes, window_fraction=0.01, sketch=None):
+        self.max_bytes = max_bytes
+        self.window_max = max(1, int(max_bytes * window_fraction))
+        self.main_max = max_bytes - self.window_max
+        self.sketch = sketch or CountMinSketch()
+        self.window = OrderedDict()
+        self.main = OrderedDict()
+        self.window_bytes = 0
+        self.main_bytes = 0
+
+    def __contains__(self, key):
+        return key in self.window or key in self.main
+
+    @property
+    def total_bytes(self):
+        return self.window_bytes + self.main_bytes
+
+    def record(self, key):
+        self.sketch.increment(key)
+
+    def touch(self, key):
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.main:
+            self.main.move_to_end(key)
+
+    def insert(self, key, size):
+        self.remove(key)
+        self.window[key] = size
+        self.window_bytes += size
+
+        evicted = []
+        # Keep at least the newest entry in the window, however large
+        while self.window_bytes > self.window_max and len(self.window) > 1:
+            candidate, candidate_size = self.window.popitem(last=False)
+            self.window_bytes -= candidate_size
+            evicted.extend(self._admit(candidate, candidate_size))
+
+        # The newest entry may outgrow the window; main makes room for it
+        while self.total_bytes > self.max_bytes and self.main:
+            victim, victim_size = self.main.popitem(last=False)
+            self.main_bytes -= victim_size
+            evicted.append(victim)
+        return evicted
+
+    def _admit(self, candidate, size):
+        """Move a window candidate into main; return whatever loses
+
+        Main gets at most ``main_max`` bytes, and less while the window
+        holds more than its share, so the two never exceed ``max_bytes``.
+        """
+        room = min(self.main_max, self.max_bytes - self.window_bytes)
+        if size > room:
+            return [candidate]
+
+        victims = []
+        free = room - self.main_bytes
+        for victim, victim_size in self.main.items():
+            if free >= size:
+                break
+            victims.append(victim)
+            free += victim_size
+
+        if victims:
+            candidate_freq = self.sketch.estimate(candidate)
+            if candidate_freq <= max(self.sketch.estimate(v) for v in victims):
+                return [candidate]
+
+        for victim in victims:
+            self.main_bytes -= self.main.pop(victim)
+        self.main[candidate] = size
+        self.main_bytes += size
+        return victims
+
+    def remove(self, key):
+        if key in self.window:
+            self.window_bytes -= self.window.pop(key)
+        elif key in self.main:
+            self.main_bytes -= self.main.pop(key)
+
+
+POLICIES = {
+    LRUPolicy.name: LRUPolicy,
+    TinyLFUPolicy.name: TinyLFUPolicy,
+}
+
+
+def create_policy(name, max_bytes):
+    """Build a policy by name ('lru' or 'tinylfu')"""
+    try:
+        return POLICIES[name](max_bytes)
+    except KeyError:
+        raise ValueError(f"Unknown cache policy '{name}', expected one of: {', '.join(POLICIES)}")
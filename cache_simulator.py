@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Artifact cache policy simulator
+Replays an access log against each cache policy and reports hit ratio and
+bytes saved (bytes that did not have to be fetched and transcoded again)
+
+Usage:
+    python cache_simulator.py app.log --capacity 10G
+    python cache_simulator.py trace.txt --capacity 500M     # "key size" per line
+    python cache_simulator.py --synthetic 200000 --capacity 5G
+"""
+
+import re
+import sys
+import random
+import argparse
+
+from cache_policy import POLICIES, create_policy
+
+# Matches the request lines app.py writes to app.log (see download_request_line);
+# lines from before Normalize/Tags/Cap_Bitrate were logged match too
+DOWNLOAD_LINE = re.compile(
+    r'Download request: URL=(?P<url>\S+), Format=(?P<format>\w+), Resolution=(?P<resolution>[^,]*), '
+    r'Format_ID=(?P<format_id>[^,]*), Audio_Quality=(?P<audio_quality>[^,\s]*)'
+    r'(?:, Normalize=(?P<normalize>\w+))?(?:, Tags=(?P<tags>\w+))?(?:, Cap_Bitrate=(?P<cap_bitrate>\w+))?'
+)
+BEST_LINE = re.compile(r'Best quality download request: URL=(?P<url>\S+), Format=(?P<format>\w+), Target=(?P<target>\S+)')
+VIDEO_ID = re.compile(r'(?:v=|youtu\.be/|embed/|/v/)([\w-]{11})')
+
+# Typical artifact sizes when the log doesn't carry them
+DEFAULT_SIZES = {'mp3': 8 * 1024 ** 2, 'mp4': 60 * 1024 ** 2, 'm4a': 5 * 1024 ** 2, 'opus': 4 * 1024 ** 2}
+
+
+def download_request_line(url, format_type, resolution, format_id, audio_quality, normalize, tags, cap_bitrate):
+    """The app.log line for a /download request, as DOWNLOAD_LINE reads it back"""
+    return (f"Download request: URL={url}, Format={format_type}, Resolution={resolution}, Format_ID={format_id}, "
+            f"Audio_Quality={audio_quality}, Normalize={normalize}, Tags={tags}, Cap_Bitrate={cap_bitrate}")
+
+
+def logged_flags(match):
+    """(normalize, tags, cap_bitrate) of a DOWNLOAD_LINE match, with the defaults for older lines"""
+    return (match['normalize'] == 'True', match['tags'] == 'True', match['cap_bitrate'] != 'False')
+
+
+def parse_size(value):
+    """Parse sizes like 512M, 10G or plain bytes"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    value = value.strip().upper().rstrip('B')
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} TB"
+
+
+def read_trace(path):
+    """Yield (key, size) from an app.log or a plain "key size" trace"""
+    with open(path, errors='replace') as f:
+        for line in f:
+            match = DOWNLOAD_LINE.search(line)
+            if match:
+                video_id = VIDEO_ID.search(match['url'])
+                if video_id:
+                    fmt = match['format']
+                    variant = match['audio_quality'] or '320' if fmt == 'mp3' else match['format_id'] or match['resolution']
+                    normalize, tags, cap_bitrate = logged_flags(match)
+                    extras = ('+loudnorm' if normalize else '') + ('+tags' if tags else '')
+                    if fmt == 'mp3' and not cap_bitrate:
+                        extras += '+uncapped'
+                    yield f"{video_id.group(1)}:{fmt}:{variant}{extras}", DEFAULT_SIZES.get(fmt, DEFAULT_SIZES['mp4'])
+                continue
+
+            match = BEST_LINE.search(line)
+            if match:
+                video_id = VIDEO_ID.search(match['url'])
+                if video_id:
+                    fmt = match['format']
+                    yield f"{video_id.group(1)}:{fmt}:best:{match['target']}", DEFAULT_SIZES.get(fmt, DEFAULT_SIZES['mp4'])
+                continue
+
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                yield parts[0], int(parts[1])
+
+
+def synthetic_trace(requests, catalog=100000, popular=500, popular_share=0.6, seed=1):
+    """Mostly one-off long-tail videos plus a few hundred popular ones"""
+    rng = random.Random(seed)
+    sizes = {}
+    for _ in range(requests):
+        if rng.random() < popular_share:
+            video = f"hot{int(rng.paretovariate(1.2)) % popular}"
+        else:
+            video = f"tail{rng.randrange(catalog)}"
+        if video not in sizes:
+            sizes[video] = rng.choice(list(DEFAULT_SIZES.values()))
+        yield video, sizes[video]
+
+
+def simulate(trace, policy_name, capacity):
+    """Replay the trace and return hit statistics"""
+    policy = create_policy(policy_name, capacity)
+    stats = {'requests': 0, 'hits': 0, 'bytes_requested': 0, 'bytes_saved': 0}
+
+    for key, size in trace:
+        stats['requests'] += 1
+        stats['bytes_requested'] += size
+        policy.record(key)
+        if key in policy:
+            policy.touch(key)
+            stats['hits'] += 1
+            stats['bytes_saved'] += size
+        else:
+            policy.insert(key, size)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare artifact cache policies on an access log')
+    parser.add_argument('log', nargs='?', help='app.log or "key size" trace file')
+    parser.add_argument('--capacity', default='10G', help='Cache size, e.g. 500M or 10G (default: 10G)')
+    parser.add_argument('--synthetic', type=int, metavar='N', help='Replay N synthetic requests instead of a log')
+    parser.add_argument('--policies', default=','.join(POLICIES), help='Comma-separated policies to compare')
+    args = parser.parse_args()
+
+    if not args.log and not args.synthetic:
+        parser.error('give a log file or --synthetic N')
+
+    capacity = parse_size(args.capacity)
+    trace = list(synthetic_trace(args.synthetic) if args.synthetic else read_trace(args.log))
+    if not trace:
+        print("❌ No download requests found in the log")
+        return 1
+
+    print(f"🔍 Replaying {len(trace)} requests, {len({k for k, _ in trace})} distinct artifacts, capacity {format_bytes(capacity)}")
+    print(f"{'Policy':<10} {'Hit ratio':>10} {'Byte hit ratio':>15} {'Bytes saved':>14}")
+    for name in args.policies.split(','):
+        stats = simulate(trace, name.strip(), capacity)
+        hit_ratio = stats['hits'] / stats['requests']
+        byte_hit_ratio = stats['bytes_saved'] / stats['bytes_requested'] if stats['bytes_requested'] else 0
+        print(f"{name:<10} {hit_ratio:>9.1%} {byte_hit_ratio:>15.1%} {format_bytes(stats['bytes_saved']):>14}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
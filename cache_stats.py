@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Counters for the cache layers
+Each layer gets a fixed set of named counters in shared memory, so one
+set created before gunicorn forks (``preload_app = True``) adds up the
+traffic of every worker process
+"""
+
+import time
+import multiprocessing
+
+# Upper bounds (seconds) of the entry age histogram
+AGE_BUCKETS = (('1h', 3600), ('1d', 86400), ('7d', 7 * 86400), ('30d', 30 * 86400), ('older', float('inf')))
+
+
+class CacheStats:
+    """Named float counters for one cache layer"""
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._values = multiprocessing.Array('d', len(self.names))
+
+    def incr(self, name, amount=1):
+        with self._values.get_lock():
+            self._values[self._index[name]] += amount
+
+    def snapshot(self):
+        """Counters as a dict, plus ``hit_ratio`` when the layer has hits and misses"""
+        with self._values.get_lock():
+            values = {name: self._values[i] for name, i in self._index.items()}
+        data = {name: int(value) if float(value).is_integer() else round(value, 3) for name, value in values.items()}
+        if 'hits' in values and 'misses' in values:
+            lookups = values['hits'] + values['misses']
+            data['hit_ratio'] = round(values['hits'] / lookups, 4) if lookups else None
+        return data
+
+
+def age_histogram(timestamps, now=None):
+    """Count entries per AGE_BUCKETS bucket from their creation times"""
+    now = now or time.time()
+    histogram = {label: 0 for label, _ in AGE_BUCKETS}
+    for created in timestamps:
+        age = now - (created or now)
+        for label, limit in AGE_BUCKETS:
+            if age < limit:
+                histogram[label] += 1
+                break
+    return histogram
@@ -1,83 +1,220 @@
 /**
  * Cloudflare Workers script untuk YouTube Downloader API
  * Deploy ini ke Cloudflare Workers untuk routing dan caching
+ *
+ * With more than one backend, requests are routed by consistent hashing on
+ * the canonical video ID, so every request for a video lands on the node
+ * that already has it cached. A node that is busier than LOAD_FACTOR times
+ * the average spills over to the next node on the ring, and a node that
+ * fails is skipped for UNHEALTHY_COOLDOWN_MS.
  */
 
 addEventListener('fetch', event => {
   event.respondWith(handleRequest(event.request))
 })
 
+// Your backend server URL(s) (ganti dengan URL server Anda)
+const BACKEND_URL = 'https://your-server.com'
+const BACKENDS = [
+  BACKEND_URL,
+  // 'https://node2.your-server.com',
+  // 'https://node3.your-server.com',
+]
+
+const VIRTUAL_NODES = 128            // ring points per backend, evens out the split
+const LOAD_FACTOR = 1.25             // bounded load: max in-flight = LOAD_FACTOR x average
+const UNHEALTHY_COOLDOWN_MS = 30000  // skip a failed node this long
+const MAX_ATTEMPTS = 3               // failover tries per request
+const RETRY_STATUSES = [502, 503, 504]
+
+// Same patterns the API accepts (watch?v=, youtu.be/, shorts/, embed/)
+const VIDEO_ID_PATTERN = /(?:[?&]v=|youtu\.be\/|\/shorts\/|\/embed\/|\/v\/)([\w-]{11})/
+
+// Per-isolate state: in-flight requests and health per backend
+const inFlight = new Map()
+const unhealthyUntil = new Map()
+let ring = null
+
+// Add CORS headers
+const corsHeaders = {
+  'Access-Control-Allow-Origin': '*',
+  'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+  'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+  'Access-Control-Max-Age': '86400',
+}
+
+/** 32-bit FNV-1a with a murmur3 finalizer for a better spread */
+function hash32(text) {
+  let h = 0x811c9dc5
+  for (let i = 0; i < text.length; i++) {
+    h ^= text.charCodeAt(i)
+    h = Math.imul(h, 0x01000193)
+  }
+  h ^= h >>> 16
+  h = Math.imul(h, 0x85ebca6b)
+  h ^= h >>> 13
+  h = Math.imul(h, 0xc2b2ae35)
+  h ^= h >>> 16
+  return h >>> 0
+}
+
+function buildRing() {
+  const points = []
+  for (const backend of BACKENDS) {
+    for (let i = 0; i < VIRTUAL_NODES; i++) {
+      points.push({ hash: hash32(`${backend}#${i}`), backend })
+    }
+  }
+  return points.sort((a, b) => a.hash - b.hash)
+}
+
+/** Distinct backends in ring order starting at the key's position */
+function ringOrder(key) {
+  ring = ring || buildRing()
+  const h = hash32(key)
+  let lo = 0
+  let hi = ring.length
+  while (lo < hi) {
+    const mid = (lo + hi) >>> 1
+    if (ring[mid].hash < h) lo = mid + 1
+    else hi = mid
+  }
+
+  const order = []
+  for (let i = 0; i < ring.length && order.length < BACKENDS.length; i++) {
+    const backend = ring[(lo + i) % ring.length].backend
+    if (!order.includes(backend)) order.push(backend)
+  }
+  return order
+}
+
+function isHealthy(backend) {
+  return (unhealthyUntil.get(backend) || 0) <= Date.now()
+}
+
+/**
+ * Backends to try, best first: the video's owner unless it is over the
+ * bounded-load cap, then the rest of the ring as failover
+ */
+function pickBackends(videoId) {
+  const load = backend => inFlight.get(backend) || 0
+  let order = videoId
+    ? ringOrder(videoId)
+    : [...BACKENDS].sort((a, b) => load(a) - load(b))
+
+  const healthy = order.filter(isHealthy)
+  if (healthy.length) order = [...healthy, ...order.filter(b => !healthy.includes(b))]
+
+  const total = BACKENDS.reduce((sum, backend) => sum + load(backend), 0)
+  const capacity = Math.ceil(LOAD_FACTOR * (total + 1) / BACKENDS.length)
+  const first = order.find(b => isHealthy(b) && load(b) < capacity) || order[0]
+  return [first, ...order.filter(b => b !== first)]
+}
+
+/** Canonical video ID from the query string or the form/JSON body */
+async function findVideoId(url, request, body) {
+  const direct = url.searchParams.get('v') || url.searchParams.get('video_id')
+  if (direct && /^[\w-]{11}$/.test(direct)) return direct
+
+  const fromQuery = VIDEO_ID_PATTERN.exec(url.searchParams.get('url') || '')
+  if (fromQuery) return fromQuery[1]
+
+  if (!body) return null
+  const contentType = request.headers.get('Content-Type') || ''
+  try {
+    let target = null
+    if (contentType.includes('form')) {
+      const form = await new Response(body, { headers: { 'Content-Type': contentType } }).formData()
+      target = form.get('url')
+    } else if (contentType.includes('json')) {
+      target = JSON.parse(new TextDecoder().decode(body)).url
+    }
+    const match = VIDEO_ID_PATTERN.exec(target || '')
+    return match ? match[1] : null
+  } catch (e) {
+    return null
+  }
+}
+
+function withCors(response, backend) {
+  const headers = new Headers(response.headers)
+  for (const [name, value] of Object.entries(corsHeaders)) headers.set(name, value)
+  if (backend && BACKENDS.length > 1) headers.set('X-Served-By', new URL(backend).host)
+  return new Response(response.body, {
+    status: response.status,
+    statusText: response.statusText,
+    headers,
+  })
+}
+
 async function handleRequest(request) {
   const url = new URL(request.url)
-  
-  // Your backend server URL (ganti dengan URL server Anda)
-  const BACKEND_URL = 'https://your-server.com'
-  
-  // Add CORS headers
-  const corsHeaders = {
-    'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-    'Access-Control-Max-Age': '86400',
-  }
-  
+
   // Handle preflight requests
   if (request.method === 'OPTIONS') {
     return new Response(null, {
       headers: corsHeaders,
     })
   }
-  
-  try {
+
+  // Buffer the (small form) body so a failed node can be retried
+  const body = ['GET', 'HEAD'].includes(request.method) ? null : await request.arrayBuffer()
+  const videoId = BACKENDS.length > 1 ? await findVideoId(url, request, body) : null
+  const backends = pickBackends(videoId).slice(0, MAX_ATTEMPTS)
+
+  let lastError = null
+  for (const backend of backends) {
     // Forward request to backend
-    const backendUrl = `${BACKEND_URL}${url.pathname}${url.search}`
-    
-    const modifiedRequest = new Request(backendUrl, {
-      method: request.method,
-      headers: request.headers,
-      body: request.body,
-    })
-    
-    const response = await fetch(modifiedRequest)
-    
-    // Add CORS headers to response
-    const modifiedResponse = new Response(response.body, {
-      status: response.status,
-      statusText: response.statusText,
-      headers: {
-        ...response.headers,
-        ...corsHeaders,
-      },
-    })
-    
-    return modifiedResponse
-    
-  } catch (error) {
-    return new Response(JSON.stringify({
-      error: 'Backend service unavailable',
-      details: error.message
-    }), {
-      status: 503,
-      headers: {
-        'Content-Type': 'application/json',
-        ...corsHeaders,
-      },
-    })
+    const backendUrl = `${backend}${url.pathname}${url.search}`
+    inFlight.set(backend, (inFlight.get(backend) || 0) + 1)
+
+    try {
+      const response = await fetch(new Request(backendUrl, {
+        method: request.method,
+        headers: request.headers,
+        body,
+      }))
+
+      if (RETRY_STATUSES.includes(response.status) && backend !== backends[backends.length - 1]) {
+        unhealthyUntil.set(backend, Date.now() + UNHEALTHY_COOLDOWN_MS)
+        continue
+      }
+      return withCors(response, backend)
+
+    } catch (error) {
+      lastError = error
+      unhealthyUntil.set(backend, Date.now() + UNHEALTHY_COOLDOWN_MS)
+    } finally {
+      // Downloads are produced before the response starts, so headers
+      // arriving is a good enough end of the node's work
+      inFlight.set(backend, inFlight.get(backend) - 1)
+    }
   }
+
+  return new Response(JSON.stringify({
+    error: 'Backend service unavailable',
+    details: lastError ? lastError.message : 'All backends failed'
+  }), {
+    status: 503,
+    headers: {
+      'Content-Type': 'application/json',
+      ...corsHeaders,
+    },
+  })
 }
 
 // Optional: Add caching for video info requests
 async function handleCachedRequest(request) {
   const cache = caches.default
   const cacheKey = new Request(request.url, request)
-  
+
   // Check cache first
   let response = await cache.match(cacheKey)
-  
+
   if (!response) {
     // Not in cache, fetch from backend
     response = await handleRequest(request)
-    
+
     // Cache video info requests for 1 hour
     if (request.url.includes('/info')) {
       const cacheResponse = response.clone()
@@ -85,6 +222,6 @@ async function handleCachedRequest(request) {
       await cache.put(cacheKey, cacheResponse)
     }
   }
-  
+
   return response
 }
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Egress shaping for file responses
+Token-bucket rate limits per connection and across all workers, with
+chunked sending that only reads the next chunk once the previous one has
+been written to the client. Chunks are read into fixed-size buffers from
+a shared pool, so memory per request is bounded no matter the file size
+"""
+
+import queue
+import time
+import threading
+import multiprocessing
+
+DEFAULT_CHUNK_SIZE = 64 * 1024  # 64KB
+
+
+class TokenBucket:
+    """Token bucket measured in bytes per second
+
+    A rate of 0 (or None) disables limiting. With ``shared=True`` the bucket
+    state lives in shared memory, so one bucket created before gunicorn forks
+    (``preload_app = True``) limits every worker process together.
+    """
+
+    def __init__(self, rate, burst=None, shared=False):
+        self.rate = float(rate or 0)
+        self.burst = float(burst or max(self.rate, DEFAULT_CHUNK_SIZE))
+        if shared:
+            self._state = multiprocessing.Array('d', [self.burst, time.monotonic()])
+            self._lock = self._state.get_lock()
+        else:
+            self._state = [self.burst, time.monotonic()]
+            self._lock = threading.Lock()
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def consume(self, amount):
+        """Take ``amount`` tokens, sleeping until the bucket can pay for them
+
+        Tokens may go negative (debt) so large chunks are paid off over time
+        instead of waiting for a burst that would never fit.
+        """
+        if self.unlimited:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._state[0], self._state[1]
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            tokens -= amount
+            self._state[0] = tokens
+            self._state[1] = now
+
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class BufferPool:
+    """Fixed-size chunk buffers reused across requests
+
+    Each streaming response holds one buffer while it sends, so the pool
+    size caps streaming memory per worker; extra responses wait for a free
+    buffer instead of allocating.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_CHUNK_SIZE, count=64):
+        self.buffer_size = buffer_size
+        self.count = count
+        self._free = queue.LifoQueue()
+        for _ in range(count):
+            self._free.put(bytearray(buffer_size))
+
+    def acquire(self, timeout=None):
+        """Take a buffer, blocking until one is free (queue.Empty on timeout)"""
+        return self._free.get(timeout=timeout)
+
+    def release(self, buffer):
+        self._free.put(buffer)
+
+    @property
+    def in_use(self):
+        return self.count - self._free.qsize()
+
+
+class ThrottledFileSender:
+    """Streams files in fixed-size chunks through per-connection and global buckets"""
+
+    def __init__(self, global_bucket=None, chunk_size=DEFAULT_CHUNK_SIZE, buffer_pool=None):
+        self.global_bucket = global_bucket
+        self.chunk_size = chunk_size
+        self.buffer_pool = buffer_pool or BufferPool(chunk_size)
+
+    def stream(self, file_path, rate=None, on_close=None):
+        """Return a generator over the file contents
+
+        The file is opened immediately, so the caller may remove it (or its
+        temp directory) while the response is still being sent. The WSGI
+        server pulls the next chunk only after writing the previous one, so a
+        connection holds one pooled buffer plus the chunk being written
+        (2 x chunk_size) no matter how slowly the client reads.
+        """
+        f = open(file_path, 'rb')
+        connection_bucket = TokenBucket(rate) if rate else None
+        return self._generate(f, connection_bucket, on_close)
+
+    def _generate(self, f, connection_bucket, on_close):
+        buffer = None
+        try:
+            # Taken on first read, so responses that are never iterated hold no buffer
+            buffer = self.buffer_pool.acquire()
+            view = memoryview(buffer)
+            while True:
+                n = f.readinto(view)
+                if not n:
+                    break
+                if connection_bucket:
+                    connection_bucket.consume(n)
+                if self.global_bucket:
+                    self.global_bucket.consume(n)
+                # WSGI servers require bytes, so hand out a copy and keep the buffer
+                yield bytes(view[:n])
+        finally:
+            if buffer is not None:
+                view.release()
+                self.buffer_pool.release(buffer)
+            f.close()
+            if on_close:
+                on_close()
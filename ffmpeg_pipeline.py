@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Local ffmpeg steps for the download pipeline
+Turns cached source components into finished artifacts (MP3 transcode,
+video + audio merge) without going back to YouTube
+"""
+
+import re
+import json
+import math
+import subprocess
+from contextlib import nullcontext
+from functools import cached_property
+
+from transcode_executor import transcode_cost
+
+# Codecs the MP4 container holds as-is (yt-dlp codec strings, matched by prefix)
+MP4_VIDEO_CODECS = ('avc1', 'avc3', 'h264', 'hvc1', 'hev1', 'h265', 'hevc', 'av01', 'vp09', 'vp9', 'mp4v')
+MP4_AUDIO_CODECS = ('mp4a', 'aac', 'mp3', 'opus', 'flac', 'alac', 'ac-3', 'ac3', 'ec-3', 'eac3')
+
+# Typical average kbps of LAME's VBR levels V0..V9
+LAME_VBR_KBPS = (245, 225, 190, 175, 165, 130, 115, 100, 85, 65)
+
+# What each output format needs from the ffmpeg build. Muxers are
+# alternatives, preferred first (the one ffmpeg picks from the extension)
+OUTPUT_ENCODERS = {'mp3': ('libmp3lame',)}
+OUTPUT_MUXERS = {'mp3': ('mp3',), 'mp4': ('mp4',), 'm4a': ('ipod', 'mp4'), 'opus': ('opus', 'ogg')}
+
+# Shown on the health endpoint
+REPORTED_ENCODERS = ('libmp3lame', 'aac', 'libfdk_aac', 'libopus', 'libx264')
+
+# Options that only some builds have: (help topic, option)
+OPTION_FLAGS = {
+    'filter_threads': ('long', '-filter_threads'),
+    'lame_reservoir': ('encoder=libmp3lame', '-reservoir'),
+    'mp3_write_xing': ('muxer=mp3', '-write_xing'),
+}
+
+
+def _tool_output(command):
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _listed_names(output):
+    """Names from ``ffmpeg -encoders``/``-muxers``: the word after the flags, below the '--' line"""
+    names = set()
+    listing = False
+    for line in (output or '').splitlines():
+        if line.strip().startswith('--'):
+            listing = True
+        elif listing and len(line.split()) >= 2:
+            names.update(line.split()[1].split(','))
+    return names
+
+
+def probe_capabilities(ffmpeg='ffmpeg', ffprobe='ffprobe'):
+    """Version, encoders, muxers and optional flags of an ffmpeg build
+
+    ``available`` is False (with everything else empty) when ffmpeg or
+    ffprobe doesn't run.
+    """
+    version = _tool_output([ffmpeg, '-hide_banner', '-version'])
+    probe_version = _tool_output([ffprobe, '-hide_banner', '-version'])
+    if not version or not probe_version:
+        missing = 'ffmpeg' if not version else 'ffprobe'
+        return {'available': False, 'error': f"{missing} not found or not working",
+                'version': None, 'ffprobe_version': None, 'build_flags': [],
+                'encoders': set(), 'muxers': set(), 'flags': {}}
+
+    configuration = next((line for line in version.splitlines() if line.startswith('configuration:')), '')
+    flags = {}
+    for name, (topic, option) in OPTION_FLAGS.items():
+        output = _tool_output([ffmpeg, '-hide_banner', '-h', topic]) or ''
+        flags[name] = any(line.split()[:1] == [option] for line in output.splitlines())
+    return {
+        'available': True,
+        'error': None,
+        'version': version.split()[2] if len(version.split()) > 2 else None,
+        'ffprobe_version': probe_version.split()[2] if len(probe_version.split()) > 2 else None,
+        'build_flags': [word[len('--enable-'):] for word in configuration.split() if word.startswith('--enable-')],
+        'encoders': _listed_names(_tool_output([ffmpeg, '-hide_banner', '-encoders'])),
+        'muxers': _listed_names(_tool_output([ffmpeg, '-hide_banner', '-muxers'])),
+        'flags': flags,
+    }
+
+
+# Input measurements loudnorm prints, enough to normalize linearly in one pass later
+LOUDNORM_STATS = ('input_i', 'input_tp', 'input_lra', 'input_thresh', 'target_offset')
+
+
+class Loudnorm:
+    """EBU R128 loudness normalization inside the encode's own ffmpeg run
+
+    Without ``measured`` stats this is loudnorm's single-pass (dynamic)
+    mode, which measures the whole input as it goes; after the run
+    ``measured`` holds those stats, to be cached for the video. With stats
+    from an earlier run it is a linear gain to ``target`` LUFS, as in the
+    second pass of the usual two-pass recipe, without the analysis pass.
+    loudnorm works at 192 kHz, so the output goes back to ``sample_rate``.
+    """
+
+    def __init__(self, target=-14.0, measured=None, sample_rate=None, true_peak=-1.0, lra=11.0):
+        self.target = target
+        self.true_peak = true_peak
+        self.lra = lra
+        self.sample_rate = sample_rate or 48000
+        self.measured = measured
+        self.linear = bool(measured)
+
+    def filter(self):
+        options = [f"I={self.target}", f"TP={self.true_peak}", f"LRA={self.lra}"]
+        if self.linear:
+            m = self.measured
+            options += [f"measured_I={m['input_i']}", f"measured_TP={m['input_tp']}",
+                        f"measured_LRA={m['input_lra']}", f"measured_thresh={m['input_thresh']}", 'linear=true']
+            if m.get('target') == self.target:
+                options.append(f"offset={m['target_offset']}")
+        return 'loudnorm=' + ':'.join(options + ['print_format=json'])
+
+    def args(self):
+        return ['-af', self.filter(), '-ar', str(self.sample_rate)]
+
+    def read(self, stderr):
+        """Keep the input stats from loudnorm's JSON report (silence measures -inf and is skipped)"""
+        if self.linear:
+            return
+        reports = re.findall(r'\{[^{}]*\}', stderr or '')
+        try:
+            report = json.loads(reports[-1])
+            stats = {name: float(report[name]) for name in LOUDNORM_STATS}
+        except (IndexError, KeyError, TypeError, ValueError):
+            return
+        if all(math.isfinite(value) for value in stats.values()):
+            self.measured = {**stats, 'target': self.target}
+
+
+class MediaTags:
+    """Title/artist/album/date tags and a cover image, written by the ffmpeg run that makes the file
+
+    ``cover`` is an image path (any format ffmpeg reads, stored as JPEG);
+    only MP3 (ID3 APIC) and m4a (covr) carry it; other containers get the
+    text tags alone.
+    """
+
+    COVER_FORMATS = ('mp3', 'm4a')
+
+    def __init__(self, title=None, artist=None, album=None, date=None, cover=None):
+        self.tags = {'title': title, 'artist': artist, 'album': album, 'date': date}
+        self.cover = cover
+
+    def inputs(self, format_type):
+        """Extra ffmpeg inputs, placed after the media inputs"""
+        return ['-i', self.cover] if self.cover and format_type in self.COVER_FORMATS else []
+
+    def outputs(self, format_type, cover_input):
+        """Output options; ``cover_input`` is the index of the cover's ``-i``"""
+        args = []
+        if self.inputs(format_type):
+            args += ['-map', f'{cover_input}:v:0', '-c:v', 'mjpeg', '-disposition:v:0', 'attached_pic']
+        for key, value in self.tags.items():
+            if value:
+                args += ['-metadata', f'{key}={value}']
+        if format_type == 'mp3':
+            args += ['-id3v2_version', '3']  # the version players read cover art from
+        return args
+
+
+def mp4_compatible(vcodec, acodec):
+    """True when both codecs can be stream-copied into MP4
+
+    A missing stream ('none') fits, and so does an unknown codec (None):
+    callers try the copy and only re-encode if ffmpeg refuses it.
+    """
+    def fits(codec, allowed):
+        codec = (codec or 'none').lower()
+        return codec == 'none' or codec.startswith(allowed)
+    return fits(vcodec, MP4_VIDEO_CODECS) and fits(acodec, MP4_AUDIO_CODECS)
+
+
+class FFmpegError(Exception):
+    """ffmpeg exited with an error"""
+
+
+class FFmpegPipeline:
+    """Runs ffmpeg on files that are already on local disk
+
+    With an ``executor`` (transcode_executor.TranscodeExecutor) every run
+    waits for a slot in its lane first: 'heavy' for encodes, 'light' for
+    stream copies and merges. Heavy runs get the executor's thread budget
+    as ``-threads``/``-filter_threads``.
+
+    ``capabilities`` probes the ffmpeg build once (see probe_capabilities);
+    construct the pipeline before forking workers and touch it there so
+    they all share the result.
+    """
+
+    def __init__(self, ffmpeg='ffmpeg', ffprobe='ffprobe', timeout=3600, executor=None):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.timeout = timeout
+        self.executor = executor
+
+    @cached_property
+    def capabilities(self):
+        return probe_capabilities(self.ffmpeg, self.ffprobe)
+
+    def muxer(self, format_type):
+        """The first muxer this build has for ``format_type``, or None"""
+        muxers = self.capabilities['muxers']
+        return next((name for name in OUTPUT_MUXERS.get(format_type, ()) if name in muxers), None)
+
+    def missing(self, format_type):
+        """What the ffmpeg build lacks to produce ``format_type`` (empty when it can)"""
+        caps = self.capabilities
+        if not caps['available']:
+            return [caps['error']]
+        missing = [f"no {name} encoder" for name in OUTPUT_ENCODERS.get(format_type, ()) if name not in caps['encoders']]
+        if format_type in OUTPUT_MUXERS and not self.muxer(format_type):
+            missing.append(f"no {' or '.join(OUTPUT_MUXERS[format_type])} muxer")
+        return missing
+
+    def capability_report(self):
+        """The probe result for the health endpoint: what's there and which outputs work"""
+        caps = self.capabilities
+        return {
+            'available': caps['available'],
+            'error': caps['error'],
+            'version': caps['version'],
+            'ffprobe_version': caps['ffprobe_version'],
+            'encoders': {name: name in caps['encoders'] for name in REPORTED_ENCODERS},
+            'muxers': {name: name in caps['muxers'] for name in sorted({m for ms in OUTPUT_MUXERS.values() for m in ms})},
+            'flags': caps['flags'],
+            'build_flags': caps['build_flags'],
+            'formats': {fmt: self.missing(fmt) or 'ok' for fmt in OUTPUT_MUXERS},
+        }
+
+    def run(self, args, lane='heavy', duration=None, cost=None, loglevel='error'):
+        """Run ffmpeg with ``args`` (ending in the output path) and raise FFmpegError on failure
+
+        ``duration`` and ``cost`` place the job in the executor's queue (see TranscodeExecutor.slot).
+        Filters that report at 'info' (loudnorm) need a higher ``loglevel``;
+        the report is in the result's stderr.
+        """
+        with self.executor.slot(lane, duration, cost) if self.executor else nullcontext() as threads:
+            if threads:
+                args = [*args[:-1], '-threads', str(threads), args[-1]]
+                if self.capabilities['flags'].get('filter_threads'):
+                    args = ['-filter_threads', str(threads), *args]
+            command = [self.ffmpeg, '-hide_banner', '-nostdin', '-nostats', '-loglevel', loglevel, '-y', *args]
+            try:
+                result = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                raise FFmpegError(str(e))
+            if result.returncode != 0:
+                raise FFmpegError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"ffmpeg exited with {result.returncode}")
+        return result
+
+    def probe(self, path):
+        """Small summary of a media file (container, duration, streams) or None"""
+        command = [
+            self.ffprobe, '-v', 'error', '-of', 'json',
+            '-show_entries', 'format=format_name,duration,bit_rate'
+                             ':stream=codec_type,codec_name,bit_rate,width,height,sample_rate,channels',
+            path,
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=60)
+            data = json.loads(result.stdout) if result.returncode == 0 else None
+        except (OSError, subprocess.TimeoutExpired, ValueError):
+            return None
+        if not data:
+            return None
+
+        def number(value, kind):
+            try:
+                return kind(float(value))
+            except (TypeError, ValueError):
+                return None
+
+        fmt = data.get('format', {})
+        return {
+            'format': fmt.get('format_name'),
+            'duration': number(fmt.get('duration'), float),
+            'bit_rate': number(fmt.get('bit_rate'), int),
+            'streams': [
+                {key: value for key, value in stream.items() if value not in (None, 'N/A')}
+                for stream in data.get('streams', [])
+            ],
+        }
+
+    @staticmethod
+    def mp3_quality_args(quality):
+        """Same mapping as yt-dlp's FFmpegExtractAudio: below 10 is a VBR level, else kbps"""
+        quality = str(quality or '320')
+        if quality.isdigit() and int(quality) < 10:
+            return ['-q:a', quality]
+        return ['-b:a', f"{quality.rstrip('kK')}k"]
+
+    @staticmethod
+    def mp3_kbps(quality):
+        """Target bitrate of an MP3 quality, or LAME's typical average for VBR levels"""
+        quality = str(quality or '320')
+        if quality.isdigit() and int(quality) < 10:
+            return LAME_VBR_KBPS[int(quality)]
+        return int(quality.rstrip('kK'))
+
+    def encode_mp3(self, source, output, quality='320', duration=None, loudnorm=None, tags=None):
+        """Transcode the audio of ``source`` (``duration`` seconds long, if known) to MP3
+
+        With a Loudnorm the audio is normalized, and with MediaTags tagged,
+        in the same run.
+        """
+        self._encode(source, output, 'mp3', ['-c:a', 'libmp3lame', *self.mp3_quality_args(quality)],
+                     duration, transcode_cost(duration, self.mp3_kbps(quality)), loudnorm, tags)
+        return output
+
+    def audio_codec_args(self, format_type):
+        """Encoder arguments for m4a (AAC, Fraunhofer's when built in) or opus, or None if the build has neither"""
+        encoders = self.capabilities['encoders']
+        if format_type == 'm4a':
+            if 'libfdk_aac' in encoders:
+                return ['-c:a', 'libfdk_aac', '-vbr', '5']
+            if 'aac' in encoders:
+                return ['-c:a', 'aac', '-b:a', '256k']
+        if format_type == 'opus' and 'libopus' in encoders:
+            return ['-c:a', 'libopus', '-b:a', '160k']
+        return None
+
+    def encode_audio(self, source, output, format_type, duration=None, loudnorm=None, tags=None):
+        """Transcode the audio of ``source`` to m4a or opus (normalized and tagged in the same run, as for MP3)"""
+        codec_args = self.audio_codec_args(format_type)
+        if not codec_args:
+            raise FFmpegError(f"no {format_type} encoder in this ffmpeg build")
+        if format_type == 'm4a':
+            codec_args += ['-movflags', '+faststart']
+        if format_type == 'opus' and loudnorm:
+            loudnorm.sample_rate = 48000  # the only full-band rate libopus takes
+        self._encode(source, output, format_type, codec_args, duration, transcode_cost(duration, 256), loudnorm, tags)
+        return output
+
+    def _encode(self, source, output, format_type, codec_args, duration, cost, loudnorm, tags):
+        args = ['-i', source, *(tags.inputs(format_type) if tags else []), '-map', '0:a:0',
+                *(tags.outputs(format_type, 1) if tags else []),
+                *(loudnorm.args() if loudnorm else []), *codec_args, output]
+        result = self.run(args, duration=duration, cost=cost, loglevel='info' if loudnorm else 'error')
+        if loudnorm:
+            loudnorm.read(result.stderr)
+
+    def copy_audio(self, source, output, tags=None):
+        """Put the first audio stream of ``source`` into the container of ``output`` without re-encoding
+
+        MediaTags (and their cover) are written in the same run.
+        """
+        format_type = output.rsplit('.', 1)[-1]
+        args = ['-i', source, *(tags.inputs(format_type) if tags else []), '-map', '0:a:0',
+                *(tags.outputs(format_type, 1) if tags else []), '-c:a', 'copy']
+        if output.endswith(('.m4a', '.mp4')):
+            args += ['-movflags', '+faststart']
+        muxer = self.muxer(format_type)
+        if muxer and muxer != OUTPUT_MUXERS[format_type][0]:
+            # Builds without the usual muxer for the extension (e.g. no 'ipod' for .m4a)
+            args += ['-f', muxer]
+        self.run([*args, output], lane='light')
+        return output
+
+    def remux(self, source, output, tags=None):
+        """Copy every audio and video stream of ``source`` into a new container (with MediaTags' text tags)"""
+        self.run(['-i', source, '-map', '0', '-dn', '-ignore_unknown', '-c', 'copy', '-movflags', '+faststart',
+                  *(tags.outputs('mp4', None) if tags else []), output], lane='light')
+        return output
+
+    def merge(self, video, audio, output, tags=None):
+        """Mux a video-only stream with an audio stream, copying both (and writing MediaTags' text tags)"""
+        self.run([
+            '-i', video, '-i', audio,
+            '-map', '0:v:0', '-map', '1:a:0',
+            '-c', 'copy', '-movflags', '+faststart',
+            *(tags.outputs('mp4', None) if tags else []),
+            output,
+        ], lane='light')
+        return output
@@ -6,7 +6,10 @@ backlog = 2048
 
 # Worker processes
 workers = 4
-worker_class = "sync"
+# Threaded workers so long-lived streams (progress events, file sends)
+# don't pin a whole worker process each
+worker_class = "gthread"
+threads = 8
 worker_connections = 1000
 timeout = 300
 keepalive = 2
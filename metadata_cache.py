@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Short-lived cache of extracted video metadata
+Slim info dicts are kept as small JSON files per video ID so every worker
+process can skip the extraction round trip to YouTube. Entries expire well
+before the signed stream URLs they contain.
+"""
+
+import os
+import re
+import json
+import time
+
+from cache_stats import CacheStats, age_histogram
+
+# Also keeps user-supplied IDs from escaping the cache directory
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+class MetadataCache:
+    """File-backed video ID -> slim info cache with a fixed TTL
+
+    Also used as the negative cache, with short-lived entries for videos
+    that could not be extracted.
+    """
+
+    def __init__(self, cache_dir, ttl=1800):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stats = CacheStats(('hits', 'misses', 'evictions_expired', 'stores', 'extractions', 'extract_seconds'))
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, video_id):
+        return os.path.join(self.cache_dir, f"{video_id}.json")
+
+    def get(self, video_id):
+        """Return the cached info for ``video_id`` or None when missing or expired"""
+        if not video_id or self.ttl <= 0 or not VIDEO_ID_PATTERN.match(video_id):
+            return None
+        try:
+            path = self._path(video_id)
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                self.stats.incr('evictions_expired')
+                raise OSError
+            with open(path) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            self.stats.incr('misses')
+            return None
+        self.stats.incr('hits')
+        return info
+
+    def put(self, video_id, info):
+        if not video_id or not info or self.ttl <= 0 or not VIDEO_ID_PATTERN.match(video_id):
+            return
+        path = self._path(video_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(info, f)
+            os.replace(tmp_path, path)
+            self.stats.incr('stores')
+        except OSError:
+            pass
+
+    def record_extraction(self, seconds):
+        """Time one upstream extraction took, to estimate the time hits save"""
+        self.stats.incr('extractions')
+        self.stats.incr('extract_seconds', seconds)
+
+    def report(self):
+        """Counters plus resident bytes, entry ages and estimated seconds saved"""
+        data = self.stats.snapshot()
+        average = data['extract_seconds'] / data['extractions'] if data['extractions'] else 0
+        data['seconds_saved'] = round(data['hits'] * average, 1)
+
+        entries, resident, created = 0, 0, []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for item in it:
+                    if item.name.endswith('.json'):
+                        stat = item.stat()
+                        entries += 1
+                        resident += stat.st_size
+                        created.append(stat.st_mtime)
+        except OSError:
+            pass
+        data.update(entries=entries, resident_bytes=resident, age=age_histogram(created), ttl=self.ttl)
+        return data
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Segment-parallel MP3 encoding for long audio
+One LAME encode runs on a single core, so a 3-hour mix keeps one core busy
+for minutes while the rest sit idle. Long inputs are cut into segments on
+the MP3 frame grid, encoded by parallel ffmpeg processes with the bit
+reservoir off (every frame decodes on its own), and joined frame by frame
+into one gapless MP3:
+
+- every segment after the first starts LEAD_FRAMES early and those frames
+  are dropped, so the kept frames line up with the frames a single encoder
+  run would have produced, warmed-up psychoacoustics included
+- the joined stream gets a new Xing/Info + LAME header frame with the frame
+  and byte counts, the seek table, and the encoder delay (from the first
+  segment) and padding (from the last), so players seek correctly and
+  trim the stream gaplessly
+"""
+
+import os
+import math
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ffmpeg_pipeline import FFmpegPipeline, FFmpegError
+from transcode_executor import transcode_cost
+
+MPEG1_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MPEG2_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+MPEG1_SAMPLE_RATES = (32000, 44100, 48000)
+
+LEAD_FRAMES = 8   # encoded before each segment's start and dropped
+TAIL_FRAMES = 8   # encoded past each segment's end so its last kept frame is complete
+XING_SIZE = 120   # 'Xing' + flags + frames + bytes + 100-byte TOC + quality
+LAME_TAG_SIZE = 36
+READ_CHUNK = 256 * 1024   # segments are read this much at a time, never whole
+MAX_FRAME_LENGTH = 1441   # 320 kbps at 32 kHz, padded
+
+
+class ParallelEncodeError(Exception):
+    """The segments could not be joined into one stream"""
+
+
+def parse_header(data, offset=0):
+    """MPEG audio Layer III frame header at ``offset`` as a dict, or None"""
+    if offset + 4 > len(data):
+        return None
+    bits = int.from_bytes(data[offset:offset + 4], 'big')
+    version, layer = (bits >> 19) & 3, (bits >> 17) & 3
+    bitrate_index, rate_index = (bits >> 12) & 15, (bits >> 10) & 3
+    if bits >> 21 != 0x7FF or version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    mono = (bits >> 6) & 3 == 3
+    bitrate = (MPEG1_BITRATES if mpeg1 else MPEG2_BITRATES)[bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    return {
+        'bits': bits,
+        'mpeg1': mpeg1,
+        'bitrate_index': bitrate_index,
+        'sample_rate': sample_rate,
+        'samples': 1152 if mpeg1 else 576,
+        'length': (144 if mpeg1 else 72) * bitrate // sample_rate + ((bits >> 9) & 1),
+        'side_info': (17 if mono else 32) if mpeg1 else (9 if mono else 17),
+    }
+
+
+def frame_length(header, bitrate_index):
+    """Length of an unpadded frame like ``header`` at another bitrate"""
+    bitrate = (MPEG1_BITRATES if header['mpeg1'] else MPEG2_BITRATES)[bitrate_index] * 1000
+    return (144 if header['mpeg1'] else 72) * bitrate // header['sample_rate']
+
+
+def parse_info_frame(frame, header):
+    """Xing/Info fields and the LAME tag of a header frame, or None for an audio frame"""
+    pos = 4 + header['side_info']
+    if frame[pos:pos + 4] not in (b'Xing', b'Info'):
+        return None
+    flags = int.from_bytes(frame[pos + 4:pos + 8], 'big')
+    info = {'frames': None, 'quality': 0, 'lame': None, 'delay': None, 'padding': None}
+    pos += 8
+    if flags & 1:
+        info['frames'] = int.from_bytes(frame[pos:pos + 4], 'big')
+        pos += 4
+    if flags & 2:
+        pos += 4
+    if flags & 4:
+        pos += 100
+    if flags & 8:
+        info['quality'] = int.from_bytes(frame[pos:pos + 4], 'big')
+        pos += 4
+    lame = frame[pos:pos + LAME_TAG_SIZE]
+    if len(lame) == LAME_TAG_SIZE and lame[:4].isalpha():
+        info['lame'] = lame
+        info['delay'] = (lame[21] << 4) | (lame[22] >> 4)
+        info['padding'] = ((lame[22] & 0x0F) << 8) | lame[23]
+    return info
+
+
+def iter_frames(f, chunk_size=READ_CHUNK):
+    """Yield ``(header, frame)`` for every frame of an open MP3 file
+
+    Skips a leading ID3v2 tag and stops at an ID3v1 trailer or a truncated
+    last frame. The file is read ``chunk_size`` bytes at a time, so memory
+    stays flat however long the file is. The Xing/LAME header frame, if
+    any, is yielded like any other (see parse_info_frame).
+    """
+    buffer = f.read(10)
+    if buffer[:3] == b'ID3' and len(buffer) == 10:
+        size = (buffer[6] << 21) | (buffer[7] << 14) | (buffer[8] << 7) | buffer[9]
+        f.seek(10 + size + (10 if buffer[5] & 0x10 else 0))
+        buffer = b''
+
+    pos, eof = 0, False
+    while True:
+        if len(buffer) - pos < MAX_FRAME_LENGTH + 4 and not eof:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        header = parse_header(buffer, pos)
+        if not header:
+            if len(buffer) - pos < 4 or buffer[pos:pos + 3] == b'TAG':  # end, or ID3v1 trailer
+                return
+            pos += 1  # resync
+            continue
+        end = pos + header['length']
+        if end > len(buffer):
+            return
+        yield header, buffer[pos:end]
+        pos = end
+
+
+def read_frames(path):
+    """Audio frames of an MP3 file as a list and its Xing/LAME info (None without a header frame)
+
+    Holds the whole stream in memory; for checks and tools, the join
+    streams with iter_frames.
+    """
+    frames, info = [], None
+    with open(path, 'rb') as f:
+        for header, frame in iter_frames(f):
+            if not frames and info is None:
+                info = parse_info_frame(frame, header)
+                if info is not None:
+                    continue
+            frames.append(frame)
+    return frames, info
+
+
+def crc16(data, crc=0):
+    """CRC-16/ARC, as used by the LAME tag"""
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def info_frame_bitrate(header, cbr):
+    """Bitrate index of the header frame: the stream's own for CBR (so CBR
+    detection still holds) if the tags fit, else the smallest that fits"""
+    needed = 4 + header['side_info'] + XING_SIZE + LAME_TAG_SIZE
+    index = header['bitrate_index']
+    if not cbr or frame_length(header, index) < needed:
+        index = next(i for i in range(1, 15) if frame_length(header, i) >= needed)
+    return index
+
+
+def build_info_frame(header, sizes, cbr, lame, quality, delay, padding):
+    """Xing ('Info' for CBR) + LAME header frame for a stream of frames with ``sizes``
+
+    ``header`` is the parsed header of the first audio frame; the header
+    frame reuses its format at info_frame_bitrate.
+    """
+    index = info_frame_bitrate(header, cbr)
+    length = frame_length(header, index)
+
+    # Same header with the new bitrate, no padding and no CRC
+    bits = (header['bits'] & ~(0xF << 12) & ~(1 << 9)) | (index << 12) | (1 << 16)
+    frame = bytearray(length)
+    frame[0:4] = bits.to_bytes(4, 'big')
+
+    total = length + sum(sizes)
+    offsets, position = [], length
+    for size in sizes:
+        offsets.append(position)
+        position += size
+    toc = bytes(min(255, offsets[min(len(sizes) - 1, i * len(sizes) // 100)] * 256 // total) for i in range(100))
+
+    pos = 4 + header['side_info']
+    frame[pos:pos + XING_SIZE] = (
+        (b'Info' if cbr else b'Xing') + (0x0F).to_bytes(4, 'big')
+        + len(sizes).to_bytes(4, 'big') + total.to_bytes(4, 'big') + toc + quality.to_bytes(4, 'big')
+    )
+    pos += XING_SIZE
+
+    tag = bytearray(lame or b'LAME3.100'.ljust(LAME_TAG_SIZE, b'\0'))
+    tag[21:24] = ((delay << 12) | padding).to_bytes(3, 'big')
+    tag[28:32] = total.to_bytes(4, 'big')
+    tag[32:34] = b'\0\0'  # music CRC: left unset, it would mean another pass over the whole stream
+    frame[pos:pos + LAME_TAG_SIZE] = tag
+    crc_at = pos + 34
+    frame[crc_at:crc_at + 2] = crc16(frame[:crc_at]).to_bytes(2, 'big')
+    return bytes(frame)
+
+
+def plan_segments(duration, sample_rate, spf, segments):
+    """Segment start samples on the frame grid, at most ``segments`` of them"""
+    total_frames = math.ceil(duration * sample_rate / spf)
+    per_segment = max(LEAD_FRAMES + TAIL_FRAMES, math.ceil(total_frames / segments))
+    return [i * per_segment * spf for i in range(math.ceil(total_frames / per_segment))]
+
+
+class SegmentedMP3Encoder:
+    """MP3 encoder that splits inputs of ``min_duration`` seconds or more into parallel segments
+
+    ``segments`` is the number of parallel ffmpeg processes (default: CPU
+    count); each one takes a heavy slot when the pipeline has an executor.
+    Anything shorter, loudness-normalized encodes (loudnorm needs the whole
+    input), tagged ones (the joined file has no ID3 tag), builds whose
+    libmp3lame or mp3 muxer lack the options segments need, and parallel
+    encodes that fail are encoded in one piece by FFmpegPipeline.encode_mp3.
+    """
+
+    def __init__(self, pipeline=None, segments=0, min_duration=1200):
+        self.pipeline = pipeline or FFmpegPipeline()
+        self.segments = segments or os.cpu_count() or 1
+        self.min_duration = min_duration
+
+    def encode(self, source, output, quality='320', duration=None, sample_rate=None, loudnorm=None, tags=None):
+        """Transcode ``source`` (``duration`` seconds, if known) to MP3; returns ``output``"""
+        if loudnorm or tags:
+            return self.pipeline.encode_mp3(source, output, quality, duration, loudnorm, tags)
+        if self.segments > 1 and duration and duration >= self.min_duration and self.supported():
+            try:
+                return self.encode_parallel(source, output, quality, duration, sample_rate)
+            except (FFmpegError, ParallelEncodeError):
+                pass
+        return self.pipeline.encode_mp3(source, output, quality, duration)
+
+    def supported(self):
+        flags = self.pipeline.capabilities['flags']
+        return bool(flags.get('lame_reservoir') and flags.get('mp3_write_xing'))
+
+    def encode_parallel(self, source, output, quality, duration, sample_rate=None):
+        # One output rate for all segments; MPEG-1 rates keep 1152-sample frames
+        rate = sample_rate if sample_rate in MPEG1_SAMPLE_RATES else 44100
+        spf = 1152
+        starts = plan_segments(duration, rate, spf, self.segments)
+        if len(starts) < 2:
+            raise ParallelEncodeError("input too short to split")
+
+        workdir = tempfile.mkdtemp(prefix='mp3seg_', dir=os.path.dirname(os.path.abspath(output)))
+        try:
+            paths = [os.path.join(workdir, f'{i:03d}.mp3') for i in range(len(starts))]
+            with ThreadPoolExecutor(max_workers=len(starts)) as pool:
+                futures = [
+                    pool.submit(self._encode_segment, source, paths[i], quality, duration, rate, spf, starts, i)
+                    for i in range(len(starts))
+                ]
+                for future in futures:
+                    future.result()
+            vbr = self.pipeline.mp3_quality_args(quality)[0] == '-q:a'
+            self._join(paths, starts, spf, output, cbr=not vbr)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return output
+
+    def _encode_segment(self, source, path, quality, duration, rate, spf, starts, i):
+        lead = LEAD_FRAMES * spf if i else 0
+        start = starts[i] - lead
+        args = ['-ss', f'{start / rate:.6f}'] if start else []
+        if i + 1 < len(starts):
+            args += ['-t', f'{(starts[i + 1] + TAIL_FRAMES * spf - start) / rate:.6f}']
+            seconds = (starts[i + 1] - starts[i]) / rate
+        else:
+            seconds = duration - starts[i] / rate
+        self.pipeline.run([
+            *args, '-i', source, '-map', '0:a:0', '-vn', '-map_metadata', '-1', '-ar', str(rate),
+            '-c:a', 'libmp3lame', *self.pipeline.mp3_quality_args(quality), '-reservoir', '0',
+            '-id3v2_version', '0', '-write_id3v1', '0', '-write_xing', '1',
+            path,
+        ], duration=seconds, cost=transcode_cost(seconds, self.pipeline.mp3_kbps(quality)))
+
+    def _join(self, paths, starts, spf, output, cbr):
+        """Write the kept frames of every segment behind a new header frame
+
+        Segments are streamed frame by frame (see iter_frames); only the
+        frame sizes, needed for the seek table, are kept for the whole run.
+        """
+        sizes, bitrates = [], set()
+        first = delay = padding = lame = None
+        quality = 0
+        with open(output, 'wb') as out:
+            for i, path in enumerate(paths):
+                lead = LEAD_FRAMES if i else 0
+                count = (starts[i + 1] - starts[i]) // spf if i + 1 < len(paths) else None
+                with open(path, 'rb') as f:
+                    frames = iter_frames(f)
+                    header, frame = next(frames, (None, None))
+                    info = parse_info_frame(frame, header) if frame else None
+                    if not info or info['delay'] is None:
+                        raise ParallelEncodeError(f"segment {i} has no LAME tag")
+                    if i == 0:
+                        delay, lame, quality = info['delay'], info['lame'], info['quality']
+                    if count is None:
+                        padding = info['padding']
+
+                    seen = kept = 0
+                    for header, frame in frames:
+                        seen += 1
+                        if seen <= lead:
+                            continue
+                        if first is None:
+                            first = header
+                            # Room for the header frame, written last
+                            out.write(b'\0' * frame_length(first, info_frame_bitrate(first, cbr)))
+                        if header['sample_rate'] != first['sample_rate']:
+                            raise ParallelEncodeError("segments differ in sample rate")
+                        bitrates.add(header['bitrate_index'])
+                        sizes.append(len(frame))
+                        out.write(frame)
+                        kept += 1
+                        if kept == count:
+                            break
+                if count is not None and kept < count:
+                    raise ParallelEncodeError(f"segment {i} is {seen} frames, expected {lead + count}")
+                os.remove(path)
+
+            if first is None:
+                raise ParallelEncodeError("segments hold no audio frames")
+
+            if cbr and len(bitrates) > 1:
+                raise ParallelEncodeError("CBR segments came out with mixed bitrates")
+            out.seek(0)
+            out.write(build_info_frame(first, sizes, cbr, lame, quality, delay, padding))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Cache prewarming
+Fills the metadata and artifact caches ahead of a traffic spike from a list
+of URLs or a replayed app.log, at bounded concurrency and upstream request
+rate. The work runs on the server (POST /admin/prewarm) so it lands in the
+caches the workers actually read; this script submits the job and follows
+its progress.
+
+Usage:
+    python prewarm.py urls.txt --format mp3 --server http://localhost:5000 --token $ADMIN_TOKEN
+    python prewarm.py app.log --top 200 --server http://localhost:5000 --token $ADMIN_TOKEN
+"""
+
+import sys
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from egress import TokenBucket
+from cache_simulator import DOWNLOAD_LINE, BEST_LINE, format_bytes, logged_flags
+
+
+def items_from_log(lines, top=None):
+    """Requests found in app.log lines, most requested first"""
+    counts = Counter()
+    for line in lines:
+        match = DOWNLOAD_LINE.search(line)
+        if match:
+            # The log holds the parsed quality: VBR levels as "0".."9"
+            audio_quality = match['audio_quality']
+            if audio_quality.isdigit() and len(audio_quality) == 1:
+                audio_quality = f"V{audio_quality}"
+            counts[(match['url'], match['format'], match['resolution'], match['format_id'], audio_quality, '',
+                    *logged_flags(match))] += 1
+            continue
+
+        match = BEST_LINE.search(line)
+        if match:
+            target = '' if match['target'] == 'auto' else match['target']
+            counts[(match['url'], match['format'], '', '', '', target or 'auto', False, False, True)] += 1
+
+    items = []
+    for (url, format_type, resolution, format_id, audio_quality, best, normalize, tags, cap_bitrate), _ in counts.most_common(top):
+        item = {'url': url, 'format': format_type}
+        if best:
+            item['best'] = True
+            item['target_resolution'] = '' if best == 'auto' else best
+        else:
+            item.update(resolution=resolution, format_id=format_id, audio_quality=audio_quality,
+                        normalize=normalize, tags=tags, cap_bitrate=cap_bitrate)
+        items.append(item)
+    return items
+
+
+def items_from_urls(lines, format_type='mp3'):
+    """One item per URL line; blank lines and # comments are skipped"""
+    items = []
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith('#'):
+            items.append({'url': url, 'format': format_type})
+    return items
+
+
+class Prewarmer:
+    """Runs ``warm(item)`` over items at bounded concurrency and upstream rate
+
+    ``warm`` returns ``(status, size)`` with status 'warmed', 'cached' or
+    'failed'. ``is_cached(item)`` lets already warm items skip the rate limit.
+    """
+
+    def __init__(self, warm, is_cached=None, concurrency=2, rate=0.5):
+        self.warm = warm
+        self.is_cached = is_cached
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate, burst=1)  # upstream requests per second
+
+    def run(self, items, on_progress=None):
+        """Warm every item and return the final stats"""
+        stats = {
+            'state': 'running',
+            'total': len(items),
+            'done': 0,
+            'warmed': 0,
+            'cached': 0,
+            'failed': 0,
+            'bytes_warmed': 0,
+            'started': time.time(),
+            'errors': [],
+        }
+        lock = threading.Lock()
+        if on_progress:
+            on_progress(dict(stats))
+
+        def task(item):
+            try:
+                if self.is_cached and self.is_cached(item):
+                    status, size = 'cached', 0
+                else:
+                    self.bucket.consume(1)
+                    status, size = self.warm(item)
+            except Exception as e:
+                status, size = 'failed', 0
+                with lock:
+                    stats['errors'].append({'url': item.get('url'), 'error': str(e)})
+
+            with lock:
+                stats['done'] += 1
+                stats[status] += 1
+                if status == 'warmed':
+                    stats['bytes_warmed'] += size
+                snapshot = dict(stats, errors=stats['errors'][-20:])
+            if on_progress:
+                on_progress(snapshot)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(task, items))
+
+        stats['state'] = 'finished'
+        stats['finished'] = time.time()
+        stats['errors'] = stats['errors'][-20:]
+        if on_progress:
+            on_progress(dict(stats))
+        return stats
+
+
+def main():
+    import requests
+
+    parser = argparse.ArgumentParser(description='Prewarm the server caches from URLs or an app.log')
+    parser.add_argument('source', help='Text file with one URL per line, or an app.log to replay')
+    parser.add_argument('--server', default='http://localhost:5000', help='API base URL')
+    parser.add_argument('--token', required=True, help='ADMIN_TOKEN of the server')
+    parser.add_argument('--format', default='mp3', choices=['mp3', 'mp4', 'm4a', 'opus'], help='Format for plain URL lists (default: mp3)')
+    parser.add_argument('--top', type=int, help='Only the N most requested items of a log')
+    parser.add_argument('--concurrency', type=int, default=2, help='Parallel downloads on the server (default: 2)')
+    parser.add_argument('--rate', type=float, default=0.5, help='Upstream requests per second (default: 0.5)')
+    parser.add_argument('--metadata-only', action='store_true', help='Only warm video metadata')
+    args = parser.parse_args()
+
+    with open(args.source, errors='replace') as f:
+        lines = f.readlines()
+    items = items_from_log(lines, args.top)
+    if not items:
+        items = items_from_urls(lines, args.format)
+    if not items:
+        print("❌ No URLs or download requests found")
+        return 1
+
+    headers = {'X-Admin-Token': args.token}
+    response = requests.post(f"{args.server}/admin/prewarm", headers=headers, json={
+        'items': items,
+        'concurrency': args.concurrency,
+        'rate': args.rate,
+        'metadata_only': args.metadata_only,
+    }, timeout=30)
+    if response.status_code != 202:
+        print(f"❌ Server refused the job: {response.status_code} {response.text}")
+        return 1
+
+    job_id = response.json()['job_id']
+    print(f"🔥 Prewarming {len(items)} items (job {job_id})")
+
+    while True:
+        time.sleep(2)
+        status = requests.get(f"{args.server}/admin/prewarm/{job_id}", headers=headers, timeout=30).json()
+        print(f"   {status['done']}/{status['total']} done, {status['warmed']} warmed, "
+              f"{status['cached']} already cached, {status['failed']} failed, "
+              f"{format_bytes(status['bytes_warmed'])} warmed")
+        if status.get('state') == 'finished':
+            break
+
+    for error in status.get('errors', []):
+        print(f"   ⚠️  {error['url']}: {error['error']}")
+    print(f"✅ Done in {status['finished'] - status['started']:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Live download progress for Server-Sent Events clients
+Progress snapshots are written to small JSON files so that any worker
+process can stream a job started by another worker
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# yt-dlp postprocessor name -> stage reported to the client
+POSTPROCESSOR_STAGES = {
+    'Merger': 'merging',
+    'FFmpegMerger': 'merging',
+    'FFmpegExtractAudio': 'converting',
+    'FFmpegVideoConvertor': 'converting',
+    'FFmpegVideoRemuxer': 'converting',
+    'MP4FastPath': 'converting',
+}
+
+FINAL_STAGES = ('finished', 'error')
+
+
+class JobIdInUse(Exception):
+    """A client-chosen job_id already has a progress file"""
+
+
+class ProgressReporter:
+    """Collects yt-dlp progress and postprocessor hooks for a single job"""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self.state = {
+            'job_id': job_id,
+            'stage': 'queued',
+            'downloaded_bytes': 0,
+            'total_bytes': None,
+            'speed': None,
+            'eta': None,
+            'seq': 0,
+        }
+        self._last_publish = 0.0
+        self._publish(force=True)
+
+    def set_stage(self, stage, **fields):
+        """Switch to a new stage; stage changes are never rate-limited"""
+        changed = stage != self.state['stage']
+        self.state['stage'] = stage
+        self.state.update(fields)
+        self._publish(force=changed)
+
+    def progress_hook(self, d):
+        """yt-dlp progress_hooks entry"""
+        status = d.get('status')
+        if status == 'downloading':
+            changed = self.state['stage'] != 'downloading'
+            self.state['stage'] = 'downloading'
+            self.state['downloaded_bytes'] = d.get('downloaded_bytes') or 0
+            self.state['total_bytes'] = d.get('total_bytes') or d.get('total_bytes_estimate')
+            self.state['speed'] = d.get('speed')
+            self.state['eta'] = d.get('eta')
+            self._publish(force=changed)
+        elif status == 'finished':
+            # One requested format finished; there may be more (video + audio)
+            self.state['downloaded_bytes'] = d.get('downloaded_bytes') or d.get('total_bytes') or self.state['downloaded_bytes']
+            self.state['speed'] = None
+            self.state['eta'] = 0
+            self._publish(force=True)
+        elif status == 'error':
+            self.set_stage('error', error='Download failed')
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor_hooks entry"""
+        if d.get('status') != 'started':
+            return
+        stage = POSTPROCESSOR_STAGES.get(d.get('postprocessor'))
+        if stage:
+            self.set_stage(stage, speed=None, eta=None)
+
+    def finish(self, error=None):
+        """Mark the job as done; the SSE stream closes after this event"""
+        if error:
+            self.set_stage('error', error=str(error))
+        else:
+            self.set_stage('finished', speed=None, eta=0)
+
+    def _publish(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_publish < self.store.min_interval:
+            return
+        self._last_publish = now
+        self.state['seq'] += 1
+        self.state['updated_at'] = time.time()
+        self.store.write(self.job_id, self.state)
+
+
+class ProgressStore:
+    """File-backed progress registry shared by all worker processes"""
+
+    def __init__(self, progress_dir, min_interval=0.25, max_age=3600):
+        self.progress_dir = progress_dir
+        self.min_interval = min_interval
+        self.max_age = max_age
+        os.makedirs(progress_dir, exist_ok=True)
+
+    def new_job_id(self):
+        return uuid.uuid4().hex
+
+    def valid_job_id(self, job_id):
+        return bool(job_id and JOB_ID_PATTERN.match(job_id))
+
+    def reporter(self, job_id):
+        """Create the reporter for a job, pruning stale progress files first
+
+        The job's progress file is created exclusively, so a job_id that
+        another job still has a file for (running, or finished less than
+        ``max_age`` ago) raises JobIdInUse instead of taking over its stream.
+        """
+        self.cleanup()
+        try:
+            os.close(os.open(self._path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise JobIdInUse(job_id)
+        except OSError:
+            pass
+        return ProgressReporter(self, job_id)
+
+    def _path(self, job_id):
+        return os.path.join(self.progress_dir, f"{job_id}.json")
+
+    def write(self, job_id, state):
+        path = self._path(job_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def read(self, job_id):
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stream(self, job_id, wait_timeout=30, keepalive=15, max_duration=3600):
+        """Yield SSE messages until the job finishes or errors"""
+        started = time.monotonic()
+        last_seq = None
+        last_sent = started
+
+        while time.monotonic() - started < max_duration:
+            state = self.read(job_id)
+            now = time.monotonic()
+
+            if state is None:
+                if now - started > wait_timeout:
+                    yield self._event('error', {'job_id': job_id, 'stage': 'error', 'error': 'Unknown job'})
+                    return
+            elif state.get('seq') != last_seq:
+                last_seq = state.get('seq')
+                last_sent = now
+                yield self._event('progress', state)
+                if state.get('stage') in FINAL_STAGES:
+                    return
+
+            if now - last_sent >= keepalive:
+                last_sent = now
+                yield ': keepalive\n\n'
+
+            time.sleep(self.min_interval)
+
+    def _event(self, name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def cleanup(self):
+        """Remove progress files older than max_age"""
+        cutoff = time.time() - self.max_age
+        try:
+            for name in os.listdir(self.progress_dir):
+                path = os.path.join(self.progress_dir, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+        except OSError:
+            pass
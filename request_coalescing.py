@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Coalescing of identical download requests
+Requests for the same artifact key attach to the download already in
+flight instead of starting their own, within a worker (threads wait on the
+leader) and across workers (a per-key file lock). A leader's failure is
+shared the same way: in memory within a worker, and through a per-key
+JSON failure file across workers.
+"""
+
+import os
+import json
+import time
+import threading
+
+from cache_stats import CacheStats
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: in-process coalescing only
+    fcntl = None
+
+
+class SharedFailure(RuntimeError):
+    """A producer in another worker failed with an exception type this coalescer can't rebuild"""
+
+    def __init__(self, error_type, message):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+        self.message = message
+
+
+class _Flight:
+    """One in-progress production of a key inside this process"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class DownloadCoalescer:
+    """Runs at most one producer per key at any moment
+
+    A failure reaches waiters in other workers as its class name, message
+    and plain (str/number/bool/None) attributes. Classes listed in
+    ``errors`` are rebuilt from that; any other type arrives as
+    SharedFailure. Waiting for another worker's lock gives up with
+    TimeoutError after ``wait_timeout`` seconds, polled every
+    ``poll_interval``.
+    """
+
+    def __init__(self, lock_dir, wait_timeout=900, poll_interval=0.25, errors=()):
+        self.lock_dir = lock_dir
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.errors = {cls.__name__: cls for cls in errors}
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = CacheStats(('coalesced_waits', 'shared_failures'))
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def run(self, key, produce, lookup):
+        """Return ``(result, coalesced)`` for ``key``
+
+        ``lookup()`` returns a finished result (e.g. a cache entry) or None;
+        ``produce()`` does the work and returns the result. Only the first
+        caller for a key produces; others, in this worker or another one,
+        wait and share its result or its exception. ``coalesced`` is True
+        when this caller did not produce.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+                self.stats.incr('coalesced_waits')
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError("Timed out waiting for an identical download in progress")
+            if flight.error:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result, coalesced = self._produce_locked(key, produce, lookup)
+            return flight.result, coalesced
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            flight.done.set()
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _produce_locked(self, key, produce, lookup):
+        """Hold the cross-process lock for ``key`` while producing
+
+        A producer that fails records its exception before releasing the
+        lock; workers that were already waiting for the lock raise it too
+        instead of producing again. Requests arriving later try afresh.
+        """
+        if fcntl is None:
+            result = lookup()
+            return (result, True) if result is not None else (produce(), False)
+
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        failure_path = os.path.join(self.lock_dir, f"{key}.failed")
+        waiting_since = time.time()
+        with open(lock_path, 'w') as lock_file:
+            waited = not self._lock_file(lock_file)
+            try:
+                # Another worker may have finished while we waited for the lock
+                result = lookup()
+                if result is not None:
+                    if waited:
+                        self.stats.incr('coalesced_waits')
+                    return result, True
+                error = self._read_failure(failure_path, waiting_since) if waited else None
+                if error is not None:
+                    self.stats.incr('coalesced_waits')
+                    self.stats.incr('shared_failures')
+                    raise error
+                try:
+                    result = produce()
+                except Exception as e:
+                    self._write_failure(failure_path, e)
+                    raise
+                self._remove_failure(failure_path)
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lock_file(self, lock_file):
+        """Take the key's lock; True when it was free, False after waiting for it
+
+        Polls rather than blocking in flock, so a hung producer in another
+        worker costs its waiters ``wait_timeout`` (TimeoutError), not their
+        threads.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return not waited
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Timed out waiting for an identical download in progress")
+                waited = True
+                time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _write_failure(path, error):
+        attributes = {name: value for name, value in vars(error).items()
+                      if not name.startswith('_') and isinstance(value, (str, int, float, bool, type(None)))}
+        record = {'time': time.time(), 'type': type(error).__name__, 'message': str(error), 'attributes': attributes}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _read_failure(self, path, since):
+        """The exception a producer recorded at or after ``since``, else None"""
+        try:
+            with open(path) as f:
+                record = json.load(f)
+            if record['time'] < since:
+                return None
+            cls = self.errors.get(record['type'])
+            if cls is None:
+                return SharedFailure(record['type'], record['message'])
+            # Rebuilt without calling __init__, whose signature is the class's own
+            error = cls.__new__(cls)
+            error.args = (record['message'],)
+            vars(error).update(record.get('attributes') or {})
+            return error
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def _remove_failure(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
@@ -23,6 +23,7 @@ def check_ffmpeg():
                               capture_output=True, text=True)
         if result.returncode == 0:
             print("✅ ffmpeg is installed")
+            report_ffmpeg_capabilities()
             return True
         else:
             print("❌ ffmpeg not working properly")
@@ -40,6 +41,20 @@ def check_ffmpeg():
             print("   - CentOS/RHEL: sudo yum install ffmpeg")
         return False
 
+def report_ffmpeg_capabilities():
+    """Print the build probe the API runs at startup (encoders, muxers, options)"""
+    from ffmpeg_pipeline import FFmpegPipeline
+    report = FFmpegPipeline().capability_report()
+    if not report['available']:
+        print(f"⚠️  {report['error']}")
+        return
+    print(f"   ffmpeg {report['version']}, ffprobe {report['ffprobe_version']}")
+    for format_type, missing in report['formats'].items():
+        if missing != 'ok':
+            print(f"⚠️  {format_type} unavailable: {'; '.join(missing)}")
+    if not report['flags'].get('lame_reservoir'):
+        print("⚠️  libmp3lame without -reservoir: long MP3s are encoded in one piece")
+
 def install_dependencies():
     """Install Python dependencies"""
     print("📦 Installing dependencies...")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for the artifact cache
+Publishes files into caches on a temporary directory and checks the size
+limit and eviction, including two cache instances sharing one directory
+the way gunicorn worker processes do without scanning the index per
+request, and moves between the hot and disk tiers
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from artifact_cache import ArtifactCache
+
+
+def make_file(workdir, name, size):
+    path = os.path.join(workdir, name)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def disk_bytes(cache):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(cache.objects_dir) for name in files)
+
+
+def wait_until(condition, timeout=5):
+    """Tier moves run in background threads"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_limit_and_eviction():
+    workdir = tempfile.mkdtemp()
+    try:
+        cache = ArtifactCache(os.path.join(workdir, 'cache'), 1_000_000, policy='lru')
+        for i in range(4):
+            cache.publish(f'key{i}', make_file(workdir, f'{i}.mp3', 400_000), {'title': str(i)})
+        assert cache.get('key0') is None and cache.get('key1') is None, "oldest entries evicted"
+        assert cache.get('key3')['title'] == '3'
+        assert cache.total_bytes == disk_bytes(cache) == 800_000
+        assert cache.report()['evictions_capacity'] == 2
+        print("✅ size limit enforced, least recently used evicted")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_limit_shared_by_workers():
+    for policy in ('lru', 'tinylfu'):
+        workdir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(workdir, 'cache')
+            workers = [ArtifactCache(cache_dir, 1_000_000, policy=policy) for _ in range(2)]
+            for i in range(4):
+                workers[i % 2].publish(f'key{i}', make_file(workdir, f'{i}.mp3', 400_000), {'title': str(i)})
+                assert disk_bytes(workers[0]) <= 1_000_000, (policy, i, disk_bytes(workers[0]))
+
+            rows = workers[0].index.all()
+            assert sum(row['size'] for row in rows) == disk_bytes(workers[0]), "index and disk agree"
+            assert len(rows) <= 2, (policy, len(rows))
+            assert workers[0].get('key3') is not None and workers[1].get('key3') is not None
+            for cache in workers:
+                assert cache.total_bytes == disk_bytes(cache), (policy, cache.total_bytes)
+        finally:
+            shutil.rmtree(workdir)
+    print("✅ two workers on one directory stay under one limit")
+
+
+def test_requests_do_not_scan_index():
+    workdir = tempfile.mkdtemp()
+    try:
+        cache_dir = os.path.join(workdir, 'cache')
+        workers = [ArtifactCache(cache_dir, 1_000_000, policy='tinylfu') for _ in range(2)]
+
+        def scan():
+            raise AssertionError("index scanned on a request")
+        for cache in workers:
+            cache.index.all = scan
+
+        assert workers[0].get('unknown') is None
+        assert workers[0].stats.snapshot()['evictions_missing'] == 0, "a plain miss deletes nothing"
+
+        # Worker 1 never reads what worker 0 published, yet the node stays under the limit
+        for i in range(3):
+            workers[0].publish(f'key{i}', make_file(workdir, f'{i}.mp3', 300_000), {'title': str(i)})
+        for i in range(3, 5):
+            workers[1].publish(f'key{i}', make_file(workdir, f'{i}.mp3', 300_000), {'title': str(i)})
+        assert workers[1].total_bytes == disk_bytes(workers[1]) <= 1_000_000, workers[1].total_bytes
+        assert workers[1].get('key4') is not None and workers[0].get('key4') is not None, "read across workers"
+        assert workers[0].get('key0') is None, "least recently accessed evicted for the node"
+        print("✅ requests look up single rows, the node limit comes from the index total")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_hot_and_cold_tiers():
+    workdir = tempfile.mkdtemp()
+    try:
+        cache = ArtifactCache(os.path.join(workdir, 'cache'), 10_000_000, policy='lru',
+                              hot_dir=os.path.join(workdir, 'hot'), hot_max_bytes=1_000_000, promote_hits=2)
+        cache.publish('key0', make_file(workdir, '0.mp3', 400_000), {'title': '0'})
+        assert cache.hot.holds(cache.get('key0')['path']), "new artifacts go to the hot tier"
+
+        # Two more don't fit next to key0: the least recent is demoted to disk, not dropped
+        for i in (1, 2):
+            cache.publish(f'key{i}', make_file(workdir, f'{i}.mp3', 400_000), {'title': str(i)})
+        assert wait_until(lambda: cache.cold.holds(cache.index.get('key0')['path']))
+        assert cache.get('key0') is not None and cache.hot_bytes <= 1_000_000
+        hot_files = os.path.join(workdir, 'hot', 'objects', 'ke')
+        assert wait_until(lambda: sorted(os.listdir(hot_files)) == ['key1.mp3', 'key2.mp3'])
+
+        # Read again, it is promoted back (demoting another one)
+        cache.get('key0')
+        assert wait_until(lambda: cache.hot.holds(cache.index.get('key0')['path']))
+        assert wait_until(lambda: cache.report()['hot_entries'] == 2)
+        assert cache.hot_bytes <= 1_000_000
+        stats = cache.report()
+        assert stats['promotions'] == 1 and stats['demotions'] >= 1, stats
+        assert stats['entries'] == 3 and stats['hot_entries'] == 2, stats
+        print("✅ artifacts demoted to disk when the hot tier is full and promoted when read")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    try:
+        test_limit_and_eviction()
+        test_limit_shared_by_workers()
+        test_requests_do_not_scan_index()
+        test_hot_and_cold_tiers()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite artifact index
+Checks row round trips, ordering, the size total and conditional moves,
+and that a cache
+restarted on an existing directory rebuilds its state from the index and
+drops artifacts whose files are missing or truncated
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+from artifact_cache import ArtifactCache
+from artifact_index import ArtifactIndex
+
+
+def entry(key, path, size, last_access, **meta):
+    return {'key': key, 'path': path, 'ext': 'mp3', 'size': size, 'checksum': None,
+            'created': 1.0, 'last_access': last_access, 'probe': None, **meta}
+
+
+def test_rows():
+    workdir = tempfile.mkdtemp()
+    try:
+        index = ArtifactIndex(os.path.join(workdir, 'index.sqlite3'))
+        index.put(entry('a', '/x/a.mp3', 10, 3.0, title='A', probe={'duration': 1.5}))
+        index.put(entry('b', '/x/b.mp3', 20, 2.0, title='B'))
+        assert len(index) == 2
+        row = index.get('a')
+        assert row['title'] == 'A' and row['probe'] == {'duration': 1.5} and row['size'] == 10, row
+        assert [row['key'] for row in index.all()] == ['b', 'a'], "least recently accessed first"
+
+        index.touch('b', 4.0)
+        assert [row['key'] for row in index.all()] == ['a', 'b']
+
+        assert index.move('a', '/x/a.mp3', '/y/a.mp3') and index.get('a')['path'] == '/y/a.mp3'
+        assert not index.move('a', '/x/a.mp3', '/z/a.mp3'), "moved elsewhere in the meantime"
+
+        assert index.total_bytes() == 30
+        index.put(entry('a', '/y/a.mp3', 15, 5.0, title='A2'))
+        assert len(index) == 2 and index.get('a')['title'] == 'A2', "put replaces the row"
+        assert index.total_bytes() == 35, "total follows a replaced row's size"
+        assert [row['key'] for row in index.oldest(1)] == ['b']
+        assert [row['key'] for row in index.oldest(5, exclude='b')] == ['a']
+        index.remove('a')
+        assert index.get('a') is None and len(index) == 1 and index.total_bytes() == 20
+
+        # A second handle (another worker) sees the same rows
+        assert ArtifactIndex(index.db_path).get('b')['title'] == 'B'
+        print("✅ index rows round-trip, order by access and move conditionally")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_restart_from_index():
+    workdir = tempfile.mkdtemp()
+    try:
+        cache_dir = os.path.join(workdir, 'cache')
+        cache = ArtifactCache(cache_dir, 10_000_000, policy='lru')
+        for name in ('kept', 'missing', 'truncated'):
+            path = os.path.join(workdir, f'{name}.mp3')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1000))
+            cache.publish(name, path, {'title': name})
+        os.remove(cache.get('missing')['path'])
+        with open(cache.get('truncated')['path'], 'r+b') as f:
+            f.truncate(500)
+
+        restarted = ArtifactCache(cache_dir, 10_000_000, policy='lru')
+        assert restarted.get('kept')['title'] == 'kept'
+        assert restarted.get('missing') is None and restarted.get('truncated') is None
+        assert len(restarted.index) == 1 and restarted.total_bytes == 1000
+        assert restarted.report()['evictions_integrity'] == 2
+        print("✅ restart reads the index and drops missing or truncated artifacts")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_legacy_metadata_import():
+    workdir = tempfile.mkdtemp()
+    try:
+        cache_dir = os.path.join(workdir, 'cache')
+        data_path = os.path.join(cache_dir, 'objects', 'le', 'legacy.mp3')
+        os.makedirs(os.path.dirname(data_path))
+        with open(data_path, 'wb') as f:
+            f.write(b'x' * 100)
+        with open(os.path.join(cache_dir, 'objects', 'le', 'legacy.json'), 'w') as f:
+            json.dump({'key': 'legacy', 'path': data_path, 'ext': 'mp3', 'title': 'Old', 'last_access': 1.0}, f)
+
+        cache = ArtifactCache(cache_dir, 10_000_000, policy='lru')
+        assert cache.get('legacy')['title'] == 'Old'
+        assert not os.path.exists(os.path.join(cache_dir, 'objects', 'le', 'legacy.json'))
+        print("✅ per-artifact JSON metadata imported once")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    try:
+        test_rows()
+        test_restart_from_index()
+        test_legacy_metadata_import()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
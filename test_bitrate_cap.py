@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the source bitrate cap
+Checks which MP3 bitrate is picked for a given source bitrate and how the
+source bitrate is read from the extracted formats
+"""
+
+import sys
+
+from advanced_downloader import AdvancedYouTubeDownloader
+
+
+def test_cap_audio_quality():
+    downloader = AdvancedYouTubeDownloader()
+    assert downloader.cap_audio_quality('320', 129.5) == '128'
+    assert downloader.cap_audio_quality('320', 160) == '160'
+    assert downloader.cap_audio_quality('320', 50) == '64'
+    assert downloader.cap_audio_quality('128', 160) == '128', "never raised above the request"
+    assert downloader.cap_audio_quality('320', 400) == '320'
+
+    # Unknown source bitrate and VBR levels pass through
+    assert downloader.cap_audio_quality('320', None) == '320'
+    assert downloader.cap_audio_quality('0', 128) == '0'
+    print("✅ MP3 bitrate capped at the source bitrate")
+
+
+def test_source_audio_bitrate():
+    downloader = AdvancedYouTubeDownloader()
+    opus = {'vcodec': 'none', 'acodec': 'opus', 'ext': 'webm', 'abr': 160}
+    aac = {'vcodec': 'none', 'acodec': 'mp4a.40.2', 'ext': 'm4a', 'abr': 129.5}
+    video = {'vcodec': 'avc1', 'acodec': 'none', 'ext': 'mp4', 'tbr': 900}
+    assert downloader.source_audio_bitrate({'formats': [opus, aac, video]}) == 129.5
+    assert downloader.source_audio_bitrate({'formats': [opus]}) == 160
+    assert downloader.source_audio_bitrate({'formats': [video]}) is None
+    assert downloader.source_audio_bitrate(None) is None
+    print("✅ source bitrate read from the format the download would pick")
+
+
+def main():
+    try:
+        test_cap_audio_quality()
+        test_source_audio_bitrate()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the cache admission and eviction policies
+Checks that TinyLFU keeps popular keys through a scan of one-off keys
+where LRU loses them, and that neither policy goes over its byte limit
+"""
+
+import sys
+
+from cache_policy import CountMinSketch, LRUPolicy, TinyLFUPolicy
+
+
+def test_sketch_counts_and_ages():
+    sketch = CountMinSketch(width=1024, sample_size=100)
+    for _ in range(20):
+        sketch.increment('popular')
+    assert sketch.estimate('popular') == CountMinSketch.MAX_COUNT
+    assert sketch.estimate('never') == 0
+    for i in range(100):
+        sketch.increment(f'other{i}')
+    assert sketch.estimate('popular') < CountMinSketch.MAX_COUNT, "counters halved after sample_size"
+    print("✅ count-min sketch counts, saturates and ages")
+
+
+def fill(policy, keys, size):
+    evicted = []
+    for key in keys:
+        policy.record(key)
+        evicted.extend(policy.insert(key, size))
+    return evicted
+
+
+def test_tinylfu_admission():
+    popular = [f'popular{i}' for i in range(5)]
+    scan = [f'oneoff{i}' for i in range(50)]
+    for policy in (TinyLFUPolicy(1000, window_fraction=0.1), LRUPolicy(1000)):
+        fill(policy, popular, 100)
+        for _ in range(5):
+            for key in popular:
+                policy.record(key)
+                policy.touch(key)
+        fill(policy, scan, 100)
+        kept = [key for key in popular if key in policy]
+        if policy.name == 'tinylfu':
+            assert kept == popular, kept
+        else:
+            assert kept == [], kept
+        assert policy.total_bytes <= 1000
+    print("✅ TinyLFU keeps popular keys through a scan, LRU does not")
+
+
+def test_oversized_newest_entry():
+    policy = TinyLFUPolicy(1000)
+    fill(policy, ['a', 'b'], 400)
+    evicted = fill(policy, ['big'], 900)
+    assert 'big' in policy and policy.total_bytes <= 1000, (policy.total_bytes, evicted)
+    assert set(evicted) == {'a', 'b'}, evicted
+    print("✅ an entry larger than the window still fits the limit")
+
+
+def main():
+    try:
+        test_sketch_counts_and_ages()
+        test_tinylfu_admission()
+        test_oversized_newest_entry()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for time-range clip parsing
+Checks the start/end forms parse_clip_range accepts, clamping to the
+video's duration, and the errors returned for invalid ranges
+"""
+
+import sys
+
+from advanced_downloader import AdvancedYouTubeDownloader
+
+FORMAT_ERROR = "start and end must be seconds or [hh:]mm:ss"
+RANGE_ERROR = "end must be after start and inside the video"
+
+
+def test_accepted_forms():
+    downloader = AdvancedYouTubeDownloader()
+    assert downloader.parse_clip_range('90', '120') == ((90, 120), None)
+    assert downloader.parse_clip_range('1:30', '01:02:03') == ((90, 3723), None)
+    assert downloader.parse_clip_range('12.5', '1:00.5') == ((12.5, 60.5), None)
+    assert downloader.parse_clip_range('', '20', 100) == ((0, 20), None), "start defaults to 0"
+    assert downloader.parse_clip_range('10', '', 100) == ((10, 100), None), "end defaults to the duration"
+    assert downloader.parse_clip_range('', '', 100) == (None, None), "no clip"
+    print("✅ seconds and [hh:]mm:ss parsed")
+
+
+def test_end_clamped_to_duration():
+    downloader = AdvancedYouTubeDownloader()
+    assert downloader.parse_clip_range('10', '500', 100) == ((10, 100), None)
+    assert downloader.parse_clip_range('1:00', '2:00:00', 3600) == ((60, 3600), None)
+    assert downloader.parse_clip_range('150', '200', 100) == (None, RANGE_ERROR), "starts past the end"
+    print("✅ end clamped to the video's duration")
+
+
+def test_errors():
+    downloader = AdvancedYouTubeDownloader()
+    assert downloader.parse_clip_range('30', '10', 100) == (None, RANGE_ERROR), "start after end"
+    assert downloader.parse_clip_range('10', '10', 100) == (None, RANGE_ERROR), "empty clip"
+    assert downloader.parse_clip_range('-5', '10', 100) == (None, FORMAT_ERROR), "negative start"
+    assert downloader.parse_clip_range('10', '-5', 100) == (None, FORMAT_ERROR), "negative end"
+    assert downloader.parse_clip_range('abc', '10', 100) == (None, FORMAT_ERROR)
+    assert downloader.parse_clip_range('10', '1:xx', 100) == (None, FORMAT_ERROR)
+    assert downloader.parse_clip_range('10', '') == (None, "end is required when the video duration is unknown")
+    print("✅ invalid ranges rejected with an error")
+
+
+def main():
+    try:
+        test_accepted_forms()
+        test_end_clamped_to_duration()
+        test_errors()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for redirect delivery
+Checks which progressive formats get_direct_stream hands to a client:
+URLs signed for the server's IP or past their expiry are not redirected,
+and resolutions that aren't a height fall back to proxying
+"""
+
+import sys
+import time
+
+from advanced_downloader import AdvancedYouTubeDownloader
+
+
+def media_url(sparams, expire):
+    return f"https://rr1.googlevideo.com/videoplayback?expire={int(expire)}&sparams={sparams}&itag=18"
+
+
+def progressive(format_id, height, url):
+    return {'format_id': format_id, 'height': height, 'ext': 'mp4', 'vcodec': 'avc1', 'acodec': 'mp4a.40.2',
+            'protocol': 'https', 'url': url}
+
+
+def test_redirectable_urls():
+    downloader = AdvancedYouTubeDownloader()
+    later = time.time() + 3600
+    assert downloader.is_redirectable(media_url('expire,itag,source', later))
+    assert not downloader.is_redirectable(media_url('expire,ip,itag', later)), "bound to the server's IP"
+    assert not downloader.is_redirectable(media_url('expire,itag', time.time() - 10)), "expired"
+    assert not downloader.is_redirectable(media_url('expire,itag', time.time() + 30)), "expires before the client gets there"
+    assert downloader.is_redirectable('https://example.com/video.mp4')
+    print("✅ IP-bound and expired URLs are not redirectable")
+
+
+def test_direct_stream_falls_back():
+    downloader = AdvancedYouTubeDownloader()
+    later = time.time() + 3600
+    info = {'formats': [progressive('18', 360, media_url('expire,itag', later)),
+                        progressive('22', 720, media_url('expire,ip,itag', later))]}
+    stream = downloader.get_direct_stream(info)
+    assert stream['format_id'] == '18' and stream['expires_at'] == int(later), stream
+
+    assert downloader.get_direct_stream(info, format_id='22') is None
+    assert downloader.get_direct_stream({'formats': [progressive('18', 360, media_url('expire,itag', 1))]}) is None
+    print("✅ only redirectable formats are picked, else proxy delivery")
+
+
+def test_resolution_parsing():
+    downloader = AdvancedYouTubeDownloader()
+    later = time.time() + 3600
+    info = {'formats': [progressive('18', 360, media_url('expire,itag', later)),
+                        progressive('22', 720, media_url('expire,itag', later))]}
+    assert downloader.get_direct_stream(info, resolution='720p')['format_id'] == '22'
+    assert downloader.get_direct_stream(info, resolution='480')['format_id'] == '18'
+    assert downloader.get_direct_stream(info, resolution='240p') is None
+    assert downloader.get_direct_stream(info, resolution='best') is None, "not a height: proxy"
+    assert downloader.get_direct_stream(info, resolution='4k') is None, "not a height of 4"
+    assert downloader.get_direct_stream(info, resolution='best', format_id='22')['format_id'] == '22'
+    print("✅ resolutions parsed as heights, anything else falls back to proxy delivery")
+
+
+def main():
+    try:
+        test_redirectable_urls()
+        test_direct_stream_falls_back()
+        test_resolution_parsing()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
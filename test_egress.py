@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for egress shaping
+Times streams through per-connection and shared global token buckets,
+and checks ThrottledFileSender sends exactly the file in pooled chunks
+that go back to the pool
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+
+from egress import BufferPool, TokenBucket, ThrottledFileSender
+
+KB = 1024
+
+
+def write_file(directory, size):
+    path = os.path.join(directory, f'file-{size}.bin')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def drain(stream):
+    return b''.join(stream)
+
+
+def test_connection_rate():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_file(directory, 400 * KB)
+        sender = ThrottledFileSender(chunk_size=16 * KB)
+        # The first second's worth of tokens (the burst) is free; the rest is paid at the rate
+        started = time.monotonic()
+        drain(sender.stream(path, rate=200 * KB))
+        elapsed = time.monotonic() - started
+        assert 0.9 <= elapsed <= 1.6, f"400 KB at 200 KB/s with a 200 KB burst took {elapsed:.2f}s"
+    print("✅ per-connection bucket holds a stream to its rate")
+
+
+def test_global_rate_shared():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_file(directory, 200 * KB)
+        global_bucket = TokenBucket(400 * KB, burst=16 * KB, shared=True)
+        sender = ThrottledFileSender(global_bucket, chunk_size=16 * KB)
+        threads = [threading.Thread(target=drain, args=(sender.stream(path),)) for _ in range(4)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        # 4 x 200 KB through one 400 KB/s bucket, whatever the number of connections
+        assert 1.8 <= elapsed <= 2.6, f"800 KB at a global 400 KB/s took {elapsed:.2f}s"
+
+        assert TokenBucket(0).consume(10 ** 9) == 0.0, "rate 0 is unlimited"
+    print("✅ global bucket limits all connections together")
+
+
+class RecordingPool(BufferPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handed_out = []
+
+    def acquire(self, timeout=None):
+        buffer = super().acquire(timeout)
+        self.handed_out.append(buffer)
+        return buffer
+
+
+def test_chunks_from_pool():
+    with tempfile.TemporaryDirectory() as directory:
+        size = 100 * KB + 123
+        path = write_file(directory, size)
+        with open(path, 'rb') as f:
+            expected = f.read()
+
+        pool = RecordingPool(16 * KB, count=2)
+        sender = ThrottledFileSender(chunk_size=16 * KB, buffer_pool=pool)
+        closed = []
+        stream = sender.stream(path, on_close=lambda: closed.append(True))
+        assert pool.in_use == 0, "no buffer held before the first read"
+
+        chunks = []
+        for chunk in stream:
+            assert pool.in_use == 1, "one pooled buffer per streaming response"
+            chunks.append(chunk)
+        assert b''.join(chunks) == expected, "sent bytes differ from the file"
+        assert [len(chunk) for chunk in chunks] == [16 * KB] * 6 + [4 * KB + 123]
+        assert len(pool.handed_out) == 1 and len(pool.handed_out[0]) == 16 * KB
+        assert pool.in_use == 0 and closed == [True], "buffer returned and on_close called"
+
+        # A client that disconnects mid-file returns the buffer too
+        stream = sender.stream(path)
+        next(stream)
+        stream.close()
+        assert pool.in_use == 0
+    print("✅ file sent exactly, in pooled chunks returned to the pool")
+
+
+def main():
+    try:
+        test_connection_rate()
+        test_global_rate_shared()
+        test_chunks_from_pool()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
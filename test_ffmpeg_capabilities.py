@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the ffmpeg capability probe
+Runs the probe against a fake ffmpeg build (a shell script printing
+-version, -encoders, -muxers and -h output) without libmp3lame or the
+'ipod' muxer, and checks what the pipeline decides from it
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+from ffmpeg_pipeline import FFmpegPipeline
+from parallel_mp3 import SegmentedMP3Encoder
+
+FAKE_FFMPEG = r'''#!/bin/sh
+for arg in "$@"; do last="$arg"; done
+case "$*" in
+  *-version*)
+    echo "ffmpeg version 6.1.1 Copyright (c) 2000-2023 the FFmpeg developers"
+    echo "configuration: --prefix=/usr --enable-gpl --enable-libopus --disable-doc" ;;
+  *-encoders*)
+    printf 'Encoders:\n V..... = Video\n ------\n A....D aac                  AAC (Advanced Audio Coding)\n A....D libopus              libopus Opus\n' ;;
+  *-muxers*)
+    printf 'File formats:\n D. = Demuxing supported\n .E = Muxing supported\n --\n  E mp3             MP3\n  E mp4             MP4\n  E ogg             Ogg\n' ;;
+  *"-h long"*)
+    printf 'Global options:\n-filter_threads     number of non-complex filter threads\n' ;;
+  *)
+    exit 1 ;;
+esac
+'''
+
+
+def fake_pipeline(workdir):
+    path = os.path.join(workdir, 'ffmpeg')
+    with open(path, 'w') as f:
+        f.write(FAKE_FFMPEG)
+    os.chmod(path, 0o755)
+    return FFmpegPipeline(ffmpeg=path, ffprobe=path)
+
+
+def test_probe_and_decisions():
+    workdir = tempfile.mkdtemp()
+    try:
+        pipeline = fake_pipeline(workdir)
+        caps = pipeline.capabilities
+        assert caps['available'] and caps['version'] == '6.1.1', caps
+        assert caps['build_flags'] == ['gpl', 'libopus'], caps['build_flags']
+        assert caps['encoders'] == {'aac', 'libopus'}, caps['encoders']
+        assert caps['muxers'] == {'mp3', 'mp4', 'ogg'}, caps['muxers']
+        assert caps['flags'] == {'filter_threads': True, 'lame_reservoir': False, 'mp3_write_xing': False}
+
+        assert pipeline.missing('mp3') == ['no libmp3lame encoder']
+        assert pipeline.missing('m4a') == [] and pipeline.muxer('m4a') == 'mp4'
+        assert pipeline.missing('opus') == [] and pipeline.muxer('opus') == 'ogg'
+        assert not SegmentedMP3Encoder(pipeline, segments=4).supported()
+
+        report = pipeline.capability_report()
+        assert report['formats'] == {'mp3': ['no libmp3lame encoder'], 'mp4': 'ok', 'm4a': 'ok', 'opus': 'ok'}
+        assert report['encoders']['aac'] and not report['encoders']['libfdk_aac']
+        print("✅ probe parsed and format decisions made from it")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_missing_ffmpeg():
+    pipeline = FFmpegPipeline(ffmpeg='/nonexistent/ffmpeg', ffprobe='/nonexistent/ffprobe')
+    assert not pipeline.capabilities['available']
+    assert pipeline.missing('mp4') == ['ffmpeg not found or not working']
+    assert pipeline.muxer('mp4') is None
+    print("✅ missing ffmpeg reported, not raised")
+
+
+def main():
+    try:
+        test_probe_and_decisions()
+        test_missing_ffmpeg()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
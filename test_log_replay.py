@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for replaying app.log
+Formats /download request lines the way app.py logs them, parses them back
+into prewarm items and cache simulator keys, and checks that every field
+survives, including lines written before Normalize/Tags/Cap_Bitrate
+"""
+
+import os
+import sys
+import tempfile
+
+from advanced_downloader import AdvancedYouTubeDownloader
+from cache_simulator import download_request_line, read_trace
+from prewarm import items_from_log
+
+URL = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+
+
+def test_round_trip():
+    downloader = AdvancedYouTubeDownloader()
+    requests = [
+        ('mp3', '', '', '320', False, False, True),
+        ('mp3', '', '', '0', True, True, False),   # V0, as parse_audio_quality logs it
+        ('m4a', '', '', '', True, False, True),
+        ('mp4', '720p', '', '', False, True, True),
+        ('mp4', '', '137', '', False, False, True),
+    ]
+    lines = [f"2026-10-19 11:00:00,000 - app - INFO - {download_request_line(URL, *request)}\n" for request in requests]
+    items = items_from_log(lines)
+    assert len(items) == len(requests), items
+
+    for item, (fmt, resolution, format_id, quality, normalize, tags, cap_bitrate) in zip(items, requests):
+        assert (item['format'], item['resolution'], item['format_id']) == (fmt, resolution, format_id), item
+        assert (item['normalize'], item['tags'], item['cap_bitrate']) == (normalize, tags, cap_bitrate), item
+        # What start_prewarm does with it
+        parsed, error = downloader.parse_audio_quality(item['audio_quality'])
+        assert error is None and parsed == quality, (item, parsed, error)
+    print("✅ logged /download requests replay with every field")
+
+
+def test_older_lines():
+    line = f"INFO - Download request: URL={URL}, Format=mp3, Resolution=, Format_ID=, Audio_Quality=192\n"
+    item, = items_from_log([line])
+    assert item['audio_quality'] == '192' and item['cap_bitrate'] and not item['normalize'] and not item['tags'], item
+    print("✅ lines from before the new fields still replay")
+
+
+def test_simulator_keys():
+    fd, path = tempfile.mkstemp(suffix='.log')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(download_request_line(URL, 'mp3', '', '', '320', False, False, True) + '\n')
+            f.write(download_request_line(URL, 'mp3', '', '', '320', True, True, False) + '\n')
+        keys = [key for key, _ in read_trace(path)]
+        assert keys == ['dQw4w9WgXcQ:mp3:320', 'dQw4w9WgXcQ:mp3:320+loudnorm+tags+uncapped'], keys
+        print("✅ simulator keys tell the variants apart")
+    finally:
+        os.remove(path)
+
+
+def main():
+    try:
+        test_round_trip()
+        test_older_lines()
+        test_simulator_keys()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
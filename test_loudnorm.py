@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for loudness normalization
+Checks the loudnorm filter for single-pass and cached-stats runs, reading
+the stats from ffmpeg's report, and with ffmpeg installed that a second
+encode from the cached stats lands on the target loudness
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+from ffmpeg_pipeline import FFmpegPipeline, Loudnorm
+
+REPORT = '''[Parsed_loudnorm_0 @ 0x55d0c2b0a2c0]
+{
+	"input_i" : "-27.61",
+	"input_tp" : "-4.47",
+	"input_lra" : "18.06",
+	"input_thresh" : "-39.20",
+	"output_i" : "-14.24",
+	"output_tp" : "-1.00",
+	"output_lra" : "7.80",
+	"output_thresh" : "-24.93",
+	"normalization_type" : "dynamic",
+	"target_offset" : "0.24"
+}
+[out#0/mp3 @ 0x55d0c2b09f40] video:0KiB audio:4700KiB
+'''
+
+
+def test_filter_and_stats():
+    single = Loudnorm(-14, sample_rate=44100)
+    assert single.filter() == 'loudnorm=I=-14:TP=-1.0:LRA=11.0:print_format=json'
+    assert single.args()[-2:] == ['-ar', '44100']
+    single.read(REPORT)
+    assert single.measured == {'input_i': -27.61, 'input_tp': -4.47, 'input_lra': 18.06,
+                               'input_thresh': -39.2, 'target_offset': 0.24, 'target': -14}, single.measured
+
+    linear = Loudnorm(-14, single.measured)
+    assert 'measured_I=-27.61' in linear.filter() and 'linear=true' in linear.filter()
+    assert 'offset=0.24' in linear.filter()
+    assert 'offset=' not in Loudnorm(-16, single.measured).filter(), "offset belongs to the measured target"
+
+    silent = Loudnorm(-14)
+    silent.read(REPORT.replace('"-27.61"', '"-inf"'))
+    assert silent.measured is None
+    print("✅ loudnorm filter and measured stats")
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg not found")
+def test_cached_stats_hit_target():
+    workdir = tempfile.mkdtemp()
+    try:
+        pipeline = FFmpegPipeline()
+        source = os.path.join(workdir, 'source.m4a')
+        pipeline.run(['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100:duration=20',
+                      '-af', 'volume=-20dB', '-c:a', 'aac', '-b:a', '192k', source])
+        first = Loudnorm(-14, sample_rate=44100)
+        pipeline.encode_mp3(source, os.path.join(workdir, 'first.mp3'), '192', 20, first)
+        assert first.measured, "single pass measured nothing"
+
+        second = Loudnorm(-14, first.measured, 44100)
+        output = pipeline.encode_mp3(source, os.path.join(workdir, 'second.mp3'), '320', 20, second)
+        check = Loudnorm(-14, sample_rate=44100)
+        check.read(pipeline.run(['-i', output, '-af', check.filter(), '-f', 'null', '-'], loglevel='info').stderr)
+        assert abs(check.measured['input_i'] + 14) < 1, check.measured
+        print("✅ cached stats normalize to the target in one pass")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    try:
+        test_filter_and_stats()
+        if shutil.which('ffmpeg'):
+            test_cached_stats_hit_target()
+        else:
+            print("⚠️  ffmpeg not found, skipping real encode")
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for tagged downloads
+Checks the ffmpeg arguments MediaTags adds per container, and with ffmpeg
+installed that one encode writes the ID3 tags and cover art (read back
+with mutagen)
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import importlib.util
+
+import pytest
+
+from ffmpeg_pipeline import FFmpegPipeline, MediaTags
+
+
+def test_tag_arguments():
+    tags = MediaTags(title='Song', artist='Band', date='2021', cover='/tmp/cover.webp')
+    assert tags.inputs('mp3') == ['-i', '/tmp/cover.webp']
+    mp3 = tags.outputs('mp3', 1)
+    assert mp3[:8] == ['-map', '1:v:0', '-c:v', 'mjpeg', '-disposition:v:0', 'attached_pic', '-metadata', 'title=Song']
+    assert 'artist=Band' in mp3 and 'date=2021' in mp3 and not any(arg.startswith('album=') for arg in mp3)
+    assert mp3[-2:] == ['-id3v2_version', '3']
+
+    # Ogg and MP4 video get the text tags only
+    assert tags.inputs('opus') == [] and '-map' not in tags.outputs('opus', 1)
+    assert tags.inputs('mp4') == [] and tags.outputs('mp4', None) == ['-metadata', 'title=Song', '-metadata', 'artist=Band', '-metadata', 'date=2021']
+    print("✅ tag and cover arguments per container")
+
+
+def can_encode():
+    """Why the real encode can't run here, or None"""
+    if not shutil.which('ffmpeg'):
+        return "ffmpeg not found"
+    if importlib.util.find_spec('mutagen') is None:
+        return "mutagen not installed"
+    return None
+
+
+@pytest.mark.skipif(can_encode() is not None, reason=str(can_encode()))
+def test_tagged_encode():
+    from mutagen.id3 import ID3
+    workdir = tempfile.mkdtemp()
+    try:
+        pipeline = FFmpegPipeline()
+        source = os.path.join(workdir, 'source.m4a')
+        cover = os.path.join(workdir, 'cover.png')
+        pipeline.run(['-f', 'lavfi', '-i', 'sine=frequency=440:duration=5', '-c:a', 'aac', source])
+        pipeline.run(['-f', 'lavfi', '-i', 'testsrc2=size=320x180', '-frames:v', '1', cover])
+
+        output = pipeline.encode_mp3(source, os.path.join(workdir, 'tagged.mp3'), '128', 5,
+                                     tags=MediaTags(title='Song', artist='Band', cover=cover))
+        id3 = ID3(output)
+        assert str(id3['TIT2']) == 'Song' and str(id3['TPE1']) == 'Band'
+        pictures = id3.getall('APIC')
+        assert pictures and pictures[0].mime == 'image/jpeg', pictures
+        print("✅ tags and cover written by the encode")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    try:
+        test_tag_arguments()
+        if can_encode() is None:
+            test_tagged_encode()
+        else:
+            print(f"⚠️  {can_encode()}, skipping real encode")
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Memory budget test for the streaming layer
+Streams a multi-GB synthetic (sparse) file through the same sender the API
+uses and checks that the worker RSS stays flat while it is sent
+"""
+
+import os
+import sys
+import tempfile
+from flask import Flask, Response
+
+from egress import BufferPool, TokenBucket, ThrottledFileSender
+
+SIZE_GB = float(os.getenv('MEMORY_TEST_SIZE_GB', 2))
+CHUNK_SIZE = 64 * 1024
+MAX_RSS_GROWTH = 32 * 1024 * 1024  # 32MB headroom for allocator noise
+
+
+def current_rss():
+    """Resident set size of this process in bytes (Linux /proc)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def create_synthetic_file(size):
+    """Sparse file, so the test needs no real disk space"""
+    fd, path = tempfile.mkstemp(suffix='.bin')
+    os.close(fd)
+    os.truncate(path, size)
+    return path
+
+
+def test_streaming_rss_stays_flat():
+    """Download a multi-GB file through Flask and watch RSS"""
+    print(f"🔍 Streaming {SIZE_GB:g} GB synthetic file...")
+    size = int(SIZE_GB * 1024 ** 3)
+    path = create_synthetic_file(size)
+
+    pool = BufferPool(CHUNK_SIZE, 4)
+    sender = ThrottledFileSender(TokenBucket(0), CHUNK_SIZE, pool)
+
+    app = Flask(__name__)
+
+    @app.route('/file')
+    def serve_file():
+        response = Response(sender.stream(path), mimetype='application/octet-stream', direct_passthrough=True)
+        response.headers['Content-Length'] = str(size)
+        return response
+
+    try:
+        client = app.test_client()
+        response = client.get('/file', buffered=False)
+        assert response.status_code == 200
+
+        baseline = current_rss()
+        peak = baseline
+        received = 0
+        for i, chunk in enumerate(response.response):
+            received += len(chunk)
+            if i % 256 == 0:
+                peak = max(peak, current_rss())
+        response.close()
+
+        growth = peak - baseline
+        print(f"Received: {received / 1024 ** 3:.2f} GB")
+        print(f"RSS baseline: {baseline / 1024 ** 2:.1f} MB, peak: {peak / 1024 ** 2:.1f} MB")
+
+        assert received == size, f"expected {size} bytes, got {received}"
+        assert growth < MAX_RSS_GROWTH, f"RSS grew by {growth / 1024 ** 2:.1f} MB"
+        assert pool.in_use == 0, "buffer was not returned to the pool"
+        print("✅ RSS stayed flat")
+    finally:
+        os.remove(path)
+
+
+def main():
+    if not os.path.exists('/proc/self/status'):
+        print("⚠️  /proc not available, skipping (Linux only)")
+        return 0
+    try:
+        test_streaming_rss_stays_flat()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
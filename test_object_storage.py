@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared artifact store
+Runs the backend contract (streamed multipart upload, ranged reads) against
+the local-disk backend, and against an S3-compatible endpoint when
+S3_TEST_ENDPOINT_URL is set, e.g. a throwaway MinIO:
+
+    docker run -d -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 minio/minio server /data
+    S3_TEST_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123 \\
+        python test_object_storage.py
+"""
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+
+from artifact_storage import LocalDiskStorage, S3Storage, boto3
+from artifact_cache import ArtifactCache
+
+PART_SIZE = 5 * 1024 * 1024  # smallest part size S3 accepts
+S3_TEST_ENDPOINT_URL = os.getenv('S3_TEST_ENDPOINT_URL', '')
+S3_TEST_BUCKET = os.getenv('S3_TEST_BUCKET', 'artifact-store-test')
+
+
+def make_file(directory, size):
+    path = os.path.join(directory, 'artifact.mp4')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def check_storage(storage, workdir):
+    """Upload a multi-part file, then read it back whole and by range"""
+    size = 2 * PART_SIZE + 12345
+    src = make_file(workdir, size)
+    with open(src, 'rb') as f:
+        original = f.read()
+
+    with open(src, 'rb') as f:
+        storage.put_file('ab/object.mp4', f)
+    assert storage.size('ab/object.mp4') == size
+
+    assert storage.read_range('ab/object.mp4', PART_SIZE - 10, 20) == original[PART_SIZE - 10:PART_SIZE + 10]
+    assert b''.join(storage.iter_range('ab/object.mp4', 100, 5000, chunk_size=1000)) == original[100:5000]
+
+    copy = os.path.join(workdir, 'copy.mp4')
+    assert storage.download('ab/object.mp4', copy) == size
+    with open(copy, 'rb') as f:
+        assert f.read() == original
+
+    storage.put_bytes('ab/object.json', b'{"title": "x"}')
+    assert storage.get_bytes('ab/object.json') == b'{"title": "x"}'
+    assert storage.get_bytes('ab/missing.json') is None
+    assert storage.size('ab/missing.mp4') is None
+
+    storage.delete('ab/object.mp4')
+    storage.delete('ab/object.json')
+    assert storage.size('ab/object.mp4') is None
+
+
+def test_local_disk_storage():
+    workdir = tempfile.mkdtemp()
+    try:
+        check_storage(LocalDiskStorage(os.path.join(workdir, 'store')), workdir)
+        print("✅ local disk backend")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_s3_storage():
+    if not S3_TEST_ENDPOINT_URL or boto3 is None:
+        print("⚠️  S3_TEST_ENDPOINT_URL not set or boto3 missing, skipping S3 backend")
+        return
+
+    storage = S3Storage(S3_TEST_BUCKET, f"test-{uuid.uuid4().hex[:8]}", S3_TEST_ENDPOINT_URL, 'us-east-1', PART_SIZE)
+    try:
+        storage.client.create_bucket(Bucket=S3_TEST_BUCKET)
+    except storage.client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    workdir = tempfile.mkdtemp()
+    try:
+        check_storage(storage, workdir)
+        print("✅ S3 backend")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_artifact_shared_between_nodes():
+    """An artifact published on one node is fetched and served by another"""
+    workdir = tempfile.mkdtemp()
+    try:
+        store = LocalDiskStorage(os.path.join(workdir, 'store'))
+        node_a = ArtifactCache(os.path.join(workdir, 'a'), 10 * 1024 ** 2, shared=store)
+        node_b = ArtifactCache(os.path.join(workdir, 'b'), 10 * 1024 ** 2, shared=store)
+
+        key = ArtifactCache.make_key('dQw4w9WgXcQ', 'mp3', '', '320')
+        src = make_file(workdir, 123456)
+        with open(src, 'rb') as f:
+            original = f.read()
+        node_a.publish(key, src, {'title': 'song', 'format': 'mp3'})
+
+        # Uploads run in the background; wait for the metadata to land
+        for _ in range(100):
+            if store.get_bytes(f"{key[:2]}/{key}.json"):
+                break
+            time.sleep(0.05)
+
+        assert node_b.get(key) is None
+        entry = node_b.lookup(key)
+        assert entry and entry['fetched'] and entry['title'] == 'song'
+        with open(entry['path'], 'rb') as f:
+            assert f.read() == original
+        assert node_b.get(key)['path'] == entry['path']
+        print("✅ artifact shared between nodes")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    try:
+        test_local_disk_storage()
+        test_s3_storage()
+        test_artifact_shared_between_nodes()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
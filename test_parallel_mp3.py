@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for segment-parallel MP3 encoding
+Joins synthetic segments (numbered frames behind a LAME header frame) and
+checks that the kept frames are contiguous on the global frame grid and
+that the new Xing/LAME header is valid. With ffmpeg installed it also
+compares a real parallel encode against a single encode.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+from parallel_mp3 import (
+    LEAD_FRAMES, TAIL_FRAMES, SegmentedMP3Encoder, build_info_frame, iter_frames, parse_header,
+    parse_info_frame, plan_segments, read_frames,
+)
+
+HEADER = bytes.fromhex('fffb9000')  # MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo, no CRC
+SPF = 1152
+
+
+def audio_frame(number):
+    """A 417-byte frame with empty side info and its number in the payload"""
+    frame = bytearray(parse_header(HEADER)['length'])
+    frame[0:4] = HEADER
+    frame[40:44] = number.to_bytes(4, 'big')
+    return bytes(frame)
+
+
+def frame_number(frame):
+    return int.from_bytes(frame[40:44], 'big')
+
+
+def write_segment(path, first_frame, count, padding):
+    """A segment file as ffmpeg writes it: LAME header frame, then audio frames"""
+    frames = [audio_frame(first_frame + i) for i in range(count)]
+    with open(path, 'wb') as f:
+        f.write(build_info_frame(parse_header(HEADER), [len(x) for x in frames], True, None, 0, 576, padding))
+        for frame in frames:
+            f.write(frame)
+
+
+def test_join_keeps_frame_grid():
+    workdir = tempfile.mkdtemp()
+    try:
+        starts = plan_segments(600, 44100, SPF, 4)
+        total = 600 * 44100 // SPF + 1
+        paths = []
+        for i, start in enumerate(starts):
+            lead = LEAD_FRAMES if i else 0
+            end = starts[i + 1] // SPF + TAIL_FRAMES if i + 1 < len(starts) else total
+            path = os.path.join(workdir, f'{i}.mp3')
+            write_segment(path, start // SPF - lead, end - start // SPF + lead, 1234 if i == len(starts) - 1 else 999)
+            paths.append(path)
+
+        output = os.path.join(workdir, 'joined.mp3')
+        SegmentedMP3Encoder(segments=4)._join(paths, starts, SPF, output, cbr=True)
+
+        frames, info = read_frames(output)
+        assert [frame_number(f) for f in frames] == list(range(total)), "frames not contiguous"
+        assert info['frames'] == total
+        assert (info['delay'], info['padding']) == (576, 1234), (info['delay'], info['padding'])
+        with open(output, 'rb') as f:
+            first = f.read(417)
+        assert first[36:40] == b'Info'
+        print(f"✅ {len(starts)} segments joined into {total} contiguous frames")
+
+        try:
+            from mutagen.mp3 import MP3
+        except ImportError:
+            print("⚠️  mutagen not installed, skipping header check")
+            return
+        mp3 = MP3(output)
+        expected = (total * SPF - 576 - 529 - (1234 - 529)) / 44100
+        assert abs(mp3.info.length - expected) < 0.001, (mp3.info.length, expected)
+        print("✅ Xing/LAME header read back by mutagen")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_frames_read_in_chunks():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'tagged.mp3')
+        id3 = b'ID3\x03\x00\x00' + bytes([0, 0, 0, 100]) + b'\0' * 100
+        with open(path, 'wb') as f:
+            f.write(id3 + b'junk' + b''.join(audio_frame(i) for i in range(50)) + b'TAG' + b'\0' * 125)
+
+        for chunk_size in (1000, 4096, 1 << 20):
+            with open(path, 'rb') as f:
+                numbers = [frame_number(frame) for _, frame in iter_frames(f, chunk_size)]
+            assert numbers == list(range(50)), (chunk_size, numbers[:5], len(numbers))
+        print("✅ frames streamed across chunk boundaries, ID3 tags skipped")
+    finally:
+        shutil.rmtree(workdir)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg not found")
+def test_parallel_matches_single_encode():
+    from ffmpeg_pipeline import FFmpegPipeline
+    workdir = tempfile.mkdtemp()
+    try:
+        pipeline = FFmpegPipeline()
+        source = os.path.join(workdir, 'source.m4a')
+        pipeline.run(['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100:duration=300',
+                      '-c:a', 'aac', '-b:a', '192k', source])
+        single = pipeline.encode_mp3(source, os.path.join(workdir, 'single.mp3'))
+        parallel = SegmentedMP3Encoder(pipeline, segments=4, min_duration=60).encode_parallel(
+            source, os.path.join(workdir, 'parallel.mp3'), '320', 300, 44100)
+
+        single_frames, single_info = read_frames(single)
+        parallel_frames, parallel_info = read_frames(parallel)
+        assert len(parallel_frames) == len(single_frames), (len(parallel_frames), len(single_frames))
+        assert (parallel_info['delay'], parallel_info['padding']) == (single_info['delay'], single_info['padding'])
+        durations = [pipeline.probe(path)['duration'] for path in (single, parallel)]
+        assert abs(durations[0] - durations[1]) < 0.001, durations
+        print("✅ parallel encode matches single encode length and gapless info")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    try:
+        test_join_keeps_frame_grid()
+        test_frames_read_in_chunks()
+        if shutil.which('ffmpeg'):
+            test_parallel_matches_single_encode()
+        else:
+            print("⚠️  ffmpeg not found, skipping real encode")
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for live download progress
+Feeds yt-dlp progress and postprocessor hooks into a reporter and checks
+the events written for SSE clients: stage mapping, rate limiting, the
+terminal events that close the stream, and job_id reuse
+"""
+
+import sys
+import json
+import time
+import tempfile
+
+from progress_events import ProgressStore, JobIdInUse
+
+
+def events(stream):
+    return [json.loads(message.split('data: ', 1)[1]) for message in stream if message.startswith('event:')]
+
+
+def test_hooks_map_to_stages():
+    with tempfile.TemporaryDirectory() as progress_dir:
+        store = ProgressStore(progress_dir, min_interval=0)
+        reporter = store.reporter('job-stages')
+        assert store.read('job-stages')['stage'] == 'queued'
+
+        reporter.progress_hook({'status': 'downloading', 'downloaded_bytes': 100,
+                                'total_bytes_estimate': 1000, 'speed': 50.0, 'eta': 18})
+        state = store.read('job-stages')
+        assert state['stage'] == 'downloading' and state['total_bytes'] == 1000, state
+        assert state['speed'] == 50.0 and state['eta'] == 18, state
+
+        reporter.progress_hook({'status': 'finished', 'downloaded_bytes': 1000})
+        state = store.read('job-stages')
+        assert state['downloaded_bytes'] == 1000 and state['speed'] is None and state['eta'] == 0, state
+
+        for postprocessor, stage in (('Merger', 'merging'), ('FFmpegExtractAudio', 'converting'),
+                                     ('MP4FastPath', 'converting')):
+            reporter.postprocessor_hook({'status': 'started', 'postprocessor': postprocessor})
+            assert store.read('job-stages')['stage'] == stage, postprocessor
+        reporter.postprocessor_hook({'status': 'started', 'postprocessor': 'MoveFiles'})
+        assert store.read('job-stages')['stage'] == 'converting', "postprocessors without ffmpeg keep the stage"
+    print("✅ yt-dlp hooks mapped to progress stages")
+
+
+def test_rate_limited():
+    with tempfile.TemporaryDirectory() as progress_dir:
+        store = ProgressStore(progress_dir, min_interval=60)
+        reporter = store.reporter('job-rate')
+        reporter.progress_hook({'status': 'downloading', 'downloaded_bytes': 1})
+        seq = store.read('job-rate')['seq']
+        for downloaded in range(2, 50):
+            reporter.progress_hook({'status': 'downloading', 'downloaded_bytes': downloaded})
+        state = store.read('job-rate')
+        assert state['seq'] == seq and state['downloaded_bytes'] == 1, "updates within min_interval are dropped"
+
+        reporter.postprocessor_hook({'status': 'started', 'postprocessor': 'Merger'})
+        assert store.read('job-rate')['seq'] == seq + 1, "stage changes are never rate-limited"
+    print("✅ progress updates rate-limited, stage changes always published")
+
+
+def test_terminal_events():
+    with tempfile.TemporaryDirectory() as progress_dir:
+        store = ProgressStore(progress_dir, min_interval=0.01)
+        store.reporter('job-done').finish()
+        last = events(store.stream('job-done', max_duration=5))[-1]
+        assert last['stage'] == 'finished', last
+
+        store.reporter('job-failed').finish('Video unavailable')
+        last = events(store.stream('job-failed', max_duration=5))[-1]
+        assert last['stage'] == 'error' and last['error'] == 'Video unavailable', last
+
+        store.reporter('job-hook-err').progress_hook({'status': 'error'})
+        assert store.read('job-hook-err')['stage'] == 'error'
+
+        started = time.monotonic()
+        last = events(store.stream('job-unknown', wait_timeout=0.05, max_duration=5))[-1]
+        assert last['error'] == 'Unknown job' and time.monotonic() - started < 5, last
+    print("✅ finished, error and unknown jobs end the stream")
+
+
+def test_job_id_not_reused():
+    with tempfile.TemporaryDirectory() as progress_dir:
+        store = ProgressStore(progress_dir, max_age=3600)
+        store.reporter('job-taken')
+        try:
+            store.reporter('job-taken')
+        except JobIdInUse:
+            pass
+        else:
+            raise AssertionError("a live job_id was handed to a second job")
+
+        stale = ProgressStore(progress_dir, max_age=-1)
+        stale.reporter('job-taken')  # past max_age the file is pruned and the ID is free again
+    print("✅ job_id with a live progress file refused")
+
+
+def main():
+    try:
+        test_hooks_map_to_stages()
+        test_rate_limited()
+        test_terminal_events()
+        test_job_id_not_reused()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Tests for request coalescing
+Runs concurrent requests for one key through a DownloadCoalescer, and
+through two coalescers sharing a lock directory the way gunicorn worker
+processes do, checking that one producer runs, that its result or its
+failure reaches every waiter, and that waiting for another worker is bounded
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+
+from request_coalescing import DownloadCoalescer, SharedFailure, fcntl
+
+
+class Producer:
+    """A produce() that blocks until released, then returns or raises"""
+
+    def __init__(self, store, key, error=None):
+        self.store, self.key, self.error = store, key, error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        self.store[self.key] = f'artifact for {self.key}'
+        return self.store[self.key]
+
+
+def run_in_thread(coalescer, key, produce, lookup):
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = coalescer.run(key, produce, lookup)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+def test_waiters_share_result_and_failure():
+    lock_dir = tempfile.mkdtemp()
+    try:
+        coalescer = DownloadCoalescer(lock_dir)
+        store = {}
+        for error in (None, ValueError('upstream said no')):
+            key = f'key-{bool(error)}'
+            leader = Producer(store, key, error)
+            first = run_in_thread(coalescer, key, leader, lambda: store.get(key))
+            leader.started.wait(5)
+            followers = [run_in_thread(coalescer, key, Producer(store, key), lambda: store.get(key)) for _ in range(3)]
+            time.sleep(0.1)
+            leader.release.set()
+            for thread, _ in [first] + followers:
+                thread.join(5)
+            assert leader.calls == 1
+            for _, outcome in followers:
+                if error:
+                    assert outcome['error'] is error, outcome
+                else:
+                    assert outcome['result'] == (store[key], True), outcome
+        assert coalescer.stats.snapshot()['coalesced_waits'] == 6
+        print("✅ threads in one worker share the leader's result or error")
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+def test_leader_failure_across_workers():
+    if fcntl is None:
+        print("⚠️  fcntl not available, skipping cross-worker coalescing")
+        return
+    lock_dir = tempfile.mkdtemp()
+    try:
+        workers = [DownloadCoalescer(lock_dir, errors=(ValueError,)), DownloadCoalescer(lock_dir, errors=(ValueError,))]
+        store = {}
+        leader = Producer(store, 'key', ValueError('upstream said no'))
+        follower = Producer(store, 'key')
+        first = run_in_thread(workers[0], 'key', leader, lambda: store.get('key'))
+        leader.started.wait(5)
+        second = run_in_thread(workers[1], 'key', follower, lambda: store.get('key'))
+        time.sleep(0.2)  # let the second worker block on the key's lock
+        leader.release.set()
+        for thread, _ in (first, second):
+            thread.join(5)
+
+        assert isinstance(second[1]['error'], ValueError) and str(second[1]['error']) == 'upstream said no', second[1]
+        assert follower.calls == 0, "the waiting worker produced again"
+        assert workers[1].stats.snapshot()['shared_failures'] == 1
+
+        # A request arriving after the failure tries again
+        retry = Producer(store, 'key')
+        retry.release.set()
+        assert workers[1].run('key', retry, lambda: store.get('key')) == (store['key'], False)
+        assert retry.calls == 1
+        print("✅ a leader's failure reaches waiters in other workers, later requests retry")
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+def test_result_across_workers():
+    if fcntl is None:
+        print("⚠️  fcntl not available, skipping cross-worker coalescing")
+        return
+    lock_dir = tempfile.mkdtemp()
+    try:
+        workers = [DownloadCoalescer(lock_dir), DownloadCoalescer(lock_dir)]
+        store = {}
+        leader, follower = Producer(store, 'key'), Producer(store, 'key')
+        first = run_in_thread(workers[0], 'key', leader, lambda: store.get('key'))
+        leader.started.wait(5)
+        second = run_in_thread(workers[1], 'key', follower, lambda: store.get('key'))
+        time.sleep(0.2)
+        leader.release.set()
+        for thread, _ in (first, second):
+            thread.join(5)
+        assert first[1]['result'] == (store['key'], False)
+        assert second[1]['result'] == (store['key'], True) and follower.calls == 0
+        assert workers[1].stats.snapshot()['coalesced_waits'] == 1
+        print("✅ a waiting worker is handed the published result")
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+class ClientError(Exception):
+    def __init__(self, error, details, status=500):
+        super().__init__(error)
+        self.error, self.details, self.status = error, details, status
+
+
+def fail_across_workers(lock_dir, error, errors=()):
+    """Fail a leader in one worker while another waits on its lock; the waiter's outcome"""
+    workers = [DownloadCoalescer(lock_dir), DownloadCoalescer(lock_dir, errors=errors)]
+    store = {}
+    leader = Producer(store, 'key', error)
+    first = run_in_thread(workers[0], 'key', leader, lambda: store.get('key'))
+    leader.started.wait(5)
+    second = run_in_thread(workers[1], 'key', Producer(store, 'key'), lambda: store.get('key'))
+    time.sleep(0.2)
+    leader.release.set()
+    for thread, _ in (first, second):
+        thread.join(5)
+    return second[1]
+
+
+def test_failure_record_is_json():
+    if fcntl is None:
+        print("⚠️  fcntl not available, skipping cross-worker coalescing")
+        return
+    lock_dir = tempfile.mkdtemp()
+    try:
+        outcome = fail_across_workers(lock_dir, ClientError('Unable to extract video information', 'private', 400),
+                                      errors=(ClientError,))
+        error = outcome['error']
+        assert type(error) is ClientError and str(error) == 'Unable to extract video information', outcome
+        assert (error.error, error.details, error.status) == ('Unable to extract video information', 'private', 400)
+        with open(os.path.join(lock_dir, 'key.failed')) as f:
+            record = json.load(f)
+        assert record['type'] == 'ClientError' and record['attributes']['status'] == 400, record
+
+        # Types the waiter wasn't told about arrive as SharedFailure, not as arbitrary objects
+        error = fail_across_workers(lock_dir, ClientError('upstream said no', 'throttled'))['error']
+        assert isinstance(error, SharedFailure) and error.error_type == 'ClientError', error
+        assert error.message == 'upstream said no'
+        print("✅ failures shared across workers as JSON, rebuilt only for known types")
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+def test_lock_wait_bounded():
+    if fcntl is None:
+        print("⚠️  fcntl not available, skipping cross-worker coalescing")
+        return
+    lock_dir = tempfile.mkdtemp()
+    try:
+        store = {}
+        hung = Producer(store, 'key')
+        first = run_in_thread(DownloadCoalescer(lock_dir), 'key', hung, lambda: store.get('key'))
+        hung.started.wait(5)
+        waiter = DownloadCoalescer(lock_dir, wait_timeout=0.3, poll_interval=0.05)
+        started = time.monotonic()
+        try:
+            waiter.run('key', Producer(store, 'key'), lambda: store.get('key'))
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("waited on a hung producer without a deadline")
+        assert time.monotonic() - started < 2
+        hung.release.set()
+        first[0].join(5)
+        print("✅ waiting for another worker's lock gives up at wait_timeout")
+    finally:
+        shutil.rmtree(lock_dir)
+
+
+def main():
+    try:
+        test_waiters_share_result_and_failure()
+        test_leader_failure_across_workers()
+        test_result_across_workers()
+        test_failure_record_is_json()
+        test_lock_wait_bounded()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the ffmpeg thread budget and executor slots of yt-dlp's postprocessors
+Builds yt-dlp postprocessors from the downloader's options and checks the
+-threads/-filter_threads arguments are what they add to their ffmpeg runs,
+and that every ffmpeg run holds a slot of the right lane
+"""
+
+import sys
+from contextlib import contextmanager
+
+import yt_dlp
+from yt_dlp.postprocessor import (
+    FFmpegExtractAudioPP, FFmpegMergerPP, FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP,
+)
+
+from advanced_downloader import AdvancedYouTubeDownloader, MP4FastPathPP
+
+# The keys FFmpegPostProcessor.real_run_ffmpeg looks up for the first output file
+OUTPUT_KEYS = ['_o1', '_o', '']
+
+
+def output_args(options, pp_class, *pp_args):
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return pp_class(ydl, *pp_args)._configuration_args('ffmpeg', OUTPUT_KEYS)
+
+
+def test_budget_reaches_postprocessors():
+    downloader = AdvancedYouTubeDownloader(thread_budget=lambda: 3, ffmpeg_capabilities={'flags': {'filter_threads': True}})
+    options = downloader.get_base_options()
+    expected = ['-threads', '3', '-filter_threads', '3']
+    assert output_args(options, FFmpegExtractAudioPP, 'mp3') == expected
+    assert output_args(options, FFmpegMergerPP) == expected
+    assert output_args(options, FFmpegVideoConvertorPP, 'mp4') == expected
+    assert output_args(options, FFmpegVideoRemuxerPP, 'mp4') == expected
+
+    no_filter_threads = AdvancedYouTubeDownloader(thread_budget=lambda: 3, ffmpeg_capabilities={'flags': {'filter_threads': False}})
+    assert output_args(no_filter_threads.get_base_options(), FFmpegExtractAudioPP, 'mp3') == ['-threads', '3']
+    assert output_args(AdvancedYouTubeDownloader().get_base_options(), FFmpegExtractAudioPP, 'mp3') == []
+    print("✅ thread budget reaches the ffmpeg runs of yt-dlp's postprocessors")
+
+
+class RecordingExecutor:
+    """Stands in for TranscodeExecutor, recording the slots taken and whether one is held"""
+
+    def __init__(self):
+        self.slots = []
+        self.held = None
+
+    @contextmanager
+    def slot(self, lane='heavy', duration=None, cost=None):
+        self.slots.append((lane, duration))
+        self.held = lane
+        try:
+            yield None
+        finally:
+            self.held = None
+
+
+def fake_run(executor, runs):
+    def run(pp, info):
+        runs.append((pp.pp_key(), executor.held))
+        return [], info
+    return run
+
+
+def test_postprocessors_hold_slots():
+    executor = RecordingExecutor()
+    downloader = AdvancedYouTubeDownloader(executor=executor)
+    runs = []
+    patched = (FFmpegExtractAudioPP, FFmpegMergerPP, FFmpegVideoConvertorPP, FFmpegVideoRemuxerPP)
+    originals = {cls: cls.run for cls in patched}
+    for cls in patched:
+        cls.run = fake_run(executor, runs)
+    try:
+        with downloader.create_ydl(downloader.get_base_options(), 'mp4', download=True) as ydl:
+            ydl.run_pp(FFmpegExtractAudioPP(ydl, 'mp3'), {'duration': 200})
+            ydl.run_pp(FFmpegExtractAudioPP(ydl, 'm4a'), {'duration': 200})
+            ydl.run_pp(FFmpegMergerPP(ydl), {'duration': 60})
+            # The fast path picks its own lane: remux for H.264/AAC, re-encode for VP8/Vorbis
+            fast_path = MP4FastPathPP(ydl)
+            ydl.run_pp(fast_path, {'ext': 'mkv', 'vcodec': 'avc1.64001F', 'acodec': 'mp4a.40.2', 'duration': 60})
+            ydl.run_pp(fast_path, {'ext': 'webm', 'vcodec': 'vp8', 'acodec': 'vorbis', 'duration': 60, 'height': 1080})
+            ydl.run_pp(fast_path, {'ext': 'mp4', 'duration': 60})
+    finally:
+        for cls, run in originals.items():
+            cls.run = run
+
+    assert runs == [
+        ('ExtractAudio', 'heavy'),
+        ('ExtractAudio', 'light'),
+        ('Merger', 'light'),
+        ('VideoRemuxer', 'light'),
+        ('VideoConvertor', 'heavy'),
+    ], runs
+    assert executor.slots == [('heavy', 200), ('light', 200), ('light', 60), ('light', 60), ('heavy', 60)], executor.slots
+    print("✅ every ffmpeg run of yt-dlp's postprocessors holds an executor slot")
+
+
+def main():
+    try:
+        test_budget_reaches_postprocessors()
+        test_postprocessors_hold_slots()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
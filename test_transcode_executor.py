@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Tests for the transcode executor
+Checks the per-lane slot limit across forked processes (as under gunicorn),
+that light jobs don't queue behind heavy ones, arrival order among equal
+jobs, shortest-job-first with aging, wait percentiles and the queue limit
+"""
+
+import os
+import sys
+import time
+import threading
+import multiprocessing
+
+from transcode_executor import TranscodeExecutor, TranscodeQueueFull, transcode_cost
+
+
+def test_slots_shared_across_processes():
+    """Two processes with one heavy slot never run at the same time"""
+    executor = TranscodeExecutor(heavy_slots=1, light_slots=1)
+    spans = multiprocessing.Array('d', 4)
+
+    def job(i):
+        with executor.slot('heavy'):
+            spans[2 * i] = time.monotonic()
+            time.sleep(0.3)
+            spans[2 * i + 1] = time.monotonic()
+
+    # Forked like gunicorn workers, inheriting the executor
+    fork = multiprocessing.get_context('fork')
+    workers = [fork.Process(target=job, args=(i,)) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    (a_start, a_end), (b_start, b_end) = sorted([(spans[0], spans[1]), (spans[2], spans[3])])
+    assert a_end <= b_start, "heavy jobs overlapped"
+    report = executor.report()['heavy']
+    assert report['jobs'] == 2 and report['running'] == 0 and report['queued'] == 0
+    assert report['wait_seconds'] >= 0.25
+    print("✅ slots shared across processes")
+
+
+def test_light_not_blocked_by_heavy():
+    executor = TranscodeExecutor(heavy_slots=1, light_slots=1)
+    busy = threading.Event()
+    done = threading.Event()
+
+    def heavy():
+        with executor.slot('heavy'):
+            busy.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=heavy)
+    thread.start()
+    busy.wait(5)
+    started = time.monotonic()
+    with executor.slot('light'):
+        waited = time.monotonic() - started
+    done.set()
+    thread.join()
+    assert waited < 0.5, f"light job waited {waited:.2f}s behind a heavy one"
+    print("✅ light lane independent of heavy lane")
+
+
+def test_arrival_order():
+    executor = TranscodeExecutor(heavy_slots=1)
+    order = []
+    release = threading.Event()
+
+    def holder():
+        with executor.slot('heavy'):
+            release.wait(5)
+
+    def job(i):
+        with executor.slot('heavy'):
+            order.append(i)
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    time.sleep(0.1)
+    for i in range(5):
+        thread = threading.Thread(target=job, args=(i,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+    assert executor.report()['heavy']['queued'] == 5
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert order == list(range(5)), order
+    print("✅ equal jobs run in arrival order")
+
+
+def run_queued(executor, jobs):
+    """Queue ``jobs`` (name, duration, delay before queueing) behind a busy slot; returns run order"""
+    order = []
+    release = threading.Event()
+
+    def holder():
+        with executor.slot('heavy'):
+            release.wait(5)
+
+    def job(name, duration):
+        with executor.slot('heavy', duration):
+            order.append(name)
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    time.sleep(0.1)
+    for name, duration, delay in jobs:
+        time.sleep(delay)
+        thread = threading.Thread(target=job, args=(name, duration))
+        thread.start()
+        threads.append(thread)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_shortest_job_first():
+    # A 2-hour encode queued first, then three songs
+    executor = TranscodeExecutor(heavy_slots=1, sjf_weight=0.05)
+    order = run_queued(executor, [('movie', 7200, 0), ('song1', 180, 0.02), ('song2', 200, 0.02), ('song3', 240, 0.02)])
+    assert order == ['song1', 'song2', 'song3', 'movie'], order
+    assert transcode_cost(7200) > transcode_cost(180, kbps=128)
+    assert transcode_cost(60, height=1080) > transcode_cost(60, height=360)
+    print("✅ cheap jobs overtake an expensive one")
+
+
+def test_aging():
+    # The long job's handicap is 0.1 s: songs queued later than that wait behind it
+    executor = TranscodeExecutor(heavy_slots=1, sjf_weight=0.1 / 7200)
+    order = run_queued(executor, [('movie', 7200, 0), ('early song', 180, 0.02), ('late song', 180, 0.2)])
+    assert order == ['early song', 'movie', 'late song'], order
+
+    # The handicap never exceeds half the timeout
+    executor = TranscodeExecutor(heavy_slots=1, timeout=0.4, sjf_weight=1)
+    order = run_queued(executor, [('movie', 7200, 0), ('late song', 1, 0.3)])
+    assert order == ['movie', 'late song'], order
+    print("✅ long jobs age to the front")
+
+
+def test_wait_percentiles():
+    executor = TranscodeExecutor(heavy_slots=1)
+    run_queued(executor, [('song', 180, 0), ('movie', 7200, 0), ('clip', None, 0)])
+    by_size = executor.report()['heavy']['wait_by_size']
+    assert set(by_size) == {'short', 'long', 'unknown'}, by_size
+    assert by_size['long']['jobs'] == 1
+    assert by_size['long']['p95_wait_seconds'] >= by_size['long']['p50_wait_seconds'] > 0
+    print("✅ p50/p95 wait per size class")
+
+
+def test_queue_limit_and_timeout():
+    executor = TranscodeExecutor(heavy_slots=1, queue_limit=1, timeout=0.5)
+    release = threading.Event()
+    outcome = []
+
+    def holder():
+        with executor.slot('heavy'):
+            release.wait(5)
+
+    def waiter():
+        try:
+            with executor.slot('heavy'):
+                outcome.append('ran')
+        except TranscodeQueueFull:
+            outcome.append('timed out')
+
+    threading.Thread(target=holder).start()
+    time.sleep(0.1)
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    try:
+        with executor.slot('heavy'):
+            raise AssertionError("got past a full queue")
+    except TranscodeQueueFull:
+        assert time.monotonic() - started < 0.2, "full queue should reject at once"
+
+    thread.join()
+    release.set()
+    assert outcome == ['timed out'], outcome
+    assert executor.report()['heavy']['rejected'] == 2
+    print("✅ queue limit and timeout")
+
+
+def main():
+    try:
+        test_slots_shared_across_processes()
+        test_light_not_blocked_by_heavy()
+        test_arrival_order()
+        test_shortest_job_first()
+        test_aging()
+        test_wait_percentiles()
+        test_queue_limit_and_timeout()
+        return 0
+    except AssertionError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Bounded ffmpeg slots shared by every worker process
+Transcodes run in a fixed number of slots sized by CPU count, no matter
+how many HTTP workers and threads are busy. Jobs queue per lane, 'heavy'
+for CPU-bound encodes and 'light' for stream copies and merges, so a cheap
+request never waits behind a long encode. Within a lane the cheapest job
+goes first, with aging so long jobs still get their turn. Heavy jobs
+also get an ffmpeg thread budget instead of ffmpeg's default of one thread
+per core each. State lives in shared memory created before gunicorn forks
+(``preload_app = True``)
+"""
+
+import os
+import math
+import time
+import multiprocessing
+from contextlib import contextmanager
+
+from cache_stats import CacheStats
+
+LANE_STATS = ('jobs', 'failed', 'rejected', 'wait_seconds', 'run_seconds', 'threads')
+
+# Jobs shorter than this (seconds of media) get at most SHORT_JOB_THREADS
+SHORT_JOB_SECONDS = 600
+SHORT_JOB_THREADS = 2
+
+# Cost units are media seconds of a 320 kbps MP3 encode. A 720p video encode
+# takes roughly VIDEO_COST times the CPU per second, scaling with pixel count
+REFERENCE_KBPS = 320
+VIDEO_COST = 10
+UNKNOWN_COST = SHORT_JOB_SECONDS
+
+# Wait times are reported per size class (seconds of media), over the last
+# WAIT_SAMPLES jobs of each class
+SIZE_CLASSES = (('short', SHORT_JOB_SECONDS), ('medium', 3600), ('long', float('inf')))
+WAIT_SAMPLES = 512
+
+
+class TranscodeQueueFull(Exception):
+    """The lane's queue is full or no slot came free within the timeout"""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def transcode_cost(duration, kbps=None, height=None):
+    """Estimated CPU cost of a job: ``duration`` seconds of media at ``kbps`` (audio) or ``height`` (video)"""
+    if not duration:
+        return UNKNOWN_COST
+    if height:
+        return duration * VIDEO_COST * (height / 720) ** 2
+    return duration * (kbps or REFERENCE_KBPS) / REFERENCE_KBPS
+
+
+def size_class(duration):
+    if not duration:
+        return 'unknown'
+    return next(name for name, limit in SIZE_CLASSES if duration < limit)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class _Lane:
+    """Slots and waiting jobs of one lane, as pids and queue positions in shared arrays"""
+
+    classes = [name for name, _ in SIZE_CLASSES] + ['unknown']
+
+    def __init__(self, name, slots, queue_limit):
+        self.name = name
+        self.holders = multiprocessing.Array('i', max(1, slots), lock=False)  # pid per busy slot, 0 = free
+        self.waiting = multiprocessing.Array('d', max(1, queue_limit), lock=False)  # queue position, 0 = empty
+        self.arrivals = multiprocessing.Array('d', max(1, queue_limit), lock=False)
+        self.waiting_pids = multiprocessing.Array('i', max(1, queue_limit), lock=False)
+        # Ring buffer of recent waits per size class, and jobs recorded per class
+        self.waits = multiprocessing.Array('d', WAIT_SAMPLES * len(self.classes), lock=False)
+        self.waits_recorded = multiprocessing.Array('i', len(self.classes), lock=False)
+        self.stats = CacheStats(LANE_STATS)
+
+    def record_wait(self, duration, seconds):
+        index = self.classes.index(size_class(duration))
+        self.waits[index * WAIT_SAMPLES + self.waits_recorded[index] % WAIT_SAMPLES] = seconds
+        self.waits_recorded[index] += 1
+
+    def wait_percentiles(self):
+        report = {}
+        for index, name in enumerate(self.classes):
+            recorded = self.waits_recorded[index]
+            if not recorded:
+                continue
+            samples = self.waits[index * WAIT_SAMPLES:index * WAIT_SAMPLES + min(recorded, WAIT_SAMPLES)]
+            report[name] = {
+                'jobs': recorded,
+                'p50_wait_seconds': round(percentile(samples, 0.5), 3),
+                'p95_wait_seconds': round(percentile(samples, 0.95), 3),
+            }
+        return report
+
+    def reclaim(self):
+        """Free slots and queue cells left behind by killed workers"""
+        for i, pid in enumerate(self.holders):
+            if pid and not _alive(pid):
+                self.holders[i] = 0
+        for i, pid in enumerate(self.waiting_pids):
+            if pid and not _alive(pid):
+                self.waiting[i] = 0
+                self.arrivals[i] = 0
+                self.waiting_pids[i] = 0
+
+    def first_waiting(self):
+        cells = [i for i, position in enumerate(self.waiting) if position]
+        return min(cells, key=lambda i: self.waiting[i]) if cells else None
+
+
+class TranscodeExecutor:
+    """Per-lane concurrency limit and shortest-job-first queue for local ffmpeg runs
+
+    ``heavy_slots`` defaults to the CPU count and ``light_slots`` to the
+    same with a floor of 2. Each lane holds at most ``queue_limit`` waiting
+    jobs, and a job gives up after waiting ``timeout`` seconds; both raise
+    TranscodeQueueFull.
+
+    A job of estimated cost C (see transcode_cost) queues as if it arrived
+    ``sjf_weight`` × C seconds later than it did, so cheap jobs overtake
+    expensive ones while every waiting job ages towards the front. The
+    handicap is capped at half the timeout, so a long job always reaches the
+    front before it would give up. ``sjf_weight=0`` is plain FIFO.
+    """
+
+    def __init__(self, heavy_slots=0, light_slots=0, queue_limit=64, timeout=600, sjf_weight=0.05):
+        cpus = self.cpus = os.cpu_count() or 1
+        self.timeout = timeout
+        self.sjf_weight = sjf_weight
+        self._cond = multiprocessing.Condition()
+        self.lanes = {
+            'heavy': _Lane('heavy', heavy_slots or cpus, queue_limit),
+            'light': _Lane('light', light_slots or max(2, cpus), queue_limit),
+        }
+
+    @contextmanager
+    def slot(self, lane='heavy', duration=None, cost=None):
+        """Hold one slot of ``lane`` for the duration of the block
+
+        Yields the ffmpeg thread budget for heavy jobs (see thread_budget;
+        ``duration`` is the media length in seconds, if known) and None for
+        light ones, which only copy streams. ``cost`` orders the queue and
+        defaults to transcode_cost(duration).
+        """
+        lane = self.lanes[lane]
+        index = self._acquire(lane, duration, transcode_cost(duration) if cost is None else cost)
+        threads = self._threads(self._running('heavy'), duration) if lane.name == 'heavy' else None
+        lane.stats.incr('threads', threads or 0)
+        started = time.monotonic()
+        try:
+            yield threads
+        except Exception:
+            lane.stats.incr('failed')
+            raise
+        finally:
+            lane.stats.incr('run_seconds', time.monotonic() - started)
+            with self._cond:
+                lane.holders[index] = 0
+                self._cond.notify_all()
+
+    def _acquire(self, lane, duration, cost):
+        arrived = time.monotonic()
+        deadline = arrived + self.timeout
+        pid = os.getpid()
+        with self._cond:
+            lane.reclaim()
+            cell = next((i for i, t in enumerate(lane.waiting) if not t), None)
+            if cell is None:
+                lane.stats.incr('rejected')
+                raise TranscodeQueueFull(f"{lane.name} transcode queue is full ({len(lane.waiting)} waiting)")
+            lane.waiting[cell] = arrived + min(self.sjf_weight * cost, self.timeout / 2)
+            lane.arrivals[cell] = arrived
+            lane.waiting_pids[cell] = pid
+
+            try:
+                while True:
+                    free = next((i for i, holder in enumerate(lane.holders) if not holder), None)
+                    if free is not None and lane.first_waiting() == cell:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        lane.stats.incr('rejected')
+                        raise TranscodeQueueFull(f"No {lane.name} transcode slot within {self.timeout}s")
+                    # Wake up now and then to reclaim slots of killed workers
+                    self._cond.wait(min(remaining, 1.0))
+                    lane.reclaim()
+                lane.holders[free] = pid
+            finally:
+                lane.waiting[cell] = 0
+                lane.arrivals[cell] = 0
+                lane.waiting_pids[cell] = 0
+                self._cond.notify_all()
+            waited = time.monotonic() - arrived
+            lane.record_wait(duration, waited)
+
+        lane.stats.incr('jobs')
+        lane.stats.incr('wait_seconds', waited)
+        return free
+
+    def _running(self, lane):
+        with self._cond:
+            return sum(1 for holder in self.lanes[lane].holders if holder)
+
+    def _threads(self, jobs, duration=None):
+        """The CPUs split evenly between ``jobs`` concurrent jobs, or fewer when the box is already loaded"""
+        try:
+            load = int(os.getloadavg()[0])
+        except (AttributeError, OSError):  # not available on Windows
+            load = 0
+        threads = max(1, self.cpus // max(1, jobs, load))
+        if duration is not None and duration < SHORT_JOB_SECONDS:
+            # Splitting a short job further buys little and takes cores from its neighbours
+            threads = min(threads, SHORT_JOB_THREADS)
+        return threads
+
+    def thread_budget(self, duration=None):
+        """ffmpeg threads for a heavy job about to start outside the executor (yt-dlp postprocessors)"""
+        return self._threads(self._running('heavy') + 1, duration)
+
+    def report(self):
+        """Slots, current queue depth, cumulative wait/run times and p50/p95 wait per size class, per lane"""
+        report = {}
+        with self._cond:
+            for name, lane in self.lanes.items():
+                now = time.monotonic()
+                waits = [now - arrived for arrived in lane.arrivals if arrived]
+                data = lane.stats.snapshot()
+                data.update({
+                    'slots': len(lane.holders),
+                    'running': sum(1 for holder in lane.holders if holder),
+                    'queued': len(waits),
+                    'oldest_wait_seconds': round(max(waits), 1) if waits else 0,
+                    'avg_wait_seconds': round(data['wait_seconds'] / data['jobs'], 3) if data['jobs'] else 0,
+                    'avg_threads': round(data.pop('threads') / data['jobs'], 1) if data['jobs'] else 0,
+                    'wait_by_size': lane.wait_percentiles(),
+                })
+                report[name] = data
+        return report
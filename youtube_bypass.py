@@ -11,6 +11,8 @@ import requests
 from urllib.parse import urlparse, parse_qs
 import yt_dlp
 
+from advanced_downloader import MP4FastPathPP
+
 class YouTubeBypasser:
     """Enhanced YouTube downloader with bot detection bypass"""
     
@@ -204,13 +206,15 @@ class YouTubeBypasser:
         
         try:
             with yt_dlp.YoutubeDL(opts) as ydl:
+                if format_type == 'mp4':
+                    ydl.add_post_processor(MP4FastPathPP(), when='post_process')
                 info = ydl.extract_info(url, download=True)
                 if info:
                     title = info.get('title', 'download')
-                    # Find downloaded file
-                    for file in os.listdir(output_path):
-                        if file.endswith(f'.{format_type}'):
-                            return os.path.join(output_path, file), title
+                    # yt-dlp reports the final (post-processed) path
+                    file_path = (info.get('requested_downloads') or [{}])[-1].get('filepath')
+                    if file_path and file_path.endswith(f'.{format_type}') and os.path.exists(file_path):
+                        return file_path, title
                 return None, None
         except Exception as e:
             print(f"Download error: {e}")